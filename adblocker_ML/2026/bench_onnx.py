@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from onnx_predictor import OnnxPredictor
+from features import add_derived_dom_features
+
+
+# --- 1. NẠP CÁC HÀNG THẬT CỦA dataset_hybrid_2026_advanced.csv THEO ĐÚNG THỨ TỰ CỘT CỦA MODEL ---
+def load_rows(csv_path, features):
+    df = pd.read_csv(csv_path)
+    add_derived_dom_features(df)
+    return df.reindex(columns=features, fill_value=0).to_numpy(dtype=np.float32)
+
+
+def bench_single(predict_proba, X, n):
+    # Mô phỏng server: mỗi request 1 hàng
+    samples = []
+    for i in range(n):
+        row = X[i % len(X)][None, :]
+        t0 = time.perf_counter()
+        predict_proba(row)
+        samples.append(time.perf_counter() - t0)
+    samples = np.array(samples) * 1e3
+    return np.percentile(samples, 50), np.percentile(samples, 99), n / (samples.sum() / 1e3)
+
+
+def bench_batch(predict_proba, X, batch_size):
+    t0 = time.perf_counter()
+    for start in range(0, len(X), batch_size):
+        predict_proba(X[start:start + batch_size])
+    return len(X) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh sklearn và onnxruntime: rows/sec và p99 latency")
+    parser.add_argument("--model", default="model_graph_optimized.joblib")
+    parser.add_argument("--onnx", default="model_graph_optimized.onnx")
+    parser.add_argument("--csv", default="dataset_hybrid_2026_advanced.csv")
+    parser.add_argument("--single", type=int, default=300, help="Số request 1 hàng để đo latency")
+    parser.add_argument("--batch", type=int, default=1024)
+    args = parser.parse_args()
+
+    bundle = joblib.load(args.model)
+    sk_model = bundle['model']
+    sk_model.n_jobs = 1  # so sánh công bằng với onnxruntime 1 luồng
+    onnx_model = OnnxPredictor(args.onnx)
+    X = load_rows(args.csv, bundle['features'])
+
+    diff = np.abs(sk_model.predict_proba(X) - onnx_model.predict_proba(X)).max()
+    print(f"-> {len(X)} hàng | max |Δproba| sklearn vs onnx = {diff:.2e} (ONNX tính xác suất bằng float32)")
+
+    print(f"{'Backend':<14}{'p50 1 hàng (ms)':>18}{'p99 1 hàng (ms)':>18}{'req/s 1 hàng':>15}{'rows/s batch':>15}")
+    for name, fn in [("sklearn", sk_model.predict_proba), ("onnxruntime", onnx_model.predict_proba)]:
+        p50, p99, rps = bench_single(fn, X, args.single)
+        throughput = bench_batch(fn, X, args.batch)
+        print(f"{name:<14}{p50:>18.3f}{p99:>18.3f}{rps:>15.0f}{throughput:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
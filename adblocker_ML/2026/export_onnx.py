@@ -0,0 +1,43 @@
+import argparse
+import json
+import os
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+# Tên input/output khớp với adsblocker_ext/offscreen.js: session.run({input: ...}) rồi đọc output.label
+INPUT_NAME = "input"
+
+
+def export_bundle(joblib_path, onnx_path):
+    # Bundle do trainer3.py / trainer_drop_2cols.py ghi ra: {'model': RandomForest, 'features': [...]}
+    bundle = joblib.load(joblib_path)
+    model = bundle['model']
+    features = bundle['features']
+
+    onx = convert_sklearn(
+        model,
+        initial_types=[(INPUT_NAME, FloatTensorType([None, len(features)]))],
+        options={id(model): {'zipmap': False}},  # 'probabilities' là tensor (n, 2) thay vì list các dict
+    )
+    onx.doc_string = f"Xuất từ {os.path.basename(joblib_path)}"
+    # Lưu thứ tự cột vào metadata để phía đọc (Python/JS) xếp đặc trưng đúng thứ tự lúc train
+    meta = onx.metadata_props.add()
+    meta.key = "features"
+    meta.value = json.dumps(features)
+    if bundle.get('feature_schema'):
+        meta = onx.metadata_props.add()
+        meta.key = "feature_schema"
+        meta.value = bundle['feature_schema']
+
+    with open(onnx_path, "wb") as f:
+        f.write(onx.SerializeToString())
+    print(f"✅ Đã xuất {onnx_path} ({os.path.getsize(onnx_path) / 1e6:.1f} MB) | input '{INPUT_NAME}' = {features}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chuyển bundle joblib (model + features) sang ONNX")
+    parser.add_argument("model", nargs="?", default="model_graph_optimized.joblib")
+    parser.add_argument("out", nargs="?")
+    args = parser.parse_args()
+    export_bundle(args.model, args.out or os.path.splitext(args.model)[0] + ".onnx")
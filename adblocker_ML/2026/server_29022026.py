@@ -1,7 +1,16 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import joblib
-import pandas as pd
+import os
+import sys
+
+# Dùng chung các module ở thư mục adblocker_ML (cache, vectorizer, flat forest, ...)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from verdict_cache import VerdictCache
+from model_registry import ModelRegistry
+from batcher import MicroBatcher
+from metrics import (CACHE_HITS, CONTENT_TYPE, ERRORS, REGISTRY, REQUEST_SECONDS, REQUESTS, VERDICTS, SampledLogger,
+                     stage)
+from features import SCHEMA_DOM, add_derived_dom_features
 
 app = FastAPI()
 
@@ -14,41 +23,116 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model bạn đã train (Mô hình 3 tối ưu)
-data = joblib.load('model_graph_optimized.joblib')
-model = data['model']
-features = data['features']
+verdict_cache = VerdictCache()
+
+# Load model bạn đã train (Mô hình 3 tối ưu); có model_graph_optimized.npz thì nạp bản phẳng, khỏi cần sklearn.
+# MODEL_BACKEND=onnx -> chạy bản ONNX (xuất bằng export_onnx.py) qua onnxruntime
+# Bundle phải khớp bộ đặc trưng DOM mà extension gửi lên, không thì dừng luôn thay vì điền 0 cho cột thiếu.
+# Ghi đè file model (hoặc POST /admin/reload) -> nạp model mới ở luồng nền, không cần restart server
+# Có model_graph_optimized.fast.joblib (python ../fast_tier.py ... --schema dom-graph/1) -> chấm cascade quanh ngưỡng 0.6
+if os.environ.get("MODEL_BACKEND", "sklearn").lower() == "onnx":
+    from onnx_predictor import load_onnx_bundle
+    registry = ModelRegistry('model_graph_optimized.onnx', SCHEMA_DOM, loader=load_onnx_bundle,
+                             watch_paths=['model_graph_optimized.onnx'])
+else:
+    registry = ModelRegistry('model_graph_optimized.joblib', SCHEMA_DOM)
+# Khóa cache có version model -> verdict của model cũ không bao giờ bị trả lại; clear chỉ để giải phóng chỗ
+registry.on_swap(verdict_cache.clear)
+registry.reload()
+registry.start_watcher()
+
+# Không đặt ADMIN_TOKEN thì tắt hẳn /admin/reload (CORS mở cho mọi origin); watcher vẫn tự nạp khi file đổi
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Extension gửi 1 request cho mỗi phần tử -> gom lại vài ms rồi chạy model 1 lần (BATCH_DELAY_MS, BATCH_MAX)
+batcher = MicroBatcher()
+
+# print() đồng bộ ra stdout ở mỗi request tốn thời gian -> chỉ ghi LOG_SAMPLE phần request, qua luồng nền
+log = SampledLogger("predict")
 
 
 @app.post("/predict")
 async def predict(request: Request):
-    # Dùng await request.json() để parse body trực tiếp, tránh lỗi 422 của FastAPI
-    req = await request.json()
+    REQUESTS.inc(endpoint="/predict")
+    with REQUEST_SECONDS.time(endpoint="/predict"):
+        try:
+            # Dùng await request.json() để parse body trực tiếp, tránh lỗi 422 của FastAPI
+            req = await request.json()
+
+            # Log lấy mẫu để xác nhận Server ĐÃ NHẬN ĐƯỢC DATA từ Extension
+            log.info("[+] Đã nhận request từ Extension: %s", req)
+
+            # Tính toán 2 đặc trưng mới ngay tại Server (Chuẩn xác!)
+            with stage("derive"):
+                add_derived_dom_features(req)
+
+            # Ảnh chụp model 1 lần: khóa cache và kết quả cùng 1 version dù model đổi giữa chừng
+            active = registry.active
+            if active is None:
+                raise RuntimeError("Model chưa được nạp")
+
+            # Bộ đặc trưng DOM giống hệt nhau -> kết quả giống hệt nhau, không cần chạy lại model
+            key = (active.version,) + tuple(req.get(col, 0) for col in active.features)
+            cached = verdict_cache.get(key)
+            if cached is not None:
+                CACHE_HITS.inc(endpoint="/predict")
+                return cached
+
+            # Điền vào mảng NumPy theo thứ tự cột lúc Train (không dựng DataFrame), gom batch với request khác
+            # Trả về xác suất của nhãn 1
+            with stage("inference"):
+                prob = await batcher.submit(req, active)
+
+            # Áp dụng ngưỡng (Threshold) để giảm tỷ lệ chặn nhầm (False Positive)
+            is_ad = 1 if prob >= 0.6 else 0
+            VERDICTS.inc(endpoint="/predict", verdict="ad" if is_ad else "clean")
+
+            log.info("==> Kết quả: %s (Xác suất: %.2f%%)", 'QUẢNG CÁO' if is_ad else 'SẠCH', prob * 100)
+
+            verdict = {"is_ad": bool(is_ad), "probability": float(prob)}
+            verdict_cache.put(key, verdict)
+            return verdict
+        except Exception as e:
+            # JSON hỏng, thiếu cột, chưa có model... -> đếm lỗi như server.py thay vì 500 không ai thấy
+            ERRORS.inc(endpoint="/predict")
+            return {"is_ad": False, "error": str(e)}
+
+
+@app.get("/model")
+async def model_info():
+    return registry.info()
+
 
-    # In ra Terminal để xác nhận Server ĐÃ NHẬN ĐƯỢC DATA từ Extension
-    print("\n[+] Đã nhận request từ Extension:", req)
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="/admin/reload bị tắt: đặt ADMIN_TOKEN để bật")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Sai admin token")
+    try:
+        return registry.reload()
+    except Exception:
+        # Model mới lỗi -> vẫn giữ model đang chạy
+        raise HTTPException(status_code=409, detail=registry.info())
 
-    # Tính toán 2 đặc trưng mới ngay tại Server (Chuẩn xác!)
-    req['structure_density'] = req['num_siblings'] / (req['dom_depth'] + 1)
-    req['url_complexity'] = req['num_special_chars'] / (req['url_length'] + 1)
 
-    # Đưa vào DataFrame và sắp xếp lại cột chuẩn form lúc Train
-    df = pd.DataFrame([req])
-    df = df.reindex(columns=features, fill_value=0)
-    probs = model.predict_proba(df)
+REGISTRY.gauge("adblock_verdict_cache_size", "Số mục trong verdict cache", lambda: verdict_cache.stats()["size"])
+REGISTRY.gauge("adblock_model_reloads", "Số lần nạp model thành công", lambda: registry.reloads)
 
-    # Truy cập: [Hàng đầu tiên][Cột thứ hai (Nhãn 1)]
-    prob = probs[0][1]
 
-    # Áp dụng ngưỡng (Threshold) để giảm tỷ lệ chặn nhầm (False Positive)
-    is_ad = 1 if prob >= 0.6 else 0
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
-    print(f"==> Kết quả: {'QUẢNG CÁO' if is_ad else 'SẠCH'} (Xác suất: {prob * 100:.2f}%)")
 
-    return {"is_ad": bool(is_ad), "probability": float(prob)}
+@app.get("/stats")
+async def stats():
+    return {"cache": verdict_cache.stats(), "batching": batcher.stats()}
 
 
 if __name__ == "__main__":
     import uvicorn
 
+    # Nhiều worker (chạy trong thư mục 2026):
+    # python ../serve.py server_29022026:app --model model_graph_optimized.joblib --workers 4 --host 127.0.0.1
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
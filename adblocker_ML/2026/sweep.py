@@ -0,0 +1,132 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_store import open_matrix
+from dom_dataset import dom_entry
+
+# ==============================================================================
+# LƯỚI MẶC ĐỊNH: 3 bộ cột trên dataset_01032026.csv (tập của trainer.py / trainer_drop_2cols.py) x các siêu tham số
+# Có thể thay bằng file JSON cùng cấu trúc (--grid grid.json)
+# ==============================================================================
+DEFAULT_GRID = {
+    "feature_sets": {
+        "full": [],                                                    # trainer.py: giữ dom_depth
+        "drop_dom": ["dom_depth", "num_siblings"],                     # chỉ bỏ 2 cột DOM (bước giữa)
+        "drop_physical": ["dom_depth", "num_siblings", "num_children"],  # trainer_drop_2cols.py
+    },
+    "n_estimators": [100, 300],
+    "max_depth": [None, 12, 15],
+    "min_samples_leaf": [1, 15],
+    "class_weight": [None, "balanced_subsample"],
+    "smote": [False, True],
+}
+PARAM_KEYS = ["n_estimators", "max_depth", "min_samples_leaf", "class_weight", "smote"]
+
+
+def expand_grid(grid):
+    runs = []
+    for set_name, dropped in grid["feature_sets"].items():
+        for values in itertools.product(*(grid[k] for k in PARAM_KEYS)):
+            runs.append({"feature_set": set_name, "dropped": dropped, **dict(zip(PARAM_KEYS, values))})
+    return runs
+
+
+# --- TIẾN TRÌNH CON: mở chung 1 ma trận memmap, mỗi lần chạy chỉ chép các cột cần dùng ---
+_X = _y = _columns = None
+
+
+def _init_worker(entry_dir):
+    global _X, _y, _columns
+    _X, _y, meta = open_matrix(entry_dir)
+    _columns = meta["columns"]
+
+
+def run_one(run, test_size=0.2, seed=42):
+    keep = [i for i, c in enumerate(_columns) if c not in run["dropped"]]
+    X = np.asarray(_X[:, keep])
+    y = np.asarray(_y)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+
+    t0 = time.perf_counter()
+    if run["smote"]:
+        from imblearn.over_sampling import SMOTE
+        X_train, y_train = SMOTE(random_state=seed).fit_resample(X_train, y_train)
+    # Song song ở mức tiến trình nên mỗi forest chỉ 1 luồng
+    clf = RandomForestClassifier(n_estimators=run["n_estimators"], max_depth=run["max_depth"],
+                                 min_samples_leaf=run["min_samples_leaf"], class_weight=run["class_weight"],
+                                 random_state=seed, n_jobs=1)
+    clf.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - t0
+
+    proba = clf.predict_proba(X_test)[:, 1]
+    y_pred = (proba >= 0.5).astype(y_test.dtype)
+    return {
+        **{k: v for k, v in run.items() if k != "dropped"},
+        "n_features": len(keep),
+        "accuracy": accuracy_score(y_test, y_pred),
+        "precision": precision_score(y_test, y_pred, zero_division=0),
+        "recall": recall_score(y_test, y_pred, zero_division=0),
+        "f1": f1_score(y_test, y_pred, zero_division=0),
+        "roc_auc": roc_auc_score(y_test, proba),
+        "fit_seconds": round(fit_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy lưới ablation + siêu tham số RandomForest song song")
+    parser.add_argument("--grid", help="File JSON cùng cấu trúc DEFAULT_GRID")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid = {**DEFAULT_GRID, **json.load(f)}
+    runs = expand_grid(grid)
+
+    # Build (hoặc dùng lại) ma trận đặc trưng 1 lần ở tiến trình cha, các tiến trình con chỉ mmap
+    entry_dir = dom_entry()
+    print(f"-> {len(runs)} lượt chạy trên {args.workers} tiến trình")
+
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(entry_dir,)) as pool:
+        futures = {pool.submit(run_one, run): run for run in runs}
+        for done, future in enumerate(as_completed(futures), 1):
+            run = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({**{k: v for k, v in run.items() if k != "dropped"}, "error": str(e)})
+            print(f"   [{done}/{len(runs)}] {run['feature_set']} | { {k: run[k] for k in PARAM_KEYS} }")
+
+    df = pd.DataFrame(results)
+    # Lượt lỗi chỉ có cột "error" (không có f1) -> tách riêng, chỉ xếp hạng các lượt chạy xong
+    failed = df[df["error"].notna()] if "error" in df else df.iloc[:0]
+    ok = df.drop(failed.index)
+    if len(ok):
+        df = pd.concat([ok.sort_values("f1", ascending=False), failed])
+    df.to_csv(args.out, index=False)
+    for _, row in failed.iterrows():
+        print(f"❌ {row['feature_set']} | { {k: row[k] for k in PARAM_KEYS} }: {row['error']}")
+    if not len(ok):
+        print(f"❌ Cả {len(runs)} lượt đều lỗi -> {args.out}")
+        sys.exit(1)
+    print(f"✅ Xong {len(ok)}/{len(runs)} lượt trong {time.perf_counter() - t0:.0f}s -> {args.out}")
+    print(ok.drop(columns="error", errors="ignore").sort_values("f1", ascending=False).head(10).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
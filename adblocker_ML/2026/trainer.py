@@ -8,31 +8,26 @@ from sklearn.metrics import classification_report, accuracy_score, confusion_mat
 from imblearn.over_sampling import SMOTE
 from collections import Counter
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features import SCHEMA_DOM
+from dom_dataset import load_dom_features
 
 # ==============================================================================
-# 1. NẠP DỮ LIỆU
+# 1. NẠP DỮ LIỆU + 2. TẠO ĐẶC TRƯNG PHÁI SINH (dom_dataset.build_dom_frame)
 # ==============================================================================
+# ⚡ ĐIỂM KHÁC BIỆT CỦA TẬP 2: CHỈ XÓA CÁC CỘT TEXT.
+# CỐ TÌNH GIỮ LẠI dom_depth, num_siblings, num_children
 try:
-    df = pd.read_csv('dataset_01032026.csv')
-    df.dropna(inplace=True) # Xử lý nhiễu/NaN để tránh lỗi SMOTE
+    # Cùng CSV + cùng cách build -> nạp lại từ cache (mmap), không parse CSV
+    X, y = load_dom_features()
     print("✅ Đã nạp file thành công!")
 except FileNotFoundError:
     print("❌ Lỗi: Hãy upload file dữ liệu vào thư mục hiện tại.")
     raise
 
-# ==============================================================================
-# 2. TẠO ĐẶC TRƯNG PHÁI SINH
-# ==============================================================================
-df['structure_density'] = df['num_siblings'] / (df['dom_depth'] + 1)
-df['url_complexity'] = df['num_special_chars'] / (df['url_length'] + 1)
-
-# ⚡ ĐIỂM KHÁC BIỆT CỦA TẬP 2: CHỈ XÓA CÁC CỘT TEXT.
-# CỐ TÌNH GIỮ LẠI dom_depth, num_siblings, num_children
-cols_to_drop = ['is_ad', 'url', 'domain', 'target_url']
-
-X = df.drop(columns=[col for col in cols_to_drop if col in df.columns])
-y = df['is_ad']
-
 # ==============================================================================
 # 3. CHIA TẬP VÀ ÁP DỤNG SMOTE
 # ==============================================================================
@@ -73,7 +68,8 @@ print(classification_report(y_test, y_pred))
 # ==============================================================================
 storage_model2 = {
     'model': rf_model_2,
-    'features': X.columns.tolist()
+    'features': X.columns.tolist(),
+    'feature_schema': SCHEMA_DOM
 }
 joblib.dump(storage_model2, 'model_raw_smote.joblib')
 print("\n✅ Đã lưu model Tập 2 vào file: model_raw_smote.joblib")
@@ -6,34 +6,42 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
 from collections import Counter
 import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features import SCHEMA_DOM, add_derived_dom_features
+from corpus import read_table
+from feature_store import cached_features
 
 # 1. Nạp dữ liệu
+def build_frame():
+    df = read_table('data_enrich.csv')
+
+    # 2. Tạo đặc trưng phái sinh (Feature Engineering)
+    add_derived_dom_features(df)
+
+    # Tiền xử lý Categorical
+    if 'request_type' in df.columns:
+        df = pd.get_dummies(df, columns=['request_type'])
+    return df.drop(columns=[col for col in ['url', 'domain', 'target_url'] if col in df.columns])
+
+
 try:
-    df = pd.read_csv('data_enrich.csv')
+    # Cùng CSV + cùng cách build -> nạp lại từ cache (mmap), không parse CSV
+    X, y = cached_features("enrich", ['data_enrich.csv'], SCHEMA_DOM, build_frame)
     print("✅ Đã nạp file thành công!")
 except FileNotFoundError:
     print("❌ Lỗi: Hãy upload file 'data_enrich.csv' vào Colab.")
     raise
 
-# 2. Tạo đặc trưng phái sinh (Feature Engineering)
-df['structure_density'] = df['num_siblings'] / (df['dom_depth'] + 1)
-df['url_complexity'] = df['num_special_chars'] / (df['url_length'] + 1)
-
-# Tiền xử lý Categorical
-if 'request_type' in df.columns:
-    df_numeric = pd.get_dummies(df, columns=['request_type'])
-else:
-    df_numeric = df.copy()
-
 # -------------------------------------------------------------
 # ⚡ SỬA LỖI 1: BẮT BUỘC XÓA CÁC CỘT LÀM MÔ HÌNH HỌC VẸT
 # -------------------------------------------------------------
 cols_to_drop = [
-    'is_ad', 'url', 'domain', 'target_url',
     'dom_depth', 'num_siblings'   # <--- Đưa vào để ép model dùng data làm giàu
 ]
-X = df_numeric.drop(columns=[col for col in cols_to_drop if col in df_numeric.columns])
-y = df_numeric['is_ad']
+X = X.drop(columns=[col for col in cols_to_drop if col in X.columns])
 
 # 3. CHIA TẬP DỮ LIỆU
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -66,7 +74,8 @@ print(classification_report(y_test, y_pred))
 # 5. XUẤT FILE JOBLIB
 storage = {
     'model': rf_model,
-    'features': X.columns.tolist()
+    'features': X.columns.tolist(),
+    'feature_schema': SCHEMA_DOM
 }
 joblib.dump(storage, 'data_enriched_LATEST.joblib')
 print("\n✅ Đã lưu model vào file: data_enriched_LATEST.joblib")
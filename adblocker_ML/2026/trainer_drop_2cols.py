@@ -1,5 +1,4 @@
 import pandas as pd
-import numpy as np
 import joblib
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
@@ -7,17 +6,22 @@ from sklearn.metrics import classification_report, accuracy_score, confusion_mat
 import matplotlib.pyplot as plt
 import seaborn as sns
 from collections import Counter
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rebalance import synth_frame
+from features import SCHEMA_DOM
+from dom_dataset import load_dom_features
 
 print("=== HUẤN LUYỆN MÔ HÌNH 3: PHẪU THUẬT DỮ LIỆU & ABLATION ===")
 
 # ==============================================================================
-# 1. NẠP VÀ TẠO ĐẶC TRƯNG PHÁI SINH
+# 1. NẠP VÀ TẠO ĐẶC TRƯNG PHÁI SINH (dom_dataset.build_dom_frame, cột DOM bỏ ở bước 3)
 # ==============================================================================
-df = pd.read_csv('dataset_01032026.csv')
-df.dropna(inplace=True)
-
-df['structure_density'] = df['num_siblings'] / (df['dom_depth'] + 1)
-df['url_complexity'] = df['num_special_chars'] / (df['url_length'] + 1)
+# Cùng build với trainer.py -> dùng chung 1 bản cache (mmap), không parse CSV
+X, y = load_dom_features()
+df = X.assign(is_ad=y)
 
 # ==============================================================================
 # 2. LỌC RÁC & CÂN BẰNG DỮ LIỆU (BƯỚC ĐỘT PHÁ)
@@ -33,13 +37,15 @@ df_ads = df[(df['is_ad'] == 1) & (df['num_siblings'] <= 10)]
 print(f"✅ Mẫu Sạch giữ lại: {len(df_clean)} | Quảng cáo THẬT giữ lại: {len(df_ads)}")
 
 # Bước 2.3: Bơm 4000 mẫu Quảng cáo chuẩn mực (Như cái Banner Vbet / Dân Trí)
-synthetic_ads = pd.DataFrame([{
-    'is_3rd_party': 1, 'url_length': np.random.randint(80, 250),
-    'entropy': np.random.uniform(4.0, 5.0), 'num_special_chars': np.random.randint(10, 40),
-    'dom_depth': np.random.randint(5, 15), 'num_siblings': np.random.randint(0, 5), 'num_children': 0,
-    'avg_degree_connectivity': np.random.randint(1, 10), 'is_in_iframe': np.random.choice([0, 1], p=[0.7, 0.3]),
-    'is_ad': 1, 'structure_density': np.random.uniform(0.0, 0.5), 'url_complexity': np.random.uniform(0.1, 0.3)
-} for _ in range(4000)])
+# Sinh theo cột (1 lần gọi Generator mỗi cột, có seed) thay vì 4000 dict từng dòng
+SYNTHETIC_AD_SPEC = {
+    'is_3rd_party': 1, 'url_length': ("integers", 80, 250),
+    'entropy': ("uniform", 4.0, 5.0), 'num_special_chars': ("integers", 10, 40),
+    'dom_depth': ("integers", 5, 15), 'num_siblings': ("integers", 0, 5), 'num_children': 0,
+    'avg_degree_connectivity': ("integers", 1, 10), 'is_in_iframe': ("choice", [0, 1], [0.7, 0.3]),
+    'is_ad': 1, 'structure_density': ("uniform", 0.0, 0.5), 'url_complexity': ("uniform", 0.1, 0.3)
+}
+synthetic_ads = synth_frame(SYNTHETIC_AD_SPEC, 4000, seed=42)
 
 # Gộp toàn bộ lại thành một Dataset siêu chuẩn
 df_final = pd.concat([df_clean, df_ads, synthetic_ads], ignore_index=True)
@@ -73,7 +79,8 @@ y_pred = rf.predict(X_test)
 print(f"\n🎯 ĐỘ CHÍNH XÁC: {accuracy_score(y_test, y_pred)*100:.2f}%")
 print(classification_report(y_test, y_pred))
 
-joblib.dump({'model': rf, 'features': X.columns.tolist()}, 'model_graph_optimized.joblib')
+joblib.dump({'model': rf, 'features': X.columns.tolist(), 'feature_schema': SCHEMA_DOM},
+            'model_graph_optimized.joblib')
 print("✅ Đã lưu: model_graph_optimized.joblib")
 
 # --- XUẤT ẢNH CHO BÁO CÁO ---
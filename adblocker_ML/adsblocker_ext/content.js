@@ -1,5 +1,6 @@
 // ==============================================================================
 // 1. CÁC HÀM TÍNH TOÁN ĐẶC TRƯNG
+// getEntropy, countSpecialChars, isThirdParty, urlFeatures nằm ở features.js (nạp trước file này)
 // ==============================================================================
 const getDepth = el => {
     let depth = 0;
@@ -13,29 +14,6 @@ const getConnectivity = el => {
     return 1 + siblings + children;
 };
 
-const getEntropy = str => {
-    if (!str) return 0;
-    const freq = {};
-    for (let char of str) freq[char] = (freq[char] || 0) + 1;
-    return Object.values(freq).reduce((acc, f) => {
-        let p = f / str.length;
-        return acc - p * Math.log2(p);
-    }, 0);
-};
-
-const isThirdParty = url => {
-    try {
-        const main = window.location.hostname.split('.').slice(-2).join('.');
-        const req = new URL(url).hostname.split('.').slice(-2).join('.');
-        return main !== req ? 1 : 0;
-    } catch { return 0; }
-};
-
-const countSpecialChars = url => {
-    if (!url) return 0;
-    return (url.match(/[^a-zA-Z0-9]/g) || []).length;
-};
-
 function getEffectiveUrl(el) {
     let url = el.src || el.href || "";
     if (el.tagName === 'IMG') {
@@ -68,10 +46,7 @@ window.addEventListener('click', (e) => {
         const url = getEffectiveUrl(el);
 
         const features = {
-            "is_3rd_party": isThirdParty(url),
-            "url_length": url.length,
-            "entropy": getEntropy(url),
-            "num_special_chars": countSpecialChars(url),
+            ...urlFeatures(url, window.location.href),
             "dom_depth": getDepth(el),
             "num_siblings": el.parentElement ? el.parentElement.children.length - 1 : 0,
             "avg_degree_connectivity": getConnectivity(el),
@@ -99,10 +74,7 @@ function analyzeElement(el) {
     if (!url || url.startsWith("data:")) return;
 
     const features = {
-        "is_3rd_party": isThirdParty(url),
-        "url_length": url.length,
-        "entropy": getEntropy(url),
-        "num_special_chars": countSpecialChars(url),
+        ...urlFeatures(url, window.location.href),
         "dom_depth": getDepth(el),
         "num_siblings": el.parentElement ? el.parentElement.children.length - 1 : 0,
         "avg_degree_connectivity": getConnectivity(el),
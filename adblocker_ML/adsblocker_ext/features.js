@@ -0,0 +1,51 @@
+// ==============================================================================
+// ĐẶC TRƯNG URL DÙNG CHUNG (content.js, background.js)
+// Bản Python tương ứng: adblocker_ML/features.py (extract_dom_url_features).
+// Sửa ở đây thì sửa cả bên Python rồi chạy lại make_golden.js + check_golden.py.
+// ==============================================================================
+
+// Entropy Shannon theo ký tự, nhận diện DGA hoặc URL làm rối
+function getEntropy(str) {
+    if (!str) return 0;
+    const len = str.length;
+    const freq = {};
+    for (let char of str) freq[char] = (freq[char] || 0) + 1;
+    let entropy = 0;
+    for (let char in freq) {
+        let p = freq[char] / len;
+        entropy -= p * Math.log2(p);
+    }
+    return entropy;
+}
+
+// Đếm ký tự đặc biệt (mọi ký tự ngoài [a-zA-Z0-9])
+function countSpecialChars(str) {
+    if (!str) return 0;
+    const specialChars = str.match(/[^a-zA-Z0-9]/g);
+    return specialChars ? specialChars.length : 0;
+}
+
+// Third-party: so 2 nhãn cuối hostname của request với trang đang mở
+function isThirdParty(url, pageUrl) {
+    try {
+        if (!pageUrl) return 1;
+        const mainDomain = new URL(pageUrl).hostname.split('.').slice(-2).join('.');
+        const reqDomain = new URL(url).hostname.split('.').slice(-2).join('.');
+        return mainDomain !== reqDomain ? 1 : 0;
+    } catch (e) { return 0; }
+}
+
+// Bộ đặc trưng URL của schema "dom-graph/1"
+function urlFeatures(url, pageUrl) {
+    return {
+        "is_3rd_party": isThirdParty(url, pageUrl),
+        "url_length": url.length,
+        "entropy": getEntropy(url),
+        "num_special_chars": countSpecialChars(url)
+    };
+}
+
+// Cho node (make_golden.js); trong extension các hàm trên là global
+if (typeof module !== "undefined") {
+    module.exports = { getEntropy, countSpecialChars, isThirdParty, urlFeatures };
+}
@@ -0,0 +1,18 @@
+// Sinh golden_features.json từ golden_urls.tsv (mỗi dòng: url<TAB>page_url) bằng chính features.js của extension.
+// adblocker_ML/check_golden.py so bản Python (features.py) với file này.
+// Chạy: node make_golden.js
+const fs = require("fs");
+const path = require("path");
+const { urlFeatures } = require("./features.js");
+
+const lines = fs.readFileSync(path.join(__dirname, "golden_urls.tsv"), "utf8").split("\n").filter(l => l.length);
+const rows = lines.map(line => {
+    const [url, pageUrl] = line.split("\t");
+    const feats = urlFeatures(url, pageUrl);
+    // Giống content.js
+    feats.url_complexity = feats.num_special_chars / (feats.url_length + 1);
+    return { url, page_url: pageUrl, features: feats };
+});
+
+fs.writeFileSync(path.join(__dirname, "golden_features.json"), JSON.stringify(rows, null, 1) + "\n");
+console.log(`✅ Đã ghi ${rows.length} dòng vào golden_features.json`);
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from metrics import REGISTRY
+
+# Gom request lẻ: chờ tối đa BATCH_DELAY_MS hoặc đủ BATCH_MAX dòng thì chạy forest 1 lần cho cả nhóm
+BATCH_DELAY_MS = float(os.environ.get("BATCH_DELAY_MS", 2))
+BATCH_MAX = int(os.environ.get("BATCH_MAX", 64))
+# Cận trên các ô histogram kích thước batch (ô cuối: lớn hơn)
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+BATCH_SIZE = REGISTRY.histogram("adblock_batch_size", "Số dòng mỗi lần chạy model của MicroBatcher",
+                                buckets=SIZE_BUCKETS)
+
+
+class MicroBatcher:
+    """Gom các lần gọi model lẻ trong vài ms thành 1 batch, trả kết quả về đúng future của từng request."""
+
+    def __init__(self, max_delay_ms=BATCH_DELAY_MS, max_batch=BATCH_MAX):
+        self.max_delay = max(max_delay_ms, 0) / 1000
+        self.max_batch = max(max_batch, 1)
+        self._pending = []  # (model, dict đặc trưng, future)
+        self._timer = None
+        self._tasks = set()  # giữ tham chiếu tới task đang chạy để không bị GC giữa chừng
+
+    async def submit(self, feats, model):
+        # model: ảnh chụp model (có score_async) lúc request bắt đầu, cùng model đã dùng làm khóa cache -> chấm đúng
+        # model đó dù lúc flush đã hot-reload sang model khác. Chỉ chạy trên event loop nên không cần khóa
+        if model is None:
+            raise RuntimeError("Model chưa được nạp")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((model, feats, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        BATCH_SIZE.observe(len(batch))
+        # Gần như luôn 1 nhóm; chỉ khi vừa hot-reload mới có request của model cũ lẫn model mới trong cùng batch
+        groups = {}
+        for model, feats, future in batch:
+            groups.setdefault(id(model), (model, []))[1].append((feats, future))
+        for model, items in groups.values():
+            try:
+                probs = await model.score_async([feats for feats, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), prob in zip(items, probs):
+                # Client ngắt kết nối -> future đã bị hủy, bỏ qua
+                if not future.done():
+                    future.set_result(float(prob))
+
+    def stats(self):
+        # Đọc lại từ histogram adblock_batch_size (cùng số liệu với /metrics), không đếm riêng lần thứ 2
+        counts, items = BATCH_SIZE.snapshot()
+        batches = sum(counts)
+        labels = [f"<={b}" for b in SIZE_BUCKETS] + [f">{SIZE_BUCKETS[-1]}"]
+        return {
+            "max_delay_ms": self.max_delay * 1000,
+            "max_batch": self.max_batch,
+            "batches": batches,
+            "items": int(items),
+            "avg_batch": round(items / batches, 2) if batches else 0.0,
+            "batch_sizes": dict(zip(labels, counts)),
+        }
@@ -0,0 +1,67 @@
+import argparse
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from feature_vector import FeatureVectorizer, predict_proba
+from features import bundle_features
+
+
+# --- 1. DỮ LIỆU MẪU: lấy các hàng thật trong CSV làm dict đặc trưng như request gửi lên ---
+def load_sample_requests(csv_path, n):
+    df = pd.read_csv(csv_path, nrows=n)
+    if {'num_siblings', 'dom_depth'} <= set(df.columns):
+        df['structure_density'] = df['num_siblings'] / (df['dom_depth'] + 1)
+    if {'num_special_chars', 'url_length'} <= set(df.columns):
+        df['url_complexity'] = df['num_special_chars'] / (df['url_length'] + 1)
+    return df.select_dtypes(include='number').to_dict('records')
+
+
+def percentiles_us(samples):
+    arr = np.array(samples) * 1e6
+    return {"mean": arr.mean(), "p50": np.percentile(arr, 50), "p99": np.percentile(arr, 99)}
+
+
+def time_each(fn, requests):
+    fn(requests[0])  # warm-up
+    samples = []
+    for feats in requests:
+        t0 = time.perf_counter()
+        fn(feats)
+        samples.append(time.perf_counter() - t0)
+    return percentiles_us(samples)
+
+
+# --- 2. SO SÁNH: DataFrame.reindex (cũ) vs FeatureVectorizer (mới) ---
+def main():
+    parser = argparse.ArgumentParser(description="Đo độ trễ dựng input + predict_proba cho mỗi request")
+    parser.add_argument("--model", default="model_final_2026.joblib")
+    parser.add_argument("--csv", default="dataset_hybrid_2026.csv")
+    parser.add_argument("-n", type=int, default=500, help="Số request mô phỏng")
+    args = parser.parse_args()
+
+    bundle = joblib.load(args.model)
+    model = bundle['model']
+    feature_names = bundle_features(bundle)
+    vectorizer = FeatureVectorizer(feature_names)
+    requests = load_sample_requests(args.csv, args.n)
+
+    def build_pandas(feats):
+        return pd.DataFrame([feats]).reindex(columns=feature_names, fill_value=0)
+
+    stages = {
+        "build (pandas reindex)": build_pandas,
+        "build (FeatureVectorizer)": vectorizer.row,
+        "end-to-end (pandas)": lambda feats: model.predict_proba(build_pandas(feats)),
+        "end-to-end (FeatureVectorizer)": lambda feats: predict_proba(model, vectorizer.row(feats)),
+    }
+
+    print(f"-> Model: {args.model} ({len(feature_names)} cột) | {len(requests)} request từ {args.csv}")
+    print(f"{'Giai đoạn':<34}{'mean (µs)':>12}{'p50 (µs)':>12}{'p99 (µs)':>12}")
+    for name, fn in stages.items():
+        r = time_each(fn, requests)
+        print(f"{name:<34}{r['mean']:>12.1f}{r['p50']:>12.1f}{r['p99']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import json
+import math
+import os
+import sys
+from features import add_derived_dom_features, extract_dom_url_features
+
+# File do adsblocker_ext/make_golden.js sinh ra từ features.js của extension
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "adsblocker_ext", "golden_features.json")
+# JS duyệt key số của object trước (thứ tự cộng entropy khác Python) -> lệch ở vài bit cuối
+ENTROPY_TOL = 1e-9
+
+
+def check_golden(path=GOLDEN_PATH):
+    with open(path, encoding="utf-8") as f:
+        rows = json.load(f)
+
+    bad = 0
+    for row in rows:
+        feats = extract_dom_url_features(row['url'], row['page_url'])
+        feats['url_complexity'] = add_derived_dom_features({**feats, 'num_siblings': 0, 'dom_depth': 0})['url_complexity']
+
+        for name, expected in row['features'].items():
+            got = feats[name]
+            ok = math.isclose(got, expected, rel_tol=0, abs_tol=ENTROPY_TOL) if name == 'entropy' else got == expected
+            if not ok:
+                bad += 1
+                print(f"❌ {name}: python={got!r} js={expected!r} | {row['url'][:60]} (trang: {row['page_url']})")
+
+    print(f"-> {len(rows)} URL | {'✅ Python khớp với extension' if not bad else f'❌ {bad} giá trị lệch'}")
+    return bad == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_golden() else 1)
@@ -0,0 +1,166 @@
+import json
+import os
+import numpy as np
+
+# Kho dạng cột tối giản: mỗi cột 1 file nhị phân thô (<tên>.bin) + meta.json (dtype, số hàng).
+# Ghi nối từng chunk nên bộ nhớ lúc ghi chỉ bằng 1 chunk; đọc lại bằng np.memmap, không parse gì.
+# Cột chuỗi (URL...): <tên>.bin là heap UTF-8 nối liền, <tên>.offsets.bin là vị trí kết thúc từng chuỗi (uint32, heap >= 4 GB thì int64).
+META_FILE = "meta.json"
+STR_DTYPE = "str"
+
+
+class ColumnStoreWriter:
+    def __init__(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        # Xóa meta cũ trước khi ghi đè để bản build dở dang không bị đọc nhầm là hoàn chỉnh
+        if os.path.exists(os.path.join(out_dir, META_FILE)):
+            os.remove(os.path.join(out_dir, META_FILE))
+        self.out_dir = out_dir
+        self.columns = []  # giữ thứ tự cột của chunk đầu tiên
+        self.dtypes = {}
+        self.rows = 0
+        self._files = {}
+        self._heap_size = {}  # cột chuỗi -> số byte đã ghi vào heap
+        self.meta = None
+
+    def append(self, chunk):
+        # chunk: {tên cột: mảng 1 chiều}, mọi cột cùng độ dài, dtype cố định từ chunk đầu
+        n = None
+        for name, values in chunk.items():
+            values = np.asarray(values)
+            if name not in self._files:
+                if self.rows:
+                    raise ValueError(f"Cột '{name}' xuất hiện sau chunk đầu tiên")
+                self.columns.append(name)
+                is_str = values.dtype.kind in "OUST"
+                self.dtypes[name] = STR_DTYPE if is_str else values.dtype.str
+                self._files[name] = open(os.path.join(self.out_dir, f"{name}.bin"), "wb")
+                if is_str:
+                    self._files[name + ".offsets"] = open(os.path.join(self.out_dir, f"{name}.offsets.bin"), "wb")
+                    self._heap_size[name] = 0
+            if n is not None and len(values) != n:
+                raise ValueError("Các cột trong 1 chunk phải cùng số hàng")
+            n = len(values)
+            if self.dtypes[name] == STR_DTYPE:
+                self._append_strings(name, values)
+            else:
+                self._files[name].write(np.ascontiguousarray(values, dtype=self.dtypes[name]).tobytes())
+        self.rows += n or 0
+
+    def _append_strings(self, name, values):
+        # None/NaN -> chuỗi rỗng (cột chuỗi không lưu giá trị thiếu)
+        encoded = [v.encode("utf-8") if isinstance(v, str) else b"" for v in values.tolist()]
+        ends = self._heap_size[name] + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        self._files[name].write(b"".join(encoded))
+        self._files[name + ".offsets"].write(ends.tobytes())
+        if len(ends):
+            self._heap_size[name] = int(ends[-1])
+
+    def close(self, **extra):
+        if self.meta is not None:
+            return self.meta
+        for f in self._files.values():
+            f.close()
+        meta = {"rows": self.rows, "columns": self.columns, "dtypes": self.dtypes, **extra}
+        if self._heap_size:
+            meta["offsets"] = {name: self._shrink_offsets(name) for name in self._heap_size}
+        # Ghi meta sau cùng: thư mục thiếu meta.json nghĩa là lần build trước bị ngắt giữa chừng
+        tmp = os.path.join(self.out_dir, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, os.path.join(self.out_dir, META_FILE))
+        self.meta = meta
+        return meta
+
+    def _shrink_offsets(self, name):
+        # Ghi bằng int64 vì chưa biết heap lớn tới đâu; heap < 4 GB thì hạ xuống uint32 (offsets nhỏ đi 1 nửa)
+        if self._heap_size[name] >= 2 ** 32:
+            return np.dtype(np.int64).str
+        path = os.path.join(self.out_dir, f"{name}.offsets.bin")
+        ends = np.fromfile(path, dtype=np.int64).astype(np.uint32)
+        ends.tofile(path)
+        return ends.dtype.str
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self._files.values():
+                f.close()
+
+
+def read_meta(store_dir):
+    with open(os.path.join(store_dir, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StringColumn:
+    """Cột chuỗi đọc thẳng từ heap mmap; chỉ giải mã UTF-8 những phần tử thật sự được truy cập."""
+
+    def __init__(self, heap, ends):
+        self.heap = heap
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        start = int(self.ends[i - 1]) if i > 0 else 0
+        return bytes(self.heap[start:int(self.ends[i])]).decode("utf-8")
+
+    def to_list(self):
+        data = bytes(self.heap)
+        bounds = [0] + self.ends.tolist()
+        return [data[a:b].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+
+
+def _memmap(path, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)  # memmap không mở được file rỗng
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def open_columns(store_dir):
+    # {tên cột: np.memmap chỉ đọc (cột chuỗi: StringColumn)}; trang dữ liệu chỉ được nạp khi thật sự truy cập
+    meta = read_meta(store_dir)
+    cols = {}
+    for name in meta["columns"]:
+        path = os.path.join(store_dir, f"{name}.bin")
+        if meta["dtypes"][name] == STR_DTYPE:
+            offsets_dtype = np.dtype(meta.get("offsets", {}).get(name, "<i8"))
+            ends = _memmap(os.path.join(store_dir, f"{name}.offsets.bin"), offsets_dtype, meta["rows"])
+            cols[name] = StringColumn(_memmap(path, np.uint8, int(ends[-1]) if len(ends) else 0), ends)
+        else:
+            cols[name] = _memmap(path, np.dtype(meta["dtypes"][name]), meta["rows"])
+    return cols, meta
+
+
+# --- MẢNG NHIỀU CHIỀU / MA TRẬN THƯA đi kèm kho (vd. 1554 cột nhị phân của ad.data) ---
+def save_array(store_dir, name, values):
+    values = np.ascontiguousarray(values)
+    with open(os.path.join(store_dir, f"{name}.bin"), "wb") as f:
+        f.write(values.tobytes())
+    return {"dtype": values.dtype.str, "shape": list(values.shape)}
+
+
+def open_array(store_dir, name, info):
+    count = int(np.prod(info["shape"]))
+    return _memmap(os.path.join(store_dir, f"{name}.bin"), np.dtype(info["dtype"]), count).reshape(info["shape"])
+
+
+def save_csr(store_dir, name, matrix):
+    # CSR = 3 mảng thô: data, indices (cột), indptr (ranh giới từng hàng)
+    return {"shape": list(matrix.shape),
+            "data": save_array(store_dir, f"{name}.data", matrix.data),
+            "indices": save_array(store_dir, f"{name}.indices", matrix.indices),
+            "indptr": save_array(store_dir, f"{name}.indptr", matrix.indptr)}
+
+
+def open_csr(store_dir, name, info):
+    # csr_matrix dựng thẳng trên 3 memmap (không copy); scipy chỉ đọc
+    from scipy.sparse import csr_matrix
+    parts = [open_array(store_dir, f"{name}.{part}", info[part]) for part in ("data", "indices", "indptr")]
+    return csr_matrix(tuple(parts), shape=tuple(info["shape"]), copy=False)
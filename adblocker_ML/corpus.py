@@ -0,0 +1,295 @@
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from colstore import ColumnStoreWriter, META_FILE, STR_DTYPE, open_array, open_columns, open_csr, read_meta, \
+    save_array, save_csr
+from feature_store import file_digest
+
+# ==============================================================================
+# CORPUS DẠNG CỘT CÓ KIỂU GỌN: BỎ PARSE LẠI CSV / ad.data MỖI LẦN TRAIN
+# CSV -> colstore: số nguyên chọn dtype nhỏ nhất đủ chứa (uint8/int8/...), bool -> uint8, URL -> heap chuỗi.
+# ad.data -> khối dense (height, width, aratio, local) + 1554 cột nhị phân dạng CSR.
+# Cột chuỗi ít giá trị (request_type, domain) mã hóa từ điển: mã uint8/uint16 + bảng giá trị trong meta.
+# open_corpus()/open_ad_data() trả memmap (không parse, không copy); read_table() trả DataFrame y hệt pd.read_csv.
+# ==============================================================================
+CORPUS_DIR = os.environ.get("CORPUS_DIR", os.path.join("cache", "corpus"))
+CHUNK_ROWS = 50000
+# Thứ tự thử: kiểu nhỏ nhất chứa được [min, max] của cột thì dùng
+INT_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32, np.int64]
+NULL_SUFFIX = "__na"  # cột uint8 đánh dấu ô trống của cột chuỗi (heap chỉ lưu chuỗi rỗng)
+# Cột chuỗi ít giá trị khác nhau (request_type, domain...) -> mã số + bảng giá trị trong meta thay vì heap
+MAX_CATEGORIES = 4096
+
+
+def corpus_dir(csv_path, root=CORPUS_DIR):
+    return os.path.join(root, os.path.splitext(os.path.basename(csv_path))[0])
+
+
+def _source_info(path):
+    st = os.stat(path)
+    return {"source": os.path.basename(path), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+def is_fresh(store_dir, source_path):
+    # Cùng size + mtime -> khớp; mtime đổi (git checkout, copy...) thì so sha256 nội dung
+    if not os.path.exists(os.path.join(store_dir, META_FILE)) or not os.path.exists(source_path):
+        return False
+    meta = read_meta(store_dir)
+    info = _source_info(source_path)
+    if info["source_size"] != meta.get("source_size"):
+        return False
+    return info["source_mtime_ns"] == meta.get("source_mtime_ns") or file_digest(source_path) == meta.get("source_sha256")
+
+
+# --- 1. CSV -> COLSTORE ---
+def _merge_kind(old, new):
+    if old is None or old == new:
+        return new
+    if {old, new} <= {"int", "float"}:
+        return "float"
+    return "str"  # bool lẫn số, số lẫn chữ... -> giữ nguyên dạng chữ
+
+
+def _kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        return "int"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    return "str"
+
+
+def _scan(csv_path, chunk_rows):
+    # Lượt 1: kiểu + min/max từng cột trên toàn file, để chunk nào cũng ghi cùng 1 dtype
+    stats = {}
+    rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        rows += len(chunk)
+        for name in chunk.columns:
+            s = stats.setdefault(name, {"kind": None, "min": 0, "max": 0, "f32": True, "nulls": False, "dtype": None,
+                                        "values": set()})
+            values = chunk[name]
+            s["kind"] = _merge_kind(s["kind"], _kind(values))
+            if s["kind"] == "str" and s["values"] is not None:
+                s["values"].update(values.dropna().astype(str).unique().tolist())
+                if len(s["values"]) > MAX_CATEGORIES:
+                    s["values"] = None
+            s["dtype"] = s["dtype"] or str(values.dtype)
+            s["nulls"] |= bool(values.isna().any())
+            if s["kind"] in ("int", "float") and values.notna().any():
+                s["min"] = min(s["min"], values.min())
+                s["max"] = max(s["max"], values.max())
+            if s["kind"] == "float":
+                v = values.to_numpy(np.float64)
+                s["f32"] &= bool(np.array_equal(v.astype(np.float32).astype(np.float64), v, equal_nan=True))
+    for s in stats.values():
+        s["rows"] = rows
+    return stats
+
+
+def _storage(s):
+    # -> (dtype lưu trên đĩa, dtype pandas khi trả lại như pd.read_csv)
+    if s["kind"] == "bool":
+        return np.uint8, "bool"
+    if s["kind"] == "int":
+        dtype = next(t for t in INT_DTYPES if np.iinfo(t).min <= s["min"] and s["max"] <= np.iinfo(t).max)
+        return dtype, "int64"
+    if s["kind"] == "float":
+        return (np.float32 if s["f32"] else np.float64), "float64"
+    return STR_DTYPE, s["dtype"] if s["dtype"] in ("str", "object") else "object"
+
+
+def _categories(s):
+    # Bảng giá trị cho cột chuỗi mã hóa từ điển; mã 0 dành cho ô trống.
+    # Gần như mỗi dòng 1 giá trị (URL) thì từ điển không lợi gì -> để heap
+    if s["kind"] != "str" or s["values"] is None or len(s["values"]) * 2 > s["rows"]:
+        return None
+    return sorted(s["values"])
+
+
+def convert_csv(csv_path, out_dir=None, chunk_rows=CHUNK_ROWS):
+    out_dir = out_dir or corpus_dir(csv_path)
+    stats = _scan(csv_path, chunk_rows)
+    storage = {name: _storage(s) for name, s in stats.items()}
+    str_cols = [name for name, (dtype, _) in storage.items() if dtype == STR_DTYPE]
+    categories = {name: _categories(stats[name]) for name in str_cols if _categories(stats[name]) is not None}
+    nulls = {name: name + NULL_SUFFIX for name in str_cols if stats[name]["nulls"] and name not in categories}
+    code_dtypes = {name: np.uint8 if len(cats) < 2 ** 8 else np.uint16 for name, cats in categories.items()}
+
+    with ColumnStoreWriter(out_dir) as writer:
+        # Lượt 2: cột chữ đọc dạng str để chunk nào cũng cùng kiểu
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, dtype={c: str for c in str_cols}):
+            cols = {}
+            for name, (dtype, _) in storage.items():
+                values = chunk[name]
+                if name in categories:
+                    cols[name] = (pd.Categorical(values, categories=categories[name]).codes + 1).astype(code_dtypes[name])
+                elif dtype == STR_DTYPE:
+                    cols[name] = values.to_numpy(object)
+                    if name in nulls:
+                        cols[nulls[name]] = values.isna().to_numpy(np.uint8)
+                else:
+                    cols[name] = values.to_numpy(dtype)
+            writer.append(cols)
+        meta = writer.close(kind="table", pandas_dtypes={n: p for n, (_, p) in storage.items()}, nulls=nulls,
+                            categories=categories,
+                            source_sha256=file_digest(csv_path), **_source_info(csv_path))
+    return meta
+
+
+def open_corpus(store_dir):
+    # {cột: memmap | StringColumn}; cột mã hóa từ điển là mã (0 = trống, i = meta["categories"][cột][i - 1]),
+    # cột đánh dấu ô trống của heap chuỗi vẫn có, tên xem meta["nulls"]
+    return open_columns(store_dir)
+
+
+def to_frame(cols, meta, usecols=None):
+    # Trả lại đúng dtype như pd.read_csv (int64/float64/bool/str) để code train cũ chạy y nguyên
+    hidden = set(meta["nulls"].values())
+    data = {}
+    for name in usecols or [c for c in meta["columns"] if c not in hidden]:
+        pandas_dtype = meta["pandas_dtypes"][name]
+        if name in meta["categories"]:
+            cats = np.array([None] + meta["categories"][name], dtype=object)
+            s = pd.Series(cats[np.asarray(cols[name])], dtype=pandas_dtype)
+        elif meta["dtypes"][name] == STR_DTYPE:
+            s = pd.Series(cols[name].to_list(), dtype=pandas_dtype)
+            if name in meta["nulls"]:
+                s = s.mask(np.asarray(cols[meta["nulls"][name]], dtype=bool))
+        else:
+            s = pd.Series(np.asarray(cols[name]).astype(pandas_dtype))
+        data[name] = s
+    return pd.DataFrame(data)
+
+
+def read_table(csv_path, usecols=None, root=CORPUS_DIR):
+    # Thay cho pd.read_csv(csv_path): lần đầu (hoặc khi CSV đổi) chuyển sang colstore, các lần sau chỉ mmap
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(csv_path)
+    store_dir = corpus_dir(csv_path, root)
+    if not is_fresh(store_dir, csv_path):
+        convert_csv(csv_path, store_dir)
+    return to_frame(*open_corpus(store_dir), usecols)
+
+
+# --- 2. ad.data (UCI Internet Advertisements) -> DENSE + CSR ---
+AD_DENSE = ["height", "width", "aratio", "local"]
+
+
+def ad_feature_names(names_path="ad.names"):
+    # Dòng "<tên>: continuous." hoặc "<tên>: 0,1." sau phần chú thích "|"
+    names = []
+    if os.path.exists(names_path):
+        with open(names_path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("|") and ":" in line and line.endswith("."):
+                    name, kind = line.rsplit(":", 1)
+                    if kind.strip() in ("continuous.", "0,1."):
+                        names.append(name.strip())
+    return names
+
+
+def convert_ad_data(path="ad.data", out_dir=None, names_path="ad.names"):
+    out_dir = out_dir or corpus_dir(path)
+    # Đọc từng dòng thẳng vào data/indices/indptr của CSR, chỉ giữ ô khác 0: không bao giờ dựng mảng dense
+    # [n, 1558] float64. 4 cột đầu giữ float64 (NaN = '?'); 1554 cột còn lại chỉ ~1% là 1.
+    # '?' (có thể kèm khoảng trắng đầu) = thiếu; ở cột nhị phân coi như 0, giống nan_to_num trước đây
+    dense, labels, missing = [], [], []
+    data, indices, indptr = [], [], [0]
+    n_binary = 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            fields = [field.strip() for field in line.split(",")]
+            if len(fields) <= len(AD_DENSE):
+                continue  # dòng trống
+            values = np.array(fields[len(AD_DENSE):-1])
+            n_binary = max(n_binary, len(values))
+            nonzero = np.flatnonzero((values != "0") & (values != "?"))
+            dense.append([np.nan if v == "?" else float(v) for v in fields[:len(AD_DENSE)]])
+            data.append(values[nonzero].astype(np.float64).astype(np.uint8))
+            indices.append(nonzero)
+            indptr.append(indptr[-1] + len(nonzero))
+            labels.append(fields[-1] == "ad.")
+            missing.append("?" in fields[:-1])
+
+    # indices/indptr để int32 đúng kiểu scipy dùng, nếu không csr_matrix sẽ copy lại khi mở
+    nnz = indptr[-1]
+    binary = csr_matrix((np.concatenate(data) if data else np.zeros(0, np.uint8),
+                         np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, np.int32),
+                         np.array(indptr, dtype=np.int32 if nnz < 2 ** 31 else np.int64)),
+                        shape=(len(labels), n_binary))
+    dense = np.array(dense, dtype=np.float64).reshape(-1, len(AD_DENSE))
+    labels = np.array(labels, dtype=np.uint8)
+
+    names = ad_feature_names(names_path)
+    if len(names) != len(AD_DENSE) + n_binary:
+        names = AD_DENSE + [f"bin_{i}" for i in range(binary.shape[1])]
+
+    with ColumnStoreWriter(out_dir) as writer:
+        # Bảng theo hàng: nhãn (1 = ad.) + cờ hàng có ô '?' (main.py cũ bỏ các hàng này)
+        writer.append({"label": labels, "has_missing": np.array(missing, dtype=np.uint8)})
+        meta = writer.close(kind="ad_data", dense=save_array(out_dir, "dense", dense),
+                            binary=save_csr(out_dir, "binary", binary), feature_names=names,
+                            source_sha256=file_digest(path), **_source_info(path))
+    return meta
+
+
+def open_ad_data(store_dir):
+    # -> (dense float64 [n, 4], CSR uint8 [n, 1554], y uint8, has_missing uint8, meta); tất cả trên memmap
+    cols, meta = open_columns(store_dir)
+    dense = open_array(store_dir, "dense", meta["dense"])
+    binary = open_csr(store_dir, "binary", meta["binary"])
+    return dense, binary, cols["label"], cols["has_missing"], meta
+
+
+def load_ad_data(path="ad.data", root=CORPUS_DIR):
+    store_dir = corpus_dir(path, root)
+    if not is_fresh(store_dir, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        convert_ad_data(path, store_dir, os.path.join(os.path.dirname(path), "ad.names"))
+    return open_ad_data(store_dir)
+
+
+# --- 3. CLI: chuyển sẵn + báo dung lượng ---
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển CSV / ad.data sang dạng cột có kiểu gọn (đọc bằng mmap)")
+    parser.add_argument("paths", nargs="+", help="Các file CSV hoặc ad.data")
+    parser.add_argument("--out", default=CORPUS_DIR, help="Thư mục gốc của corpus")
+    parser.add_argument("--verify", action="store_true", help="So lại với pd.read_csv sau khi chuyển")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Không thấy {path}, bỏ qua")
+            continue
+        store_dir = corpus_dir(path, args.out)
+        if os.path.basename(path) == "ad.data":
+            meta = convert_ad_data(path, store_dir, os.path.join(os.path.dirname(path), "ad.names"))
+            detail = f"dense {meta['dense']['shape']}, CSR {meta['binary']['shape']} nnz={meta['binary']['data']['shape'][0]}"
+        else:
+            meta = convert_csv(path, store_dir)
+            detail = ", ".join(f"{c}:{'str' if d == STR_DTYPE else np.dtype(d).name}{'*' if c in meta['categories'] else ''}"
+                               for c, d in meta["dtypes"].items())
+        size = _dir_size(store_dir)
+        print(f"✅ {path}: {meta['rows']} dòng, {os.path.getsize(path) / 1e6:.2f} MB -> {size / 1e6:.2f} MB ({detail})")
+
+        if args.verify and meta["kind"] == "table":
+            same = read_table(path, root=args.out).equals(pd.read_csv(path))
+            print(f"   {'✅ khớp' if same else '❌ KHÔNG khớp'} pd.read_csv")
+            if not same:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
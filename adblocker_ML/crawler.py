@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import os
+import time
+import pandas as pd
+from playwright.async_api import TimeoutError as PlaywrightTimeout, async_playwright
+from domains import site_of
+from features_vec import dom_url_frame
+from matcher import KeywordMatcher, load_list
+
+# ==============================================================================
+# CRAWLER NHIỀU TRANG SONG SONG (thay cho rophim.py chỉ crawl 1 trang/lần)
+# 1 trình duyệt dùng chung, mỗi luồng crawl giữ 1 context + 1 page và dùng lại cho nhiều trang.
+# Chờ theo tín hiệu (networkidle / selector quảng cáo) thay vì sleep cố định 15s + 2s.
+# ==============================================================================
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/122.0.0.0 Safari/537.36")
+# Tiêm mã giả lập người dùng (Stealth), giống rophim.py
+STEALTH_JS = """
+    Object.defineProperty(navigator, 'webdriver', {get: () => undefined});
+    window.chrome = { runtime: {} };
+    Object.defineProperty(navigator, 'languages', {get: () => ['vi-VN', 'vi', 'en-US', 'en']});
+"""
+AD_SELECTORS = ["a.is-image"]  # banner cá cược kiểu rophim
+# Font/video không ảnh hưởng tới quảng cáo nhưng tốn băng thông nhất
+BLOCKED_RESOURCES = {"font", "media"}
+
+# --network: nhãn yếu cho mọi request con (banner bắt được ở AD_SELECTORS, site quảng cáo, từ khóa cá cược)
+AD_HOSTS = set(load_list("ad_hosts.txt"))
+BET_KEYWORDS = KeywordMatcher(load_list("bet_keywords.txt"))
+ADVANCED_COLUMNS = ["url", "is_3rd_party", "url_length", "entropy", "num_special_chars", "dom_depth", "num_siblings",
+                    "num_children", "avg_degree_connectivity", "is_in_iframe", "is_ad"]
+REQUEST_COLUMNS = ["page_url", "url", "resource_type", "frame_url", "element", "referer", "status", "size", "is_ad"]
+DOM_COLUMNS = ["dom_depth", "num_siblings", "num_children", "avg_degree_connectivity", "is_in_iframe"]
+
+# Lấy toàn bộ (href, src) trong 1 lần evaluate thay vì 2-3 round-trip cho mỗi phần tử
+EXTRACT_JS = """
+(selectors) => selectors.flatMap(sel => Array.from(document.querySelectorAll(sel))).map(a => {
+    const img = a.querySelector('img');
+    return {href: a.href || a.getAttribute('href'), src: img ? (img.currentSrc || img.src) : 'No Src'};
+})
+"""
+
+
+# Đặc trưng DOM (như content.js) của mọi phần tử có thể phát request, chạy 1 lần cho mỗi frame.
+# URL -> đặc trưng của phần tử đầu tiên trỏ tới nó; ảnh nằm trong <a> vẫn lấy theo src (URL thật được tải)
+DOM_FEATURES_JS = """
+() => {
+    const depth = el => { let d = 0; while (el.parentNode) { el = el.parentNode; d++; } return d; };
+    const inFrame = window.self !== window.top;
+    const out = {};
+    const sel = 'img, iframe, script, link, source, video, audio, embed, object, input[type=image], a';
+    for (const el of document.querySelectorAll(sel)) {
+        const urls = [el.currentSrc, el.src, el.href, el.data]
+            .filter(u => typeof u === 'string' && u && !u.startsWith('data:') && !u.startsWith('javascript:'));
+        if (!urls.length) continue;
+        const siblings = el.parentElement ? el.parentElement.children.length - 1 : 0;
+        const f = {
+            element: el.tagName.toLowerCase(),
+            dom_depth: depth(el),
+            num_siblings: siblings,
+            num_children: el.children.length,
+            avg_degree_connectivity: 1 + siblings + el.children.length,
+            is_in_iframe: (el.tagName === 'IFRAME' || inFrame) ? 1 : 0,
+        };
+        for (const u of urls) if (!(u in out)) out[u] = f;
+    }
+    return out;
+}
+"""
+
+
+# --- 1. GHI CSV DẠNG STREAM, BỎ TRÙNG THEO (url, target_url) CẢ VỚI DÒNG ĐÃ CÓ TỪ LẦN TRƯỚC ---
+class CsvSink:
+    """Nối dòng mới vào CSV ngay khi crawl xong từng trang, bỏ dòng trùng."""
+
+    def __init__(self, path, columns, key=("url", "target_url")):
+        self.path = path
+        self.columns = list(columns)
+        self.key = list(key)
+        self.seen = set()
+        self.written = 0
+        if os.path.isfile(path):
+            for chunk in pd.read_csv(path, usecols=self.key, dtype=str, chunksize=50000, keep_default_na=False):
+                self.seen.update(zip(*(chunk[k] for k in self.key)))
+        new_file = not os.path.isfile(path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        added = 0
+        for row in rows:
+            k = tuple(str(row.get(c, "")) for c in self.key)
+            if k in self.seen:
+                continue
+            self.seen.add(k)
+            self._writer.writerow(row)
+            added += 1
+        self._file.flush()
+        self.written += added
+        return added
+
+    def close(self):
+        self._file.close()
+
+
+# --- 2. MỘT TRANG: mở, chờ tín hiệu, cuộn để kích hoạt lazy load, lấy banner ---
+async def wait_ready(page, selectors, timeout_ms):
+    # Đợi Cloudflare tự giải (tiêu đề "Just a moment..." biến mất) rồi tới khi mạng im hoặc banner xuất hiện
+    try:
+        await page.wait_for_function("() => !document.title.startsWith('Just a moment')", timeout=timeout_ms)
+    except PlaywrightTimeout:
+        return False
+    waits = [asyncio.ensure_future(page.wait_for_load_state("networkidle", timeout=timeout_ms))]
+    waits += [asyncio.ensure_future(page.wait_for_selector(sel, timeout=timeout_ms)) for sel in selectors]
+    done, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+    for w in pending:
+        w.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    return any(not w.cancelled() and w.exception() is None for w in done)
+
+
+def ad_rows(links, site_url):
+    # Nới lỏng bộ lọc như rophim.py: href dẫn ra domain khác HOẶC chứa utm/click
+    site_key = site_of(site_url).split(".")[0]
+    rows = []
+    for link in links:
+        href = link["href"]
+        if href and (site_key not in href or "utm" in href or "click" in href):
+            rows.append({"url": link["src"], "target_url": href, "is_ad": 1})
+    return rows
+
+
+async def crawl_page(page, site_url, selectors, timeout_ms):
+    await page.goto(site_url, wait_until="domcontentloaded", timeout=timeout_ms)
+    if not await wait_ready(page, selectors, timeout_ms):
+        print(f"⚠️ {site_url}: hết {timeout_ms / 1000:.0f}s vẫn chưa sẵn sàng, lấy những gì đang có")
+    # Cuộn trang để kích hoạt Lazy Load, chờ mạng im lại (tối đa vài giây) thay vì sleep cố định
+    await page.mouse.wheel(0, 1000)
+    try:
+        await page.wait_for_load_state("networkidle", timeout=min(timeout_ms, 5000))
+    except PlaywrightTimeout:
+        pass
+    return {"ads": ad_rows(await page.evaluate(EXTRACT_JS, selectors), site_url)}
+
+
+# --- 2b. BẮT MỌI REQUEST CON (giống webRequest.onBeforeRequest của background.js) ---
+class NetworkCapture:
+    """Ghi lại mọi request/response của page trong 1 lượt mở trang."""
+
+    def __init__(self, page):
+        self.page = page
+        self.records = {}  # Request -> bản ghi (giữ thứ tự phát request)
+        page.on("request", self._on_request)
+        page.on("response", self._on_response)
+
+    def _on_request(self, request):
+        if request.url.startswith(("data:", "blob:")):
+            return
+        try:
+            frame = request.frame
+            frame_url = frame.url
+            # Theo cây frame chứ không so URL: pushState / đổi hash / redirect phía client làm page.url khác
+            # URL lúc request phát đi dù request vẫn thuộc frame chính
+            in_subframe = frame.parent_frame is not None
+            main_document = request.is_navigation_request() and not in_subframe
+        except Exception:
+            # Request của service worker không thuộc frame nào
+            frame_url, in_subframe, main_document = "", False, False
+        if main_document:
+            return  # chính trang đang crawl, không phải request con
+        self.records[request] = {"url": request.url, "resource_type": request.resource_type, "frame_url": frame_url,
+                                 "in_subframe": int(in_subframe), "referer": request.headers.get("referer", ""),
+                                 "status": "", "size": ""}
+
+    def _on_response(self, response):
+        record = self.records.get(response.request)
+        if record is not None:
+            record["status"] = response.status
+            record["size"] = response.headers.get("content-length", "")
+
+    def detach(self):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("response", self._on_response)
+        return list(self.records.values())
+
+
+async def dom_features(page):
+    features = {}
+    for frame in page.frames:
+        try:
+            found = await frame.evaluate(DOM_FEATURES_JS)
+        except Exception:
+            continue  # frame đã bị gỡ khỏi trang
+        for url, f in found.items():
+            features.setdefault(url, f)
+    return features
+
+
+def label_requests(urls, ad_urls):
+    return [int(u in ad_urls or site_of(u) in AD_HOSTS or bool(BET_KEYWORDS.search(u.lower())))
+            for u in urls]
+
+
+def network_rows(requests, dom, page_url, ad_urls, dom_only=False):
+    # Tính đặc trưng cho cả trang 1 lần (vector hóa), trả về dòng cho dataset_hybrid_2026_advanced.csv
+    # và dòng log request thô (loại, frame, kích thước...)
+    if not requests:
+        return [], []
+    df = pd.DataFrame(requests).drop_duplicates("url")
+    elements = df["url"].map(dom)
+    if dom_only:
+        df, elements = df[elements.notna()], elements[elements.notna()]
+    # Request không gắn với phần tử nào (XHR, fetch, ảnh nền CSS...): đặc trưng DOM = 0, chỉ biết có ở iframe không
+    for col in DOM_COLUMNS:
+        df[col] = [e[col] if isinstance(e, dict) else 0 for e in elements]
+    df["is_in_iframe"] = df["is_in_iframe"] | df["in_subframe"]
+    df["element"] = [e["element"] if isinstance(e, dict) else "" for e in elements]
+    df = df.join(dom_url_frame(df["url"], page_url))
+    df["is_ad"] = label_requests(df["url"], ad_urls)
+    df["page_url"] = page_url
+    return df[ADVANCED_COLUMNS].to_dict("records"), df[REQUEST_COLUMNS].to_dict("records")
+
+
+async def capture_page(page, site_url, selectors, timeout_ms, dom_only=False):
+    capture = NetworkCapture(page)
+    try:
+        banners = await crawl_page(page, site_url, selectors, timeout_ms)
+        dom = await dom_features(page)
+    finally:
+        requests = capture.detach()
+    ad_urls = {r["url"] for r in banners["ads"]} | {r["target_url"] for r in banners["ads"]}
+    dataset, log = network_rows(requests, dom, page.url, ad_urls, dom_only)
+    return {**banners, "dataset": dataset, "requests": log}
+
+
+# --- 3. NHIỀU TRANG SONG SONG: hàng đợi `concurrency` slot (context, page) giới hạn số trang đang mở ---
+async def new_slot(browser):
+    context = await browser.new_context(user_agent=USER_AGENT)
+    try:
+        await context.add_init_script(STEALTH_JS)
+        await context.route("**/*", lambda route: route.abort() if route.request.resource_type in BLOCKED_RESOURCES
+                            else route.continue_())
+        return context, await context.new_page()
+    except Exception:
+        await context.close()
+        raise
+
+
+async def crawl_sites(seeds, sinks, concurrency=4, selectors=AD_SELECTORS, timeout_ms=30000, headless=True,
+                      visit=crawl_page, browser_path=None):
+    # visit(page, url, selectors, timeout_ms) trả {tên sink: các dòng}; mỗi sink là 1 CsvSink
+    slots = asyncio.Queue()
+    stats = {"pages": 0, "failed": 0, **{name: 0 for name in sinks}}
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless, executable_path=browser_path)
+        for _ in range(concurrency):
+            slots.put_nowait(await new_slot(browser))
+
+        async def run(site_url):
+            # Chỉ có `concurrency` slot trong hàng đợi -> tối đa `concurrency` trang mở cùng lúc
+            context, page = await slots.get()
+            try:
+                if page is None:
+                    # Lần trước mở slot mới bị lỗi -> thử lại ở đây; lỗi nữa thì chỉ URL này bị tính là lỗi
+                    context, page = await new_slot(browser)
+                rows = await visit(page, site_url, selectors, timeout_ms)
+                stats["pages"] += 1
+                report = []
+                for name, sink in sinks.items():
+                    added = sink.write(rows.get(name, []))
+                    stats[name] += added
+                    report.append(f"{name}: {len(rows.get(name, []))} mẫu, {added} mới")
+                print(f"-> {site_url}: {' | '.join(report)}")
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"-> Lỗi {site_url}: {e}")
+                # Page hỏng (crash, bị đóng) -> bỏ slot, URL sau lấy slot trống sẽ mở slot mới.
+                # Không bao giờ trả page đã đóng về hàng đợi, và lỗi mở slot không làm gather dừng cả lượt crawl
+                if page is not None and page.is_closed():
+                    with contextlib.suppress(Exception):
+                        await context.close()
+                    context, page = None, None
+            finally:
+                slots.put_nowait((context, page))
+
+        try:
+            await asyncio.gather(*(run(url) for url in seeds))
+        finally:
+            await browser.close()
+    return stats
+
+
+def load_seeds(args):
+    seeds = list(args.seeds or [])
+    if args.seeds_file:
+        with open(args.seeds_file, encoding="utf-8") as f:
+            seeds += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    # Banner xoay vòng theo lượt tải -> mở lại cùng trang nhiều lần để lấy thêm mẫu
+    return seeds * args.rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl song song nhiều trang, ghi banner quảng cáo vào bet_ads CSV")
+    parser.add_argument("seeds", nargs="*", help="URL trang cần crawl")
+    parser.add_argument("--seeds-file", help="File chứa URL, mỗi dòng 1 URL")
+    parser.add_argument("--rounds", type=int, default=1, help="Số lượt mở lại mỗi trang")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Số trang mở đồng thời")
+    parser.add_argument("--selector", action="append", help=f"CSS selector banner (mặc định {AD_SELECTORS})")
+    parser.add_argument("--timeout", type=float, default=30, help="Giây chờ tối đa mỗi trang")
+    parser.add_argument("--headed", action="store_true", help="Hiện trình duyệt (dễ qua Cloudflare hơn)")
+    parser.add_argument("--browser", help="Đường dẫn Chrome/Chromium có sẵn (mặc định: bản của Playwright)")
+    parser.add_argument("--out", default="bet_ads_raw_3.csv")
+    parser.add_argument("--network", action="store_true",
+                        help="Bắt mọi request con của trang, ghi thêm --dataset-out và --requests-out")
+    # Nhãn ở đây là nhãn yếu (heuristic) -> ghi file riêng, xem lại rồi mới gộp vào 2026/dataset_hybrid_2026_advanced.csv
+    parser.add_argument("--dataset-out", default="network_dataset.csv",
+                        help="Dòng đặc trưng + nhãn yếu (không ghi thẳng vào tập train đã chọn lọc)")
+    parser.add_argument("--requests-out", default="network_requests.csv", help="Log request thô (loại, frame, size...)")
+    parser.add_argument("--dom-only", action="store_true", help="Chỉ giữ request gắn được với 1 phần tử DOM")
+    args = parser.parse_args()
+
+    seeds = load_seeds(args)
+    if not seeds:
+        parser.error("Cần ít nhất 1 URL (tham số hoặc --seeds-file)")
+
+    sinks = {"ads": CsvSink(args.out, ["url", "target_url", "is_ad"])}
+    visit = crawl_page
+    if args.network:
+        # Dataset nâng cao: bỏ dòng trùng hoàn toàn; log thô: mỗi URL 1 lần cho mỗi trang
+        sinks["dataset"] = CsvSink(args.dataset_out, ADVANCED_COLUMNS, key=ADVANCED_COLUMNS)
+        sinks["requests"] = CsvSink(args.requests_out, REQUEST_COLUMNS, key=("page_url", "url"))
+        visit = lambda page, url, selectors, timeout_ms: capture_page(page, url, selectors, timeout_ms, args.dom_only)
+    t0 = time.perf_counter()
+    try:
+        stats = asyncio.run(crawl_sites(seeds, sinks, args.concurrency, args.selector or AD_SELECTORS,
+                                        int(args.timeout * 1000), headless=not args.headed, visit=visit,
+                                        browser_path=args.browser))
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    minutes = (time.perf_counter() - t0) / 60
+    print(f"✅ {stats['pages']} trang ({stats['failed']} lỗi) trong {minutes:.1f} phút")
+    for name, sink in sinks.items():
+        print(f"   {name}: {stats[name]} mẫu mới -> {sink.path} ({stats[name] / minutes:.0f} mẫu/phút)")
+
+
+if __name__ == "__main__":
+    main()
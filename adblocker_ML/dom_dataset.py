@@ -0,0 +1,27 @@
+from corpus import read_table
+from features import SCHEMA_DOM, add_derived_dom_features
+from feature_store import cached_entry, cached_features
+
+# ==============================================================================
+# TẬP DOM dataset_01032026.csv DÙNG CHUNG CHO 2026/trainer.py, trainer_drop_2cols.py, sweep.py
+# 1 hàm build duy nhất -> cả 3 script trúng cùng 1 bản cache đặc trưng (mmap).
+# Chỉ bỏ cột chữ; bỏ thêm cột DOM nào (ablation) là việc của từng script sau khi nạp.
+# ==============================================================================
+DOM_CSV = 'dataset_01032026.csv'
+TEXT_COLUMNS = ['url', 'domain', 'target_url']
+
+
+def build_dom_frame():
+    df = read_table(DOM_CSV)
+    df.dropna(inplace=True)  # Xử lý nhiễu/NaN để tránh lỗi SMOTE
+    add_derived_dom_features(df)
+    return df.drop(columns=[col for col in TEXT_COLUMNS if col in df.columns])
+
+
+def dom_entry():
+    # Thư mục cache (X.npy/y.npy) để tiến trình con tự mmap (sweep.py)
+    return cached_entry("dom_dropna", [DOM_CSV], SCHEMA_DOM, build_dom_frame)
+
+
+def load_dom_features():
+    return cached_features("dom_dropna", [DOM_CSV], SCHEMA_DOM, build_dom_frame)
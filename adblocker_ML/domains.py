@@ -0,0 +1,34 @@
+import os
+from functools import lru_cache
+import tldextract
+from verdict_cache import normalize_host
+
+# Số host nhớ kết quả eTLD+1 (mỗi trang chỉ có vài chục host nên gần như luôn trúng)
+DOMAIN_MEMO_SIZE = int(os.environ.get("DOMAIN_MEMO_SIZE", 65536))
+
+# suffix_list_urls=() + cache_dir=None: chỉ dùng bản Public Suffix List đóng gói sẵn trong tldextract,
+# không tải mạng và không ghi cache ra đĩa lúc khởi động
+_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+
+@lru_cache(maxsize=DOMAIN_MEMO_SIZE)
+def registrable_domain(host):
+    # eTLD+1: "a.dantri.com.vn" -> "dantri.com.vn"; IP / localhost giữ nguyên
+    ext = _extract(host)
+    if ext.domain and ext.suffix:
+        return f"{ext.domain}.{ext.suffix}"
+    return ext.domain or ext.suffix
+
+
+def site_of(url_or_host):
+    return registrable_domain(normalize_host(url_or_host))
+
+
+def same_site(url, source):
+    # First-party nếu cùng eTLD+1 với trang nguồn (cdn.rophim.la vs rophim.la -> cùng site)
+    return site_of(url) == site_of(source)
+
+
+def memo_stats():
+    info = registrable_domain.cache_info()
+    return {"size": info.currsize, "max_size": info.maxsize, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,229 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+from corpus import read_table
+from feature_store import file_digest
+from feature_vector import FeatureVectorizer, predict_proba
+from features import SCHEMA_DOM, SCHEMA_SERVE, add_derived_dom_features, bundle_features, extract_url_features
+from flat_forest import FlatForest, compile_forest
+from model_registry import fast_tier_path
+
+# ==============================================================================
+# TẦNG MODEL NHANH CHO ĐƯỜNG REAL-TIME (content.js chấm từng phần tử)
+# Từ bundle forest 300 cây: cắt bớt cây hoặc chưng cất (distill) sang forest nhỏ / 1 cây nông theo xác suất
+# của model gốc, chọn ứng viên chính xác nhất mà vẫn dưới ngân sách µs/hàng, rồi tính dải "không chắc" quanh
+# ngưỡng của server: server chấm bằng model nhanh trước, chỉ đẩy các xác suất trong dải lên forest đầy đủ.
+# ==============================================================================
+# Ngưỡng kết luận của server dùng model đó (server.py: prob > 0.45, server_29022026.py: prob >= 0.6)
+DECISION_THRESHOLDS = {SCHEMA_SERVE: 0.45, SCHEMA_DOM: 0.6}
+# (kiểu, số cây, độ sâu tối đa): "prune" = giữ k cây đầu của forest gốc, "distill" = học lại theo model gốc
+CANDIDATES = [("prune", 5, None), ("prune", 10, None), ("prune", 25, None), ("prune", 50, None),
+              ("distill", 1, 8), ("distill", 1, 16), ("distill", 10, 12), ("distill", 25, None)]
+# Độ rộng nửa dải thử dần, chọn dải hẹp nhất mà kết luận cascade khớp forest đầy đủ >= --agreement
+MARGINS = [0.0, 0.02, 0.05, 0.08, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5]
+
+
+# --- 1. DỮ LIỆU: hàng thật theo đúng thứ tự cột model, nhãn là xác suất của model gốc ---
+def load_matrix(csv_path, features, schema_id):
+    df = read_table(csv_path)
+    if schema_id == SCHEMA_SERVE and not set(features) <= set(df.columns):
+        # /check chỉ có URL: tính đặc trưng đúng như server
+        rows = [extract_url_features(u) for u in df['url'].astype(str)]
+        X = FeatureVectorizer(features).matrix(rows)
+    else:
+        if schema_id == SCHEMA_DOM:
+            add_derived_dom_features(df)
+        # Thiếu cột thì từ chối, không điền 0: chưng cất trên số 0 giả sẽ ra model nhanh sai lệch
+        missing = [col for col in features if col not in df.columns]
+        if missing:
+            raise ValueError(f"{csv_path} thiếu các cột {missing} mà model cần")
+        X = df[features].to_numpy(dtype=np.float64)
+    y = df['is_ad'].to_numpy() if 'is_ad' in df.columns else None
+    return X, y
+
+
+def prune(model, n_trees):
+    small = copy.copy(model)
+    small.estimators_ = model.estimators_[:n_trees]
+    small.n_estimators = len(small.estimators_)
+    return small
+
+
+def distill(X, soft, n_trees, max_depth, seed=42):
+    # Nhãn mềm: mỗi hàng xuất hiện 2 lần (nhãn 1 trọng số p, nhãn 0 trọng số 1 - p)
+    # -> predict_proba của model nhỏ xấp xỉ chính xác suất của model gốc, không chỉ nhãn cứng
+    X2 = np.vstack([X, X])
+    y2 = np.concatenate([np.ones(len(X), dtype=int), np.zeros(len(X), dtype=int)])
+    w2 = np.concatenate([soft, 1 - soft])
+    if n_trees == 1:
+        model = DecisionTreeClassifier(max_depth=max_depth, random_state=seed)
+    else:
+        model = RandomForestClassifier(n_estimators=n_trees, max_depth=max_depth, random_state=seed, n_jobs=-1)
+    return model.fit(X2, y2, sample_weight=w2)
+
+
+# --- 2. ĐO TỐC ĐỘ trên đúng engine server dùng cho model nhanh (FlatForest) ---
+def latency_us(forest, X, single=300, batch=64):
+    # µs cho 1 request 1 hàng (p50) và µs/hàng khi MicroBatcher gom `batch` hàng (batcher.BATCH_MAX)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    samples = []
+    for i in range(single):
+        row = X[i % len(X)][None, :]
+        t0 = time.perf_counter()
+        forest.predict_proba(row)
+        samples.append(time.perf_counter() - t0)
+    runs = []
+    for _ in range(3):  # lấy lần nhanh nhất: bớt nhiễu do tiến trình khác trên máy
+        t0 = time.perf_counter()
+        rows = 0
+        for start in range(0, min(len(X), batch * 50), batch):
+            rows += len(forest.predict_proba(X[start:start + batch]))
+        runs.append((time.perf_counter() - t0) * 1e6 / rows)
+    return float(np.percentile(samples, 50) * 1e6), min(runs)
+
+
+def decisions(probs, threshold, schema_id):
+    return probs >= threshold if schema_id == SCHEMA_DOM else probs > threshold
+
+
+def cascade_table(fast_p, full_p, threshold, schema_id, labels=None):
+    full_d = decisions(full_p, threshold, schema_id)
+    table = []
+    for margin in MARGINS:
+        uncertain = (fast_p > threshold - margin) & (fast_p < threshold + margin)
+        final = np.where(uncertain, full_p, fast_p)
+        d = decisions(final, threshold, schema_id)
+        table.append({"margin": margin, "escalated": float(uncertain.mean()), "agreement": float((d == full_d).mean()),
+                      "accuracy": float((d == labels).mean()) if labels is not None else None})
+    return table
+
+
+# --- 3. CHỌN ỨNG VIÊN + DẢI CASCADE ---
+def build_fast_tier(model_path, csv_path, schema_id, budget_us=50.0, threshold=None, target_agreement=0.999,
+                    test_size=0.3, seed=42):
+    bundle = joblib.load(model_path)
+    features = bundle_features(bundle)
+    threshold = DECISION_THRESHOLDS.get(schema_id, 0.5) if threshold is None else threshold
+    teacher = bundle['model']
+    X, labels = load_matrix(csv_path, features, schema_id)
+    soft = predict_proba(teacher, X)[:, 1]
+    idx_train, idx_test = train_test_split(np.arange(len(X)), test_size=test_size, random_state=seed)
+    y_test = labels[idx_test] if labels is not None else None
+
+    full_flat = FlatForest(compile_forest(teacher))
+    full_p = soft[idx_test]
+    full_us, full_batch_us = latency_us(full_flat, X[idx_test])
+    full_acc = float((decisions(full_p, threshold, schema_id) == y_test).mean()) if y_test is not None else None
+    print(f"-> Forest đầy đủ: {teacher.n_estimators} cây | {full_batch_us:.2f} µs/hàng "
+          f"({full_us:.1f} µs request 1 hàng) | accuracy {full_acc}")
+
+    results = []
+    for kind, n_trees, depth in CANDIDATES:
+        if kind == "prune" and n_trees >= teacher.n_estimators:
+            continue
+        model = prune(teacher, n_trees) if kind == "prune" else distill(X[idx_train], soft[idx_train], n_trees, depth, seed)
+        flat = FlatForest(compile_forest(model))
+        fast_p = flat.predict_proba(X[idx_test])[:, 1]
+        single_us, batch_us = latency_us(flat, X[idx_test])
+        table = cascade_table(fast_p, full_p, threshold, schema_id, y_test)
+        for row in table:
+            # Chi phí kỳ vọng/hàng (server gom batch): luôn chạy model nhanh + phần bị đẩy lên chạy thêm forest đầy đủ
+            row["expected_us_per_row"] = round(batch_us + row["escalated"] * full_batch_us, 2)
+        chosen = next((row for row in table if row["agreement"] >= target_agreement), table[-1])
+        results.append({
+            "kind": kind, "trees": n_trees, "max_depth": depth, "model": model, "table": table, "band": chosen,
+            "us_per_row": round(batch_us, 2), "us_single_row": round(single_us, 2),
+            "agreement": table[0]["agreement"], "accuracy": table[0]["accuracy"],
+            "mean_abs_diff": float(np.abs(fast_p - full_p).mean()),
+        })
+        r = results[-1]
+        print(f"   {kind:<8}{n_trees:>4} cây, sâu {str(depth):>4}: {r['us_per_row']:>6.2f} µs/hàng "
+              f"({r['us_single_row']:>6.1f} µs request 1 hàng) | khớp forest {r['agreement']:.2%} | "
+              f"dải ±{chosen['margin']}: đẩy lên {chosen['escalated']:.1%}, {chosen['expected_us_per_row']} µs/hàng")
+
+    # Ngân sách tính trên µs/hàng khi server gom batch; trong ngân sách thì chọn cascade rẻ nhất đạt --agreement
+    within = [r for r in results if r["us_per_row"] <= budget_us]
+    if not within:
+        print(f"⚠️ Không ứng viên nào dưới {budget_us} µs/hàng, lấy ứng viên nhanh nhất")
+        within = [min(results, key=lambda r: r["us_per_row"])]
+    best = min(within, key=lambda r: (r["band"]["agreement"] < target_agreement, r["band"]["expected_us_per_row"],
+                                      -r["agreement"]))
+    chosen = best["band"]
+    table = best["table"]
+
+    cascade = {"threshold": threshold, "low": round(threshold - chosen["margin"], 4),
+               "high": round(threshold + chosen["margin"], 4)}
+    fast_bundle = {key: value for key, value in bundle.items() if key != 'model'}
+    fast_bundle.update(model=best["model"], cascade=cascade, fast_tier={
+        "teacher": os.path.basename(model_path), "teacher_sha256": file_digest(model_path),
+        "kind": best["kind"], "trees": best["trees"], "max_depth": best["max_depth"],
+        "us_per_row": best["us_per_row"], "us_single_row": best["us_single_row"], "agreement": best["agreement"],
+        "created": datetime.now().isoformat(timespec="seconds"),
+    })
+    report = {
+        "time": datetime.now().isoformat(timespec="seconds"), "model": model_path, "csv": csv_path,
+        "schema": schema_id, "rows_test": len(idx_test), "budget_us": budget_us, "threshold": threshold,
+        "full": {"trees": teacher.n_estimators, "us_per_row": round(full_batch_us, 2),
+                 "us_single_row": round(full_us, 2), "accuracy": full_acc},
+        "candidates": [{k: v for k, v in r.items() if k != "model"} for r in results],
+        "chosen": {k: v for k, v in best.items() if k not in ("model", "table")},
+        "cascade": {**cascade, "table": table, "chosen": chosen},
+    }
+    return fast_bundle, report
+
+
+def save_fast_tier(fast_bundle, out_path):
+    # Ghi file tạm rồi đổi tên: registry của server đang theo dõi file này
+    joblib.dump(fast_bundle, out_path + ".tmp")
+    os.replace(out_path + ".tmp", out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo model nhanh (cắt cây / chưng cất) cho cascade của server")
+    parser.add_argument("model", help="Bundle joblib của forest đầy đủ")
+    parser.add_argument("--csv", required=True, help="CSV hàng thật để chưng cất + đánh giá")
+    parser.add_argument("--schema", choices=[SCHEMA_SERVE, SCHEMA_DOM], default=SCHEMA_SERVE)
+    parser.add_argument("--budget-us", type=float, default=50.0, help="Ngân sách µs/hàng của model nhanh (batch)")
+    parser.add_argument("--threshold", type=float, help="Ngưỡng kết luận (mặc định theo server của schema)")
+    parser.add_argument("--agreement", type=float, default=0.999, help="Tỉ lệ kết luận phải khớp forest đầy đủ")
+    parser.add_argument("--out", help="Mặc định <model>.fast.joblib (server tự nạp cạnh model chính)")
+    parser.add_argument("--report", help="File JSON báo cáo (mặc định bench_results/fast_tier-<model>.json)")
+    args = parser.parse_args()
+
+    report_path = args.report or os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results",
+                                              f"fast_tier-{os.path.splitext(os.path.basename(args.model))[0]}.json")
+    # Tạo thư mục báo cáo trước khi ghi model: lỗi đường dẫn thì dừng lúc chưa đổi gì trên đĩa
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+
+    fast_bundle, report = build_fast_tier(args.model, args.csv, args.schema, args.budget_us, args.threshold,
+                                          args.agreement)
+    out = args.out or fast_tier_path(args.model)
+    save_fast_tier(fast_bundle, out)
+
+    chosen, cascade = report["chosen"], report["cascade"]
+    print(f"✅ Model nhanh: {chosen['kind']} {chosen['trees']} cây (sâu {chosen['max_depth']}), "
+          f"{chosen['us_per_row']} µs/hàng so với {report['full']['us_per_row']} µs/hàng -> {out}")
+    print(f"{'Dải':>16}{'Đẩy lên':>10}{'Khớp forest':>13}{'Accuracy':>10}{'µs/hàng':>10}")
+    for row in cascade["table"]:
+        band = f"({report['threshold'] - row['margin']:.2f}, {report['threshold'] + row['margin']:.2f})"
+        mark = " <-" if row is cascade["chosen"] else ""
+        acc = f"{row['accuracy']:.2%}" if row["accuracy"] is not None else "-"
+        print(f"{band:>16}{row['escalated']:>10.1%}{row['agreement']:>13.2%}{acc:>10}{row['expected_us_per_row']:>10.1f}{mark}")
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"-> Đã ghi báo cáo {report_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import glob
+import hashlib
+import inspect
+import io
+import json
+import os
+import shutil
+import tokenize
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Kho đặc trưng theo nội dung: khóa = sha256(nội dung các CSV + schema đặc trưng + mã cả module chứa hàm build
+# + mã thư viện đặc trưng/đọc dữ liệu + danh sách từ khóa lists/*.txt).
+# Một trong số đó đổi -> khóa đổi -> build lại; không đổi -> nạp X/y bằng mmap, không parse CSV.
+CACHE_DIR = os.environ.get("FEATURE_CACHE_DIR", os.path.join("cache", "features"))
+META_FILE = "meta.json"
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# Các hàm build gọi vào đây: sửa cách tính đặc trưng, cách đọc CSV (corpus/colstore) hay danh sách từ khóa
+# cũng phải làm mất hiệu lực cache
+FEATURE_CODE = ["features.py", "features_vec.py", "matcher.py", "corpus.py", "colstore.py", "dom_dataset.py"]
+FEATURE_LISTS = os.path.join(_HERE, "lists", "*.txt")
+
+
+def file_digest(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _strip_comments(source):
+    # Chỉ giữ token mã: sửa chú thích / dòng trống không làm đổi khóa cache
+    tokens = tokenize.generate_tokens(io.StringIO(source).readline)
+    return " ".join(t.string for t in tokens if t.type not in (tokenize.COMMENT, tokenize.NL))
+
+
+def _recipe(build):
+    # Cả module định nghĩa build: hàm build thường chỉ gọi hàm/hằng khác trong cùng file (SOURCES, COLUMN_DTYPES,
+    # build_dataset...) -> sửa bất cứ chỗ nào trong đó cũng phải làm mất hiệu lực cache
+    try:
+        return _strip_comments(inspect.getsource(inspect.getmodule(build)))
+    except (OSError, TypeError):
+        return getattr(build, "__qualname__", repr(build))
+
+
+@lru_cache(maxsize=1)
+def feature_code_version():
+    h = hashlib.sha256()
+    for name in FEATURE_CODE:
+        with open(os.path.join(_HERE, name), encoding="utf-8") as f:
+            h.update(f"{name}:{_strip_comments(f.read())}".encode())
+    for path in sorted(glob.glob(FEATURE_LISTS)):
+        h.update(f"{os.path.basename(path)}:{file_digest(path)}".encode())
+    return h.hexdigest()
+
+
+def dataset_key(paths, schema_id, build=None):
+    h = hashlib.sha256()
+    h.update(schema_id.encode())
+    h.update(feature_code_version().encode())
+    if build is not None:
+        h.update(_recipe(build).encode())
+    for path in paths:
+        digest = file_digest(path) if os.path.exists(path) else "missing"
+        h.update(f"{os.path.basename(path)}:{digest}".encode())
+    return h.hexdigest()
+
+
+def open_matrix(entry_dir):
+    # X, y dạng np.memmap chỉ đọc: nhiều tiến trình mở cùng file thì dùng chung page cache của OS
+    with open(os.path.join(entry_dir, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    X = np.load(os.path.join(entry_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(entry_dir, "y.npy"), mmap_mode="r")
+    return X, y, meta
+
+
+def to_frame(X, y, meta):
+    # Trả lại đúng dtype gốc từng cột (int/bool...) để SMOTE, get_dummies... cư xử như khi đọc CSV
+    X = pd.DataFrame(X, columns=meta["columns"]).astype(meta["dtypes"])
+    return X, pd.Series(np.asarray(y), name=meta["label"])
+
+
+def save_entry(entry_dir, df, label, **extra):
+    X = df.drop(columns=[label])
+    tmp = entry_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    # 1 ma trận float64 (số nguyên chính xác tới 2^53; sklearn còn ép về float32 khi fit)
+    np.save(os.path.join(tmp, "X.npy"), np.ascontiguousarray(X.to_numpy(dtype=np.float64)))
+    np.save(os.path.join(tmp, "y.npy"), df[label].to_numpy())
+    meta = {"columns": X.columns.tolist(), "dtypes": {c: str(t) for c, t in X.dtypes.items()}, "label": label,
+            "rows": len(df), **extra}
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    # Đổi tên cả thư mục 1 lần: tiến trình khác chỉ thấy bản đầy đủ hoặc không thấy gì
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp, entry_dir)
+
+
+def cached_entry(name, paths, schema_id, build, label="is_ad", cache_dir=CACHE_DIR):
+    # build() trả DataFrame chỉ gồm cột số + cột nhãn; chỉ được gọi khi cache chưa có
+    key = dataset_key(paths, schema_id, build)
+    entry_dir = os.path.join(cache_dir, f"{name}-{key[:16]}")
+    if os.path.exists(os.path.join(entry_dir, META_FILE)):
+        print(f"-> Dùng lại đặc trưng đã tính: {entry_dir}")
+    else:
+        print(f"-> Chưa có cache cho '{name}', đang tính đặc trưng...")
+        os.makedirs(cache_dir, exist_ok=True)
+        save_entry(entry_dir, build(), label, name=name, feature_schema=schema_id, key=key,
+                   feature_code=feature_code_version()[:16], sources=[os.path.basename(p) for p in paths])
+    return entry_dir
+
+
+def cached_features(name, paths, schema_id, build, label="is_ad", cache_dir=CACHE_DIR):
+    return to_frame(*open_matrix(cached_entry(name, paths, schema_id, build, label, cache_dir)))
+
+
+# --- NGUỒN GỐC DỮ LIỆU (lineage) ghi vào bundle joblib ---
+def dataset_lineage(paths):
+    # Số dòng dữ liệu của từng CSV: retrain.py dựa vào đây để biết dòng nào crawler mới nối thêm
+    return [{"file": os.path.basename(p), "sha256": file_digest(p), "rows": len(pd.read_csv(p, usecols=[0]))}
+            for p in paths if os.path.exists(p)]
+
+
+def lineage_entry(mode, paths, trees_added, **extra):
+    return {"mode": mode, "time": datetime.now().isoformat(timespec="seconds"), "trees_added": trees_added,
+            "sources": dataset_lineage(paths), **extra}
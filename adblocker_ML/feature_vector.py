@@ -0,0 +1,40 @@
+import warnings
+import numpy as np
+
+
+def predict_proba(model, X):
+    # Model sklearn fit bằng DataFrame cảnh báo mỗi lần nhận ndarray -> chỉ tắt đúng cảnh báo đó trong lời gọi này,
+    # không đổi bộ lọc warnings của code khác import module. FlatForest/ONNX không có feature_names_in_: gọi thẳng
+    if getattr(model, "feature_names_in_", None) is None:
+        return model.predict_proba(X)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return model.predict_proba(X)
+
+
+class FeatureVectorizer:
+    """Xếp dict đặc trưng vào mảng NumPy theo đúng thứ tự cột lúc train (thay cho DataFrame.reindex)."""
+
+    def __init__(self, feature_names, dtype=np.float32):
+        # Cây của sklearn luôn so sánh trên float32, đưa sẵn float32 để tránh 1 lần copy/ép kiểu
+        self.feature_names = list(feature_names)
+        self.dtype = dtype
+        self._row = np.zeros((1, len(self.feature_names)), dtype=dtype)
+
+    def row(self, feats):
+        # Buffer dùng lại giữa các request: chỉ dùng ngay trong request hiện tại, không giữ tham chiếu.
+        # Không an toàn khi nhiều luồng cùng gọi -> code chạy trong thread pool dùng matrix().
+        # Cột không có trong feats = 0 (giống reindex(fill_value=0)), key thừa bị bỏ qua.
+        self._row[0] = [feats.get(name, 0) for name in self.feature_names]
+        return self._row
+
+    def matrix(self, feats_list, out=None):
+        # Cả batch vào 1 ma trận; truyền out để tái sử dụng vùng nhớ có sẵn
+        n = len(feats_list)
+        if out is None or out.shape[0] < n:
+            out = np.empty((n, len(self.feature_names)), dtype=self.dtype)
+        X = out[:n]
+        names = self.feature_names
+        for i, feats in enumerate(feats_list):
+            X[i] = [feats.get(name, 0) for name in names]
+        return X
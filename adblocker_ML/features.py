@@ -1,16 +1,111 @@
 import math
 import re
 from collections import Counter
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
+from matcher import KeywordMatcher, load_list
 
+# ==============================================================================
+# THƯ VIỆN ĐẶC TRƯNG DÙNG CHUNG (trainer, server, test)
+# Bản từng-URL nằm ở đây; bản vector hóa cả cột (cho train) nằm ở features_vec.py và phải khớp từng bit.
+# Mỗi bộ đặc trưng có 1 schema ID, ghi vào bundle joblib ('feature_schema') lúc train để server
+# từ chối model không khớp thay vì lặng lẽ điền 0 cho cột thiếu.
+# Đổi cách tính của bộ nào thì tăng số phiên bản của bộ đó.
+# ==============================================================================
+SCHEMA_SERVE = "url-serve/1"        # server.py /check
+SCHEMA_UNIFIED = "url-unified/1"    # latest_trainer.py (+ one-hot request_type -> req_*)
+SCHEMA_FINAL = "url-final/1"        # new_trainer.py, predict_modern.py
+SCHEMA_V26 = "url-v26/1"            # trainer_v8.py
+SCHEMA_V2 = "url-v2/1"              # extract_features_v2
+SCHEMA_DOM = "dom-graph/1"          # extension content.js -> 2026/server_29022026.py, các trainer trong 2026/
 
+SCHEMAS = {
+    SCHEMA_SERVE: ["path_depth", "url_length", "num_digits", "entropy", "num_params"],
+    SCHEMA_UNIFIED: ["is_internal", "path_depth", "url_length", "num_digits", "num_params", "width", "height",
+                     "aspect_ratio", "entropy", "has_ad_keyword", "req_image", "req_other", "req_script",
+                     "req_style"],
+    SCHEMA_FINAL: ["is_internal", "is_static_asset", "url_length", "num_params", "path_depth", "entropy",
+                   "has_ad_keyword"],
+    SCHEMA_V26: ["is_internal", "is_trusted", "has_keyword", "url_len", "num_params"],
+    SCHEMA_V2: ["path_depth", "url_length", "num_digits", "num_params", "width", "height", "aspect_ratio",
+                "has_ad_keyword"],
+    SCHEMA_DOM: ["is_3rd_party", "url_length", "entropy", "num_special_chars", "dom_depth", "num_siblings",
+                 "num_children", "avg_degree_connectivity", "is_in_iframe", "structure_density", "url_complexity"],
+}
+
+# Danh sách từ khóa/domain đọc từ adblocker_ML/lists/, dựng matcher Aho-Corasick 1 lần lúc import
+TRUSTED_DOMAINS = KeywordMatcher(load_list("trusted_domains.txt"))
+UNIFIED_KEYWORDS = KeywordMatcher(load_list("ad_keywords_unified.txt"), whole_word=True)
+FINAL_KEYWORDS = KeywordMatcher(load_list("ad_keywords_final.txt"), whole_word=True)
+V26_KEYWORDS = KeywordMatcher(load_list("ad_keywords_v26.txt"))
+V2_KEYWORDS = KeywordMatcher(load_list("ad_keywords_v2.txt"))
+
+
+# --- 1. HÀM TOÁN HỌC / TIỆN ÍCH ---
 def calculate_entropy(text):
-    if not text: return 0
+    if not text or not isinstance(text, str): return 0
     counter = Counter(text)
     length = len(text)
     return -sum((count / length) * math.log2(count / length) for count in counter.values())
 
 
+def count_special_chars(text):
+    # Giống countSpecialChars trong adsblocker_ext/features.js: mọi ký tự ngoài [a-zA-Z0-9]
+    if not text: return 0
+    return len(re.findall(r'[^a-zA-Z0-9]', text))
+
+
+def is_third_party(url, page_url):
+    # Giống isThirdParty trong adsblocker_ext/features.js: so 2 nhãn cuối của hostname.
+    # Là đặc trưng của schema dom-graph/1 nên giữ nguyên heuristic của extension; kiểm tra first-party
+    # phía server dùng eTLD+1 thật (domains.py), 2 cách chỉ khác nhau với đuôi nhiều nhãn như .com.vn, .co.uk
+    try:
+        if not page_url: return 1
+        main = urlsplit(page_url)
+        req = urlsplit(url)
+        if not main.scheme or not req.scheme: return 0  # new URL() của JS báo lỗi với URL tương đối
+        main_domain = '.'.join((main.hostname or '').split('.')[-2:])
+        req_domain = '.'.join((req.hostname or '').split('.')[-2:])
+        return 1 if main_domain != req_domain else 0
+    except ValueError:
+        return 0
+
+
+def _is_missing(value):
+    # Tương đương pd.isna cho 1 giá trị, không cần import pandas ở server
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def bundle_features(bundle):
+    # server.py lưu 'feature_names', các trainer khác lưu 'features'
+    return bundle.get('features') or bundle.get('feature_names')
+
+
+def check_bundle(bundle, schema_id):
+    # Từ chối model train bằng bộ đặc trưng khác với bộ mà nơi gọi tính được
+    features = bundle_features(bundle)
+    stored = bundle.get('feature_schema')
+    if stored is not None and stored != schema_id:
+        raise ValueError(f"Model dùng bộ đặc trưng '{stored}' nhưng nơi gọi tính theo '{schema_id}'")
+    # Bundle cũ chưa ghi schema: ít nhất mọi cột model cần phải do bộ đặc trưng này tạo ra
+    missing = [col for col in features if col not in SCHEMAS[schema_id]]
+    if missing:
+        raise ValueError(f"Model cần các cột {missing} mà bộ đặc trưng '{schema_id}' không tạo ra")
+    return features
+
+
+# --- 2. CÁC BỘ ĐẶC TRƯNG URL ---
+def extract_url_features(url_to_check):
+    # SCHEMA_SERVE: đặc trưng của /check trong server.py (không hạ chữ thường URL)
+    parsed = urlparse(url_to_check)
+    return {
+        "path_depth": int(parsed.path.count('/')),
+        "url_length": int(len(url_to_check)),
+        "num_digits": int(sum(c.isdigit() for c in url_to_check)),
+        "entropy": float(calculate_entropy(url_to_check)),
+        "num_params": int(len(parsed.query.split('&')) if parsed.query else 0),
+    }
+
+
 def extract_features_v2(url, is_ad_label=0):
     parsed = urlparse(url)
 
@@ -32,7 +127,7 @@ def extract_features_v2(url, is_ad_label=0):
     num_params = len(parsed.query.split('&')) if parsed.query else 0
 
     # 4. Keyword & Type
-    has_ad_keyword = 1 if any(x in url.lower() for x in ["ad", "banner", "pixel", "bet", "click"]) else 0
+    has_ad_keyword = 1 if V2_KEYWORDS.search(url.lower()) else 0
     # Giả định request_type dựa trên đuôi file
     request_type = "image" if any(url.lower().endswith(x) for x in [".gif", ".jpg", ".png", ".webp"]) else "other"
 
@@ -49,4 +144,111 @@ def extract_features_v2(url, is_ad_label=0):
         "request_type": request_type,
         "has_ad_keyword": has_ad_keyword,
         "is_ad": is_ad_label
-    }
\ No newline at end of file
+    }
+
+
+def extract_features_unified(url, is_ad_label):
+    url_str = str(url).lower()
+    parsed = urlparse(url_str)
+
+    # Tính toán các cột giống bảng 21k dòng
+    path_parts = [x for x in parsed.path.split('/') if x]
+
+    # Bóc tách kích thước (ví dụ: 1200x110)
+    dim_match = re.search(r'(\d+)x(\d+)', url_str)
+    width = int(dim_match.group(1)) if dim_match else 0
+    height = int(dim_match.group(2)) if dim_match else 0
+
+    # Phân loại request_type (rất quan trọng để cứu CSS/JS)
+    if any(url_str.endswith(x) for x in ['.css', '.scss']):
+        req_type = "style"
+    elif url_str.endswith('.js'):
+        req_type = "script"
+    elif any(url_str.endswith(x) for x in ['.png', '.jpg', '.gif', '.webp']):
+        req_type = "image"
+    else:
+        req_type = "other"
+
+    return {
+        "url": url_str,
+        "is_internal": 1 if "rophim.la" in parsed.netloc or not parsed.netloc else 0,  # Cứu main.css
+        "path_depth": len(path_parts),
+        "url_length": len(url_str),
+        "num_digits": sum(c.isdigit() for c in url_str),
+        "num_params": len(parsed.query.split('&')) if parsed.query else 0,
+        "width": width,
+        "height": height,
+        "aspect_ratio": round(width / height, 2) if height > 0 else 0,
+        "entropy": calculate_entropy(url_str),  # Đặc trưng bổ trợ cực mạnh
+        "has_ad_keyword": 1 if UNIFIED_KEYWORDS.search(url_str) else 0,
+        "request_type": req_type,
+        "is_ad": is_ad_label  # Giữ nguyên nhãn gốc, không ép nhãn
+    }
+
+
+def extract_features_final(url, target_url=""):
+    # Ưu tiên Target URL vì chứa domain cá cược, nếu không có thì dùng URL ảnh
+    has_target = not _is_missing(target_url) and str(target_url) != ""
+    url_str = str(target_url).lower() if has_target else str(url).lower()
+    parsed = urlparse(url_str)
+
+    # CỨU TINH 1: Đặc trưng tĩnh (CSS, JS, Font thường là SẠCH)
+    is_static_asset = 1 if any(url_str.endswith(ext) for ext in ['.css', '.js', '.woff', '.ttf']) else 0
+
+    # CỨU TINH 2: Whitelist nội bộ (Nếu thuộc domain rophim.la thì ưu tiên SẠCH)
+    is_internal = 1 if "rophim.la" in parsed.netloc or not parsed.netloc else 0
+
+    # Keyword: Sử dụng Regex để tránh bắt nhầm 'uploads' hay 'assets'
+    has_ad_keyword = 1 if FINAL_KEYWORDS.search(url_str) else 0
+
+    return {
+        "is_internal": is_internal,
+        "is_static_asset": is_static_asset,
+        "url_length": len(url_str),
+        "num_params": len(parsed.query.split('&')) if parsed.query else 0,
+        "path_depth": len([x for x in parsed.path.split('/') if x]),
+        "entropy": calculate_entropy(url_str),
+        "has_ad_keyword": has_ad_keyword
+    }
+
+
+def extract_features_v26(url, is_ad_label=0):
+    u = str(url).lower()
+    p = urlparse(u)
+    domain = p.netloc
+
+    # 1. NHẬN DIỆN "NGƯỜI LẠ TỐT" (Whitelist uy tín toàn cầu)
+    is_trusted = 1 if TRUSTED_DOMAINS.search(domain) else 0
+
+    # 2. TỪ KHÓA NHẠY CẢM (Mở rộng để bắt tracker)
+    has_keyword = 1 if V26_KEYWORDS.search(u) else 0
+
+    # 3. ĐẶC TRƯNG NỘI BỘ
+    is_internal = 1 if "rophim.la" in domain or not domain else 0
+
+    return {
+        "is_internal": is_internal,
+        "is_trusted": is_trusted,
+        "has_keyword": has_keyword,
+        "url_len": len(u),
+        "num_params": len(p.query.split('&')) if p.query else 0,
+        "is_ad": is_ad_label
+    }
+
+
+# --- 3. ĐẶC TRƯNG DOM/ĐỒ THỊ (extension gửi lên) ---
+def extract_dom_url_features(url, page_url):
+    # Phần đặc trưng URL mà content.js/background.js tự tính (adsblocker_ext/features.js -> urlFeatures)
+    return {
+        "is_3rd_party": is_third_party(url, page_url),
+        "url_length": len(url),
+        "entropy": calculate_entropy(url),
+        "num_special_chars": count_special_chars(url),
+    }
+
+
+def add_derived_dom_features(feats):
+    # 2 đặc trưng phái sinh tính lại ở server (giống lúc train trong 2026/trainer*.py)
+    feats['structure_density'] = feats['num_siblings'] / (feats['dom_depth'] + 1)
+    feats['url_complexity'] = feats['num_special_chars'] / (feats['url_length'] + 1)
+    return feats
@@ -0,0 +1,306 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+from features import (FINAL_KEYWORDS, TRUSTED_DOMAINS, UNIFIED_KEYWORDS, V2_KEYWORDS, V26_KEYWORDS,
+                      calculate_entropy, count_special_chars, is_third_party)
+
+# Bản vector hóa (cả cột URL một lúc) của extract_features_unified / extract_features_v2 /
+# extract_features_final / extract_features_v26. Kết quả phải khớp bản từng-URL (chạy `python features_vec.py`).
+
+# 1 regex duy nhất tách URL giống urllib.parse.urlsplit: scheme, netloc, path (tới ? hoặc #), query (tới #)
+URL_RE = re.compile(r'^(?:([A-Za-z][A-Za-z0-9+.\-]*):)?(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?', re.DOTALL)
+# urlsplit bỏ ký tự điều khiển/khoảng trắng ở đầu và xóa mọi \t \r \n trước khi tách
+_LEADING_CONTROL = ''.join(chr(i) for i in range(33))
+# urlparse (khác urlsplit) cắt ";params" khỏi đoạn cuối của path với các scheme này
+USES_PARAMS = {'', 'ftp', 'hdl', 'prospero', 'http', 'imap', 'https', 'shttp', 'rtsp', 'rtspu', 'sip', 'sips',
+               'mms', 'sftp', 'tel'}
+
+IMAGE_EXTS = ('.png', '.jpg', '.gif', '.webp')
+STATIC_EXTS = ('.css', '.js', '.woff', '.ttf')
+# Cả cột dùng regex tương đương (chạy trong C) thay cho matcher Aho-Corasick từng URL của features.py
+UNIFIED_RE = UNIFIED_KEYWORDS.to_regex()
+FINAL_RE = FINAL_KEYWORDS.to_regex()
+V26_RE = V26_KEYWORDS.to_regex()
+V2_RE = V2_KEYWORDS.to_regex()
+TRUSTED_RE = TRUSTED_DOMAINS.to_regex()
+
+CHUNK_ROWS = 8192  # giới hạn bộ nhớ của histogram (CHUNK_ROWS x 128 ô)
+
+
+# --- 1. TÁCH URL CHO CẢ CỘT ---
+def parse_urls(urls):
+    cleaned = urls.str.lstrip(_LEADING_CONTROL).str.replace(r'[\t\r\n]', '', regex=True)
+    parts = cleaned.str.extract(URL_RE).fillna('')
+    parts.columns = ['scheme', 'netloc', 'path', 'query']
+    scheme = parts['scheme'].str.lower()
+    # Scheme chỉ hợp lệ nếu theo sau là ':' và ký tự đầu là chữ ASCII -> regex đã đảm bảo
+    has_params = scheme.isin(USES_PARAMS) & parts['path'].str.contains(';', regex=False)
+    if has_params.any():
+        parts.loc[has_params, 'path'] = parts.loc[has_params, 'path'].str.replace(r';[^/]*$', '', regex=True)
+    parts['scheme'] = scheme
+    return parts
+
+
+def path_depth(path):
+    # len([x for x in path.split('/') if x]) = số đoạn không rỗng giữa các dấu '/'
+    return path.str.count(r'[^/]+').astype(np.int64)
+
+
+def num_params(query):
+    return np.where(query != '', query.str.count('&') + 1, 0).astype(np.int64)
+
+
+# --- 2. ENTROPY + ĐẾM CHỮ SỐ QUA HISTOGRAM BYTE (uint8) ---
+def _ascii_entropy_digits(chunk):
+    n = len(chunk)
+    lengths = np.fromiter(map(len, chunk), dtype=np.int64, count=n)
+    codes = np.frombuffer(''.join(chunk).encode('ascii'), dtype=np.uint8)
+    row = np.repeat(np.arange(n), lengths)
+    keys = row * 128 + codes
+    hist = np.bincount(keys, minlength=n * 128)
+    digits = hist.reshape(n, 128)[:, 48:58].sum(axis=1)
+
+    # calculate_entropy cộng các số hạng theo thứ tự ký tự xuất hiện lần đầu (thứ tự của Counter).
+    # Giữ đúng thứ tự đó + dùng math.log2 để ra kết quả giống hệt từng bit, không chỉ "gần bằng".
+    first = np.empty(n * 128, dtype=np.int64)
+    first[keys[::-1]] = np.arange(len(keys) - 1, -1, -1)  # ghi ngược -> vị trí nhỏ nhất được giữ lại
+    present = np.flatnonzero(hist)
+    present = present[np.argsort(first[present], kind='stable')]
+    owner = present // 128
+    p = hist[present] / lengths[owner]
+    # Số giá trị p khác nhau ít (vài nghìn) -> gọi math.log2 trên từng giá trị duy nhất
+    p_codes, p_unique = pd.factorize(p)
+    log_p = np.array([math.log2(x) for x in p_unique])[p_codes]
+    terms = (p * log_p).tolist()
+    bounds = np.searchsorted(owner, np.arange(n + 1)).tolist()
+    entropy = [-sum(terms[bounds[i]:bounds[i + 1]]) if bounds[i] < bounds[i + 1] else 0 for i in range(n)]
+    return np.array(entropy, dtype=np.float64), digits
+
+
+def entropy_and_digits(texts):
+    texts = texts.to_numpy(dtype=object)
+    n = len(texts)
+    entropy = np.zeros(n, dtype=np.float64)
+    digits = np.zeros(n, dtype=np.int64)
+    is_ascii = np.fromiter((t.isascii() for t in texts), dtype=bool, count=n)
+
+    ascii_idx = np.flatnonzero(is_ascii)
+    for start in range(0, len(ascii_idx), CHUNK_ROWS):
+        idx = ascii_idx[start:start + CHUNK_ROWS]
+        entropy[idx], digits[idx] = _ascii_entropy_digits(texts[idx])
+
+    # URL có ký tự ngoài ASCII (hiếm): 1 ký tự != 1 byte, isdigit() nhận cả chữ số Unicode -> tính kiểu cũ
+    for i in np.flatnonzero(~is_ascii):
+        entropy[i] = calculate_entropy(texts[i])
+        digits[i] = sum(c.isdigit() for c in texts[i])
+    return entropy, digits
+
+
+_ALNUM = np.zeros(128, dtype=bool)
+_ALNUM[[ord(c) for c in '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz']] = True
+
+
+def special_chars(texts):
+    # count_special_chars cho cả cột: URL ASCII đếm qua bảng tra byte, URL Unicode (hiếm) đếm kiểu cũ
+    texts = texts.to_numpy(dtype=object)
+    n = len(texts)
+    counts = np.zeros(n, dtype=np.int64)
+    is_ascii = np.fromiter((t.isascii() for t in texts), dtype=bool, count=n)
+    idx = np.flatnonzero(is_ascii)
+    if len(idx):
+        lengths = np.fromiter(map(len, texts[idx]), dtype=np.int64, count=len(idx))
+        codes = np.frombuffer(''.join(texts[idx]).encode('ascii'), dtype=np.uint8)
+        row = np.repeat(np.arange(len(idx)), lengths)
+        counts[idx] = np.bincount(row, weights=~_ALNUM[codes], minlength=len(idx)).astype(np.int64)
+    for i in np.flatnonzero(~is_ascii):
+        counts[i] = count_special_chars(texts[i])
+    return counts
+
+
+# --- 3. KÍCH THƯỚC BANNER (vd 1200x110) ---
+def dimensions(texts):
+    n = len(texts)
+    width = np.zeros(n, dtype=np.int64)
+    height = np.zeros(n, dtype=np.int64)
+    aspect = np.zeros(n, dtype=np.float64)
+    # Đa số URL không có dạng NxN -> chỉ chạy extract trên các dòng có khả năng khớp
+    maybe = texts.str.contains(r'\dx\d').to_numpy()
+    if maybe.any():
+        dims = texts[maybe].str.extract(r'(\d+)x(\d+)')
+        # int() từng chuỗi rồi ép thẳng sang int64 (qua float sẽ mất chính xác với số dài > 2^53)
+        w = [int(x) for x in dims[0]]
+        h = [int(x) for x in dims[1]]
+        if max(w + h) > np.iinfo(np.int64).max:
+            # Chuỗi >= 19-20 chữ số (URL crawl được) không vừa int64 -> giữ số nguyên Python như bản từng-URL
+            width, height = width.astype(object), height.astype(object)
+        width[maybe] = w
+        height[maybe] = h
+        # Dùng round() của Python (không phải np.round) để làm tròn giống hệt bản gốc
+        has_h = height > 0
+        aspect[has_h] = [round(w / h, 2) for w, h in zip(width[has_h].tolist(), height[has_h].tolist())]
+    return width, height, aspect
+
+
+def _is_internal(netloc):
+    return (netloc.str.contains('rophim.la', regex=False) | (netloc == '')).astype(np.int64)
+
+
+# --- 4. CÁC BỘ ĐẶC TRƯNG (cùng cột, cùng thứ tự với bản từng-URL) ---
+def unified_frame(urls, labels=0):
+    url_str = pd.Series(urls).astype(str).str.lower()
+    parts = parse_urls(url_str)
+    width, height, aspect = dimensions(url_str)
+    entropy, digits = entropy_and_digits(url_str)
+    req_type = np.select(
+        [url_str.str.endswith(('.css', '.scss')), url_str.str.endswith('.js'), url_str.str.endswith(IMAGE_EXTS)],
+        ["style", "script", "image"], default="other")
+    return pd.DataFrame({
+        "url": url_str,
+        "is_internal": _is_internal(parts['netloc']),
+        "path_depth": path_depth(parts['path']),
+        "url_length": url_str.str.len().astype(np.int64),
+        "num_digits": digits,
+        "num_params": num_params(parts['query']),
+        "width": width,
+        "height": height,
+        "aspect_ratio": aspect,
+        "entropy": entropy,
+        "has_ad_keyword": url_str.str.contains(UNIFIED_RE).astype(np.int64),
+        "request_type": req_type,
+        "is_ad": labels if np.isscalar(labels) else np.asarray(labels),
+    }, index=url_str.index)
+
+
+def v2_frame(urls, labels=0):
+    url = pd.Series(urls)
+    lower = url.str.lower()
+    parts = parse_urls(url)
+    width, height, aspect = dimensions(lower)
+    _, digits = entropy_and_digits(url)
+    return pd.DataFrame({
+        "url": url,
+        "domain": parts['netloc'],
+        "path_depth": path_depth(parts['path']),
+        "url_length": url.str.len().astype(np.int64),
+        "num_digits": digits,
+        "num_params": num_params(parts['query']),
+        "width": width,
+        "height": height,
+        "aspect_ratio": aspect,
+        "request_type": np.where(lower.str.endswith(IMAGE_EXTS), "image", "other"),
+        "has_ad_keyword": lower.str.contains(V2_RE).astype(np.int64),
+        "is_ad": labels if np.isscalar(labels) else np.asarray(labels),
+    }, index=url.index)
+
+
+def final_frame(urls, targets=None):
+    # Ưu tiên target_url (chứa domain cá cược) nếu có, giống predict_modern.extract_features_final
+    url_str = pd.Series(urls).astype(str).str.lower()
+    if targets is not None:
+        targets = pd.Series(targets, index=url_str.index)
+        use_target = targets.notna() & (targets.astype(str) != "")
+        url_str = url_str.where(~use_target, targets.astype(str).str.lower())
+    parts = parse_urls(url_str)
+    entropy, _ = entropy_and_digits(url_str)
+    return pd.DataFrame({
+        "is_internal": _is_internal(parts['netloc']),
+        "is_static_asset": url_str.str.endswith(STATIC_EXTS).astype(np.int64),
+        "url_length": url_str.str.len().astype(np.int64),
+        "num_params": num_params(parts['query']),
+        "path_depth": path_depth(parts['path']),
+        "entropy": entropy,
+        "has_ad_keyword": url_str.str.contains(FINAL_RE).astype(np.int64),
+    }, index=url_str.index)
+
+
+def v26_frame(urls, labels=0):
+    u = pd.Series(urls).astype(str).str.lower()
+    parts = parse_urls(u)
+    domain = parts['netloc']
+    return pd.DataFrame({
+        "is_internal": _is_internal(domain),
+        "is_trusted": domain.str.contains(TRUSTED_RE).astype(np.int64),
+        "has_keyword": u.str.contains(V26_RE).astype(np.int64),
+        "url_len": u.str.len().astype(np.int64),
+        "num_params": num_params(parts['query']),
+        "is_ad": labels if np.isscalar(labels) else np.asarray(labels),
+    }, index=u.index)
+
+
+def dom_url_frame(urls, page_urls):
+    # Phần URL của schema dom-graph/1 (extract_dom_url_features) cho cả cột, vd. mọi request crawler bắt được
+    u = pd.Series(urls).astype(str)
+    pages = pd.Series(page_urls, index=u.index).fillna('').astype(str)
+    entropy, _ = entropy_and_digits(u)
+    # is_third_party chỉ phụ thuộc (scheme, host) của 2 URL -> tính trên các cặp khác nhau rồi ánh xạ lại
+    origin = u.str.extract(r'^([^:/?#]+:(?://[^/?#]*)?)', expand=False).fillna('')
+    pairs = pd.MultiIndex.from_arrays([origin, pages])
+    codes, uniques = pd.factorize(pairs)
+    third = np.array([is_third_party(o + '/', p) for o, p in uniques], dtype=np.int64)[codes]
+    return pd.DataFrame({
+        "is_3rd_party": third,
+        "url_length": u.str.len().astype(np.int64),
+        "entropy": entropy,
+        "num_special_chars": special_chars(u),
+    }, index=u.index)
+
+
+# --- 5. KIỂM TRA KHỚP VỚI BẢN TỪNG-URL ---
+def _compare(name, fast, slow):
+    slow = slow.set_index(fast.index)
+    mismatched = []
+    for col in slow.columns:
+        a, b = fast[col], slow[col]
+        # So sánh qua repr() -> float cũng phải khớp từng bit
+        ok = (a.map(repr) == b.map(repr)).all()
+        if not ok:
+            mismatched.append(col)
+    print(f"-> {name}: {len(fast)} dòng | {'✅ khớp' if not mismatched else '❌ lệch ở ' + str(mismatched)}")
+    return not mismatched
+
+
+def verify(csv_path="dataset_hybrid_2026.csv"):
+    import time
+    from features import (extract_dom_url_features, extract_features_unified, extract_features_v2,
+                          extract_features_final, extract_features_v26)
+
+    urls = pd.read_csv(csv_path)['url']
+    # Thêm vài ca khó: ;params, fragment trước query, IPv4, ký tự Unicode, khoảng trắng/điều khiển, không scheme
+    tricky = pd.Series([
+        "https://a.com/x/;jsessionid=1?a=1&b=2", "http://a.com/p;q/r;s", "img.gif", "//cdn.x.com/a.js#f?x",
+        "https://rophim.la/assets/css/main.css", " \thttps://b.com/a\nb?c=1", "HTTPS://Ünï.com/ẞ²/1200x110.GIF",
+        "mailto:x@y.com", "localhost:8080/a", "https://x.com/300x0/a.png", "", "https://İ.com/ad/",
+        "https://cdn.x.com/banner_12345678901234567890x90.gif",
+    ])
+    urls = pd.concat([urls, tricky], ignore_index=True)
+    labels = np.arange(len(urls)) % 2
+    pages = urls.shift(1).fillna('')
+
+    checks = [
+        ("unified", lambda: unified_frame(urls, labels),
+         lambda: pd.DataFrame([extract_features_unified(u, l) for u, l in zip(urls, labels)])),
+        ("v2", lambda: v2_frame(urls, labels),
+         lambda: pd.DataFrame([extract_features_v2(u, l) for u, l in zip(urls, labels)])),
+        ("final", lambda: final_frame(urls, urls.shift(1)),
+         lambda: pd.DataFrame([extract_features_final(u, t) for u, t in zip(urls, urls.shift(1))])),
+        ("v26", lambda: v26_frame(urls, labels),
+         lambda: pd.DataFrame([extract_features_v26(u, l) for u, l in zip(urls, labels)])),
+        ("dom", lambda: dom_url_frame(urls, pages),
+         lambda: pd.DataFrame([extract_dom_url_features(u, p) for u, p in zip(urls, pages)])),
+    ]
+    ok = True
+    for name, fast_fn, slow_fn in checks:
+        t0 = time.perf_counter()
+        fast = fast_fn()
+        t1 = time.perf_counter()
+        slow = slow_fn()
+        t2 = time.perf_counter()
+        ok &= _compare(name, fast, slow)
+        print(f"   vector hóa {t1 - t0:.2f}s | từng URL {t2 - t1:.2f}s")
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if verify() else 1)
@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+from features import bundle_features
+
+# Định dạng .npz chỉ cần NumPy để nạp & chạy: không import sklearn, không qua input validation của sklearn.
+FORMAT_VERSION = 1
+# Thư mục .flat/: mỗi mảng 1 file .npy nạp bằng mmap -> N worker cùng đọc 1 bản trong page cache của OS
+FLAT_DIR_SUFFIX = ".flat"
+FLAT_META = "meta.json"
+FLAT_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots", "classes", "is_internal", "children"]
+# Giây chờ worker khác biên dịch xong .flat/ (cũng là tuổi tối đa của file khóa bỏ lại khi tiến trình chết)
+FLAT_LOCK_TIMEOUT = 300
+
+
+# --- 1. BIÊN DỊCH: RandomForestClassifier -> các mảng phẳng liên tục ---
+def compile_forest(model):
+    # DecisionTreeClassifier đơn lẻ (model nhanh của fast_tier.py) = forest 1 cây
+    trees = [est.tree_ for est in getattr(model, "estimators_", [model])]
+    sizes = [t.node_count for t in trees]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    total = int(sum(sizes))
+    n_classes = len(model.classes_)
+
+    feature = np.zeros(total, dtype=np.int32)
+    threshold = np.zeros(total, dtype=np.float64)
+    left = np.zeros(total, dtype=np.int32)
+    right = np.zeros(total, dtype=np.int32)
+    value = np.zeros((total, n_classes), dtype=np.float64)
+
+    for t, off in zip(trees, offsets):
+        n = t.node_count
+        idx = np.arange(off, off + n, dtype=np.int32)
+        is_leaf = t.children_left == -1
+
+        # Lá trỏ về chính nó: nhận biết lá bằng left[i] == i, không cần mảng cờ riêng
+        feature[off:off + n] = np.where(is_leaf, 0, t.feature)
+        threshold[off:off + n] = np.where(is_leaf, 0.0, t.threshold)
+        left[off:off + n] = np.where(is_leaf, idx, t.children_left + off)
+        right[off:off + n] = np.where(is_leaf, idx, t.children_right + off)
+
+        # Giống DecisionTreeClassifier.predict_proba: chuẩn hóa số mẫu ở lá thành xác suất
+        v = t.value[:, 0, :].astype(np.float64)
+        norm = v.sum(axis=1, keepdims=True)
+        norm[norm == 0] = 1.0
+        value[off:off + n] = v / norm
+
+    return {
+        "format_version": np.int32(FORMAT_VERSION),
+        "feature": feature,
+        "threshold": threshold,
+        "left": left,
+        "right": right,
+        "value": value,
+        "roots": offsets,
+        "max_depth": np.int32(max(t.max_depth for t in trees)),
+        "classes": np.asarray(model.classes_),
+    }
+
+
+# --- 2. BỘ ĐÁNH GIÁ VECTOR HÓA: duyệt tất cả cây cho cả batch cùng lúc ---
+class FlatForest:
+    def __init__(self, arrays):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        # Bản .flat/ lưu sẵn 2 mảng dẫn xuất này để worker không phải tạo bản sao riêng
+        if "is_internal" in arrays:
+            self.is_internal = arrays["is_internal"]
+            self.children = arrays["children"]
+        else:
+            self.is_internal = self.left != np.arange(len(self.left), dtype=self.left.dtype)
+            # children[i, 1] = con trái, children[i, 0] = con phải -> 1 lần gather thay cho 2 lần + np.where
+            self.children = np.stack([self.right, self.left], axis=1)
+        self.classes_ = arrays["classes"]
+        self.n_estimators = len(self.roots)
+
+    def predict_proba(self, X):
+        # sklearn so sánh X (đã ép float32) với threshold float64 -> làm y hệt để kết quả trùng khớp
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        flat_X = X.ravel()
+        node = np.tile(self.roots, n)  # cặp (mẫu i, cây t) nằm ở vị trí i * n_cây + t
+        row_start = np.repeat(np.arange(n, dtype=np.int64) * n_features, self.n_estimators)
+        active = np.flatnonzero(self.is_internal[node])
+        # Mỗi bước chỉ xử lý các cặp chưa tới lá -> batch lớn không phải đi đủ max_depth bước
+        while active.size:
+            nd = node[active]
+            go_left = flat_X[row_start[active] + self.feature[nd]] <= self.threshold[nd]
+            nxt = self.children[nd, go_left.view(np.int8)]
+            node[active] = nxt
+            active = active[self.is_internal[nxt]]
+        return self.value[node].reshape(n, self.n_estimators, -1).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def save_flat(bundle, path):
+    arrays = compile_forest(bundle['model'])
+    features = bundle_features(bundle)
+    # Giữ schema đặc trưng của bundle gốc để server vẫn kiểm tra được khi nạp bản .npz
+    np.savez(path, feature_names=np.asarray(features, dtype=str),
+             feature_schema=np.asarray(bundle.get('feature_schema', ''), dtype=str), **arrays)
+
+
+def load_flat(path):
+    arrays = np.load(path, allow_pickle=False)
+    features = arrays["feature_names"].tolist()
+    schema = str(arrays["feature_schema"]) if "feature_schema" in arrays.files else ""
+    # Giữ cả 2 key như bundle joblib gốc: server.py dùng 'feature_names', các file khác dùng 'features'
+    return {"model": FlatForest(arrays), "features": features, "feature_names": features,
+            "feature_schema": schema or None}
+
+
+def save_flat_dir(bundle, out_dir):
+    arrays = compile_forest(bundle['model'])
+    forest = FlatForest(arrays)
+    arrays.update(is_internal=forest.is_internal, children=np.ascontiguousarray(forest.children))
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    digest = hashlib.sha256()
+    for name in FLAT_ARRAYS:
+        np.save(os.path.join(tmp, name + ".npy"), arrays[name], allow_pickle=False)
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    meta = {"format_version": FORMAT_VERSION, "max_depth": int(arrays["max_depth"]),
+            "feature_names": bundle_features(bundle), "feature_schema": bundle.get('feature_schema'),
+            "sha256": digest.hexdigest()}
+    with open(os.path.join(tmp, FLAT_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    # Đổi tên cả thư mục: worker đang mmap bản cũ vẫn đọc được (inode còn sống tới khi unmap)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+
+
+def load_flat_dir(path):
+    with open(os.path.join(path, FLAT_META), encoding="utf-8") as f:
+        meta = json.load(f)
+    # mmap chỉ đọc; asarray bỏ lớp np.memmap cho nhẹ, vẫn trỏ vào cùng vùng nhớ
+    arrays = {name: np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode="r")) for name in FLAT_ARRAYS}
+    arrays["max_depth"] = meta["max_depth"]
+    features = meta["feature_names"]
+    return {"model": FlatForest(arrays), "features": features, "feature_names": features,
+            "feature_schema": meta["feature_schema"]}
+
+
+def flat_paths(joblib_path):
+    # (bản biên dịch, file để so thời gian sửa, hàm nạp) theo thứ tự ưu tiên
+    base = os.path.splitext(joblib_path)[0]
+    return [(base + FLAT_DIR_SUFFIX, os.path.join(base + FLAT_DIR_SUFFIX, FLAT_META), load_flat_dir),
+            (base + ".npz", base + ".npz", load_flat)]
+
+
+def _is_fresh(stamp, joblib_path):
+    return os.path.exists(stamp) and (
+        not os.path.exists(joblib_path) or os.path.getmtime(stamp) >= os.path.getmtime(joblib_path))
+
+
+def refresh_flat_dir(joblib_path, timeout=FLAT_LOCK_TIMEOUT):
+    # Biên dịch lại .flat/ nếu file joblib mới hơn. N worker cùng thấy model đổi -> chỉ worker giữ file khóa
+    # biên dịch, các worker khác chờ rồi mmap chung bản đó (không worker nào tự unpickle forest sklearn)
+    flat_dir, stamp, _ = flat_paths(joblib_path)[0]
+    lock = flat_dir + ".lock"
+    deadline = time.monotonic() + timeout
+    while not _is_fresh(stamp, joblib_path):
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > timeout:
+                    os.remove(lock)  # khóa của tiến trình đã chết giữa chừng
+            except FileNotFoundError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chờ quá {timeout}s để biên dịch {flat_dir}")
+            time.sleep(0.2)
+            continue
+        try:
+            if not _is_fresh(stamp, joblib_path):
+                import joblib
+                print(f"-> Đang biên dịch {joblib_path} -> {flat_dir} ...")
+                save_flat_dir(joblib.load(joblib_path), flat_dir)
+        finally:
+            os.remove(lock)
+    return flat_dir
+
+
+def load_bundle(joblib_path):
+    # Đang chạy bằng .flat/ (serve.py nhiều worker) mà joblib mới hơn -> biên dịch lại rồi mmap như cũ
+    flat_dir = flat_paths(joblib_path)[0][0]
+    if os.path.isdir(flat_dir) and os.path.exists(joblib_path):
+        refresh_flat_dir(joblib_path)
+    # Ưu tiên bản đã biên dịch (.flat/ rồi .npz) nếu nó mới hơn (hoặc bằng) file joblib -> không nạp nhầm model cũ
+    for path, stamp, loader in flat_paths(joblib_path):
+        if _is_fresh(stamp, joblib_path):
+            return loader(path)
+    import joblib
+    return joblib.load(joblib_path)
+
+
+# --- 3. KIỂM TRA KHỚP KẾT QUẢ VỚI sklearn predict_proba ---
+def parity_matrix(flat, features, csv_path, seed=42):
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    rng = np.random.default_rng(seed)
+    X = np.empty((len(df), len(features)), dtype=np.float64)
+    for j, col in enumerate(features):
+        if col in df.columns:
+            X[:, j] = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy()
+        else:
+            # Cột không có trong CSV: rải đều trong khoảng ngưỡng model dùng để đi qua đủ các nhánh
+            used = flat.threshold[(flat.feature == j) & flat.is_internal]
+            lo, hi = (used.min() - 1, used.max() + 1) if len(used) else (0, 1)
+            X[:, j] = rng.uniform(lo, hi, len(df))
+    return X
+
+
+def verify_parity(joblib_path, csv_path, atol=1e-9):
+    import joblib
+    bundle = joblib.load(joblib_path)
+    features = bundle_features(bundle)
+    flat = FlatForest(compile_forest(bundle['model']))
+    X = parity_matrix(flat, features, csv_path)
+
+    expected = bundle['model'].predict_proba(X)
+    got = flat.predict_proba(X)
+    max_diff = float(np.abs(expected - got).max())
+    same_label = bool((np.argmax(expected, axis=1) == np.argmax(got, axis=1)).all())
+    print(f"-> {joblib_path}: {len(X)} hàng | max |Δproba| = {max_diff:.2e} | nhãn trùng khớp: {same_label}")
+    return max_diff <= atol and same_label
+
+
+def _check(name, expected, flat, X, atol=1e-9):
+    got = flat.predict_proba(X)
+    max_diff = float(np.abs(expected - got).max())
+    same_label = bool((np.argmax(expected, axis=1) == np.argmax(got, axis=1)).all())
+    print(f"   {name:<34} max |Δproba| = {max_diff:.2e} | nhãn trùng khớp: {same_label}")
+    return max_diff <= atol and same_label
+
+
+def verify_synthetic(seed=42):
+    # Không cần file model/CSV nào: train vài forest nhỏ trên dữ liệu sinh ngẫu nhiên rồi so với sklearn,
+    # qua cả 3 đường nạp (mảng trong RAM, .npz, thư mục .flat/ mmap)
+    import tempfile
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+    rng = np.random.default_rng(seed)
+    n = 3000
+    # Cột nguyên (kiểu đếm ký tự, độ sâu DOM) + cột thực float64 (kiểu entropy) để thử phép ép float32 như sklearn
+    X = np.column_stack([rng.integers(0, 200, n), rng.integers(0, 2, n), rng.normal(4, 1, n),
+                         rng.exponential(30, n), rng.uniform(-1, 1, n)]).astype(np.float64)
+    y2 = ((X[:, 0] > 80) ^ (X[:, 2] > 4.2) | (X[:, 1] == 1) & (X[:, 4] > 0.3)).astype(int)
+    y3 = np.digitize(X[:, 3] + 20 * X[:, 4], [10, 40])
+    models = [
+        ("RF 50 cây, 2 lớp", RandomForestClassifier(n_estimators=50, random_state=seed).fit(X, y2)),
+        ("RF 20 cây sâu 4, 3 lớp", RandomForestClassifier(n_estimators=20, max_depth=4, random_state=seed).fit(X, y3)),
+        ("RF có sample_weight", RandomForestClassifier(n_estimators=20, min_samples_leaf=5, random_state=seed)
+         .fit(X, y2, sample_weight=rng.uniform(0, 3, n))),
+        ("1 cây (model nhanh)", DecisionTreeClassifier(max_depth=8, random_state=seed).fit(X, y2)),
+    ]
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, model in models:
+            flat = FlatForest(compile_forest(model))
+            # Thêm hàng có giá trị đúng bằng ngưỡng chia của cây (ca dễ lệch nhánh nhất khi so float32/float64)
+            used = flat.threshold[flat.is_internal]
+            X_test = np.vstack([X[:500], np.tile(rng.choice(used, size=(200, 1)), (1, X.shape[1]))])
+            expected = model.predict_proba(X_test)
+            bundle = {"model": model, "features": [f"f{j}" for j in range(X.shape[1])], "feature_schema": "synthetic"}
+            save_flat(bundle, os.path.join(tmp, "m.npz"))
+            save_flat_dir(bundle, os.path.join(tmp, "m" + FLAT_DIR_SUFFIX))
+            print(f"-> {name}")
+            ok &= _check("compile_forest", expected, flat, X_test)
+            ok &= _check(".npz", expected, load_flat(os.path.join(tmp, "m.npz"))["model"], X_test)
+            ok &= _check(".flat/ (mmap)", expected, load_flat_dir(os.path.join(tmp, "m" + FLAT_DIR_SUFFIX))["model"],
+                         X_test)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Biên dịch RandomForest trong bundle joblib sang .npz phẳng")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("model")
+    p_export.add_argument("out", nargs="?")
+    p_export.add_argument("--mmap", action="store_true", help="Xuất thư mục .flat/ (nạp bằng mmap, dùng chung giữa các worker)")
+    p_check = sub.add_parser("check")
+    p_check.add_argument("model", nargs="+")
+    p_check.add_argument("--csv", default="dataset_hybrid_2026.csv")
+    # Kiểm tra khớp sklearn không cần model có sẵn: python flat_forest.py selftest
+    sub.add_parser("selftest")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        import joblib
+        if args.mmap:
+            out = args.out or os.path.splitext(args.model)[0] + FLAT_DIR_SUFFIX
+            save_flat_dir(joblib.load(args.model), out)
+            size = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out))
+        else:
+            out = args.out or os.path.splitext(args.model)[0] + ".npz"
+            save_flat(joblib.load(args.model), out)
+            size = os.path.getsize(out)
+        t0 = time.perf_counter()
+        load_bundle(args.model)
+        print(f"✅ Đã xuất {out} ({size / 1e6:.1f} MB, nạp lại mất {(time.perf_counter() - t0) * 1e3:.1f} ms)")
+    elif args.cmd == "selftest":
+        ok = verify_synthetic()
+        # Thêm model có sẵn trong repo (model_hybrid_2026_v11.joblib) trên dataset_hybrid_2026.csv nếu có
+        if os.path.exists("model_hybrid_2026_v11.joblib") and os.path.exists("dataset_hybrid_2026.csv"):
+            ok &= verify_parity("model_hybrid_2026_v11.joblib", "dataset_hybrid_2026.csv")
+        print("✅ Khớp với sklearn." if ok else "❌ Lệch so với sklearn!")
+        sys.exit(0 if ok else 1)
+    else:
+        ok = all([verify_parity(path, args.csv) for path in args.model])
+        print("✅ Khớp với sklearn." if ok else "❌ Lệch so với sklearn!")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,93 @@
-import pandas as pd
+import os
+import tempfile
 import numpy as np
+import pandas as pd
 import joblib
-import re
-import os
-import math
-from collections import Counter
-from urllib.parse import urlparse
-
-
-# --- 1. HÀM TOÁN HỌC ---
-def calculate_entropy(text):
-    if not text or not isinstance(text, str): return 0
-    counter = Counter(text)
-    length = len(text)
-    return -sum((count / length) * math.log2(count / length) for count in counter.values())
-
-
-# --- 2. BỘ TRÍCH XUẤT ĐẶC TRƯNG CHUẨN (KHỚP VỚI BẢNG GỐC) ---
-def extract_features_unified(url, is_ad_label):
-    url_str = str(url).lower()
-    parsed = urlparse(url_str)
-
-    # Tính toán các cột giống bảng 21k dòng của bạn
-    path_parts = [x for x in parsed.path.split('/') if x]
-
-    # Bóc tách kích thước (ví dụ: 1200x110)
-    dim_match = re.search(r'(\d+)x(\d+)', url_str)
-    width = int(dim_match.group(1)) if dim_match else 0
-    height = int(dim_match.group(2)) if dim_match else 0
-
-    # Phân loại request_type (rất quan trọng để cứu CSS/JS)
-    if any(url_str.endswith(x) for x in ['.css', '.scss']):
-        req_type = "style"
-    elif url_str.endswith('.js'):
-        req_type = "script"
-    elif any(url_str.endswith(x) for x in ['.png', '.jpg', '.gif', '.webp']):
-        req_type = "image"
-    else:
-        req_type = "other"
-
-    return {
-        "url": url_str,
-        "is_internal": 1 if "rophim.la" in parsed.netloc or not parsed.netloc else 0,  # Cứu main.css
-        "path_depth": len(path_parts),
-        "url_length": len(url_str),
-        "num_digits": sum(c.isdigit() for c in url_str),
-        "num_params": len(parsed.query.split('&')) if parsed.query else 0,
-        "width": width,
-        "height": height,
-        "aspect_ratio": round(width / height, 2) if height > 0 else 0,
-        "entropy": calculate_entropy(url_str),  # Đặc trưng bổ trợ cực mạnh
-        "has_ad_keyword": 1 if re.search(r'\b(ad|banner|bet|click|track|luxe|fun)\b', url_str) else 0,
-        "request_type": req_type,
-        "is_ad": is_ad_label  # Giữ nguyên nhãn gốc, không ép nhãn
-    }
+from colstore import ColumnStoreWriter, open_columns
+from features import SCHEMA_UNIFIED
+from features_vec import unified_frame
+from feature_store import cached_features, lineage_entry
+
+# Đọc CSV theo từng chunk -> bộ nhớ cố định dù dữ liệu crawl lên tới hàng triệu URL
+CHUNK_ROWS = 50000
+STORE_DIR = os.path.join("cache", "unified")
+
+# (file, cột URL, nhãn: tên cột trong file hoặc hằng số)
+SOURCES = [
+    ("dataset_hybrid_2026.csv", "url", "is_ad"),  # 21k dòng: lấy URL và nhãn gốc, tính lại đặc trưng
+    ("bet_ads_raw.csv", "target_url", 1),         # File crawl Bet: target_url luôn là ADS (1)
+    ("bet_ads_raw_2.csv", "target_url", 1),
+    ("bet_ads_raw_3.csv", "target_url", 1),
+]
+
+# Kiểu gọn cho từng cột số; request_type được one-hot luôn lúc ghi (giống pd.get_dummies, prefix 'req')
+COLUMN_DTYPES = {
+    "is_internal": np.uint8, "path_depth": np.int32, "url_length": np.int32, "num_digits": np.int32,
+    "num_params": np.int32, "width": np.int64, "height": np.int64, "aspect_ratio": np.float64,
+    "entropy": np.float64, "has_ad_keyword": np.uint8,
+}
+REQUEST_TYPES = ["image", "other", "script", "style"]
+
+
+def _to_dtype(values, dtype):
+    # width/height vượt int64 (chuỗi số dài trong URL) đến dưới dạng số nguyên Python -> kẹp về giới hạn của dtype
+    if values.dtype == object and np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        values = values.clip(info.min, info.max)
+    return values.to_numpy(dtype)
+
+
+def build_dataset(out_dir=STORE_DIR, chunk_rows=CHUNK_ROWS):
+    seen = set()  # hash 64-bit của (url, is_ad) đã ghi
+    with ColumnStoreWriter(out_dir) as writer:
+        for path, url_col, label in SOURCES:
+            if not os.path.exists(path):
+                continue
+            print(f"-> Đang xử lý file: {path}")
+            usecols = [url_col, label] if isinstance(label, str) else [url_col]
+            for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunk_rows):
+                labels = chunk[label].to_numpy() if isinstance(label, str) else label
+                feats = unified_frame(chunk[url_col], labels)
+
+                # Đặc trưng chỉ phụ thuộc URL nên bỏ trùng theo (url, is_ad) = drop_duplicates trên cả hàng
+                hashes = pd.util.hash_pandas_object(feats[['url', 'is_ad']], index=False).tolist()
+                keep = np.fromiter((h not in seen and not seen.add(h) for h in hashes), dtype=bool, count=len(hashes))
+                feats = feats[keep]
+
+                cols = {name: _to_dtype(feats[name], dtype) for name, dtype in COLUMN_DTYPES.items()}
+                for req_type in REQUEST_TYPES:
+                    cols[f"req_{req_type}"] = (feats['request_type'] == req_type).to_numpy(np.uint8)
+                cols["is_ad"] = feats['is_ad'].to_numpy(np.int64)
+                writer.append(cols)
+        writer.close(feature_schema=SCHEMA_UNIFIED)
+    print(f"-> Đã ghi {writer.rows} dòng (không trùng) vào {out_dir}")
+
+
+def load_dataset(store_dir=STORE_DIR):
+    cols, meta = open_columns(store_dir)
+    # pd.get_dummies chỉ sinh cột cho loại request có mặt trong dữ liệu -> bỏ cột req_* toàn 0 cho khớp
+    features = [c for c in meta['columns'] if c != 'is_ad' and not (c.startswith('req_') and not cols[c].any())]
+    X = pd.DataFrame({c: cols[c] for c in features})
+    y = np.asarray(cols['is_ad'])
+    return X, y
+
+
+def build_frame():
+    # Kho cột chỉ là bước trung gian (đọc CSV theo chunk, bộ nhớ cố định): feature_store giữ bản cache duy nhất,
+    # không để lại thêm 1 bản cùng dữ liệu trong cache/unified
+    with tempfile.TemporaryDirectory() as store_dir:
+        build_dataset(store_dir)
+        X, y = load_dataset(store_dir)
+        return X.assign(is_ad=np.array(y))
+
+
+def load_training_data():
+    # Cùng CSV + cùng schema -> nạp lại X/y từ cache (mmap), khỏi build lại kho cột
+    return cached_features("unified", [path for path, _, _ in SOURCES], SCHEMA_UNIFIED, build_frame)
 
 
 def main():
-    final_rows = []
-
-    # A. Nạp tập 21k dòng: Lấy URL và tính lại đặc trưng để đồng nhất
-    if os.path.exists("dataset_hybrid_2026.csv"):
-        print("-> Đang nạp và tính lại đặc trưng cho 21k dòng...")
-        df_old = pd.read_csv("dataset_hybrid_2026.csv")
-        # Chỉ lấy cột 'url' và 'is_ad' để tính lại
-        for _, r in df_old.iterrows():
-            final_rows.append(extract_features_unified(r['url'], r['is_ad']))
-
-    # B. Nạp 3 file crawl Bet: Dùng target_url làm Ads chính
-    for f in ["bet_ads_raw.csv", "bet_ads_raw_2.csv", "bet_ads_raw_3.csv"]:
-        if os.path.exists(f):
-            print(f"-> Đang xử lý file crawl: {f}")
-            df_raw = pd.read_csv(f)
-            for _, r in df_raw.iterrows():
-                # Link Bet luôn là ADS (1)
-                final_rows.append(extract_features_unified(r['target_url'], 1))
-
-    df = pd.DataFrame(final_rows).drop_duplicates()
-
-    # C. Tiền xử lý (One-hot encoding cho request_type)
-    df = pd.get_dummies(df, columns=['request_type'], prefix='req')
-
-    # Loại bỏ các cột không dùng để train (URL, Domain)
-    X = df.drop(columns=['url', 'is_ad'])
-    y = df['is_ad']
+    X, y = load_training_data()
 
     # Huấn luyện Random Forest
     from sklearn.ensemble import RandomForestClassifier
@@ -91,9 +95,12 @@ def main():
     clf.fit(X, y)
 
     # Lưu Model và tên cột Feature
-    joblib.dump({"model": clf, "features": X.columns.tolist()}, 'model_hybrid_2026.joblib')
+    # lineage: CSV nào, bao nhiêu dòng đã dùng -> retrain.py chỉ học thêm phần dòng mới
+    lineage = [lineage_entry("full", [path for path, _, _ in SOURCES], clf.n_estimators)]
+    joblib.dump({"model": clf, "features": X.columns.tolist(), "feature_schema": SCHEMA_UNIFIED, "lineage": lineage},
+                'model_hybrid_2026.joblib')
     print("✅ Đã huấn luyện xong Model V7 đồng nhất!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+import httpx
+import numpy as np
+import pandas as pd
+import psutil
+
+# ==============================================================================
+# ĐO TẢI CHO server.py (/check, /check_batch) VÀ 2026/server_29022026.py (/predict)
+# Phát lại URL thật trong CSV theo đúng thứ tự, N request đồng thời; chạy app ngay trong tiến trình
+# (--app, qua ASGITransport) hoặc bắn vào server đang chạy (--url). Kết quả ghi JSON để so giữa các lần đổi.
+# ==============================================================================
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# endpoint -> (CSV trace mặc định, app mặc định khi chạy trong tiến trình)
+ENDPOINTS = {
+    "/check": ("dataset_hybrid_2026.csv", "server:app"),
+    "/check_batch": ("dataset_hybrid_2026.csv", "server:app"),
+    "/predict": (os.path.join("2026", "dataset_hybrid_2026_advanced.csv"), "server_29022026:app"),
+}
+
+
+# --- 1. TRACE: mỗi phần tử là body JSON của 1 request ---
+def load_trace(endpoint, csv_path, batch_size=20, source_domain=""):
+    df = pd.read_csv(csv_path)
+    if endpoint == "/predict":
+        # Extension gửi các cột DOM thô; server tự tính cột phái sinh
+        return df.drop(columns=[c for c in ['url', 'domain', 'target_url', 'is_ad'] if c in df.columns]) \
+                 .select_dtypes(include='number').to_dict('records')
+    items = [{"url": url, "source_domain": source_domain} for url in df['url'].astype(str)]
+    if endpoint == "/check_batch":
+        return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    return items
+
+
+def load_app(spec, app_dir):
+    module_name, attr = spec.split(":")
+    for path in (app_dir, HERE, os.path.join(HERE, "2026")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+# --- 2. CPU: in-process thì đo chính tiến trình này; localhost thì đo các tiến trình đang nghe cổng ---
+def server_processes(port):
+    procs = {}
+    for conn in psutil.net_connections(kind="tcp"):
+        if conn.status == psutil.CONN_LISTEN and conn.laddr.port == port and conn.pid:
+            proc = psutil.Process(conn.pid)
+            for p in [proc] + proc.children(recursive=True):
+                procs[p.pid] = p
+    return list(procs.values())
+
+
+def cpu_seconds(procs):
+    total = 0.0
+    for p in procs:
+        try:
+            t = p.cpu_times()
+            total += t.user + t.system
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+# --- 3. CHẠY TẢI ---
+async def run_load(client, endpoint, trace, concurrency, total, start=0):
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            body = trace[(start + next_index) % len(trace)]
+            next_index += 1
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(endpoint, json=body)
+                failed = r.status_code != 200 or "error" in r.text
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - t0)
+            errors += failed
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies), errors
+
+
+async def bench(args):
+    endpoint = args.endpoint
+    csv_default, app_default = ENDPOINTS[endpoint]
+    trace = load_trace(endpoint, args.csv or os.path.join(HERE, csv_default), args.batch_size, args.source_domain)
+    total = args.requests or len(trace)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+        procs = server_processes(httpx.URL(args.url).port or 80)
+        if not procs:
+            print("⚠️ Không tìm thấy tiến trình server (thiếu quyền?), bỏ qua đo CPU")
+        measure_cpu = lambda: cpu_seconds(procs)
+        mode = "localhost"
+    else:
+        app = load_app(args.app or app_default, args.app_dir)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://inprocess", timeout=30)
+        procs = [psutil.Process()]
+        measure_cpu = time.process_time  # gồm cả phía client trong cùng tiến trình
+        mode = "in-process"
+
+    async with client:
+        # Khởi động (thread pool, page cache của model...), rồi đo tiếp từ chỗ dừng của trace
+        # để lượt đo không chỉ toàn URL vừa nằm sẵn trong verdict cache
+        warmup = min(args.warmup, total)
+        await run_load(client, endpoint, trace, args.concurrency, warmup)
+        cpu0, t0 = measure_cpu(), time.perf_counter()
+        latencies, errors = await run_load(client, endpoint, trace, args.concurrency, total, start=warmup)
+        wall, cpu = time.perf_counter() - t0, measure_cpu() - cpu0
+        model = await fetch_json(client, "/model")
+        stats = await fetch_json(client, "/stats")
+
+    ms = latencies * 1e3
+    items = total * args.batch_size if endpoint == "/check_batch" else total
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "mode": mode,
+        "target": args.url or (args.app or app_default),
+        "endpoint": endpoint,
+        "trace": os.path.basename(args.csv or csv_default),
+        "concurrency": args.concurrency,
+        "requests": total,
+        "urls": items,
+        "errors": int(errors),
+        "seconds": round(wall, 3),
+        "rps": round(total / wall, 1),
+        "urls_per_s": round(items / wall, 1),
+        "latency_ms": {"mean": round(ms.mean(), 3), "p50": round(np.percentile(ms, 50), 3),
+                       "p95": round(np.percentile(ms, 95), 3), "p99": round(np.percentile(ms, 99), 3),
+                       "max": round(ms.max(), 3)},
+        "cpu_ms_per_request": round(cpu * 1e3 / total, 3) if procs else None,
+        "model_version": (model or {}).get("version"),
+        "server_stats": stats,
+    }
+
+
+async def fetch_json(client, path):
+    try:
+        r = await client.get(path)
+        return r.json() if r.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- 4. SO SÁNH VỚI LẦN CHẠY TRƯỚC ---
+def compare(result, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"-> So với {baseline_path} (git {base.get('git')}):")
+    rows = [("rps", base["rps"], result["rps"])] + \
+           [(k, base["latency_ms"][k], result["latency_ms"][k]) for k in ("p50", "p95", "p99")]
+    if base.get("cpu_ms_per_request") and result.get("cpu_ms_per_request"):
+        rows.append(("cpu_ms/req", base["cpu_ms_per_request"], result["cpu_ms_per_request"]))
+    for name, old, new in rows:
+        print(f"   {name:<11}{old:>10.2f} -> {new:>10.2f}  ({(new - old) / old:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo req/s, p50/p95/p99 và CPU/request của server chặn quảng cáo")
+    parser.add_argument("--endpoint", choices=list(ENDPOINTS), default="/check")
+    parser.add_argument("--url", help="Server đang chạy, vd. http://127.0.0.1:8000 (bỏ trống = chạy app trong tiến trình)")
+    parser.add_argument("--app", help="module:app khi chạy trong tiến trình (mặc định theo endpoint)")
+    parser.add_argument("--app-dir", help="Thư mục chứa module app và file model")
+    parser.add_argument("--csv", help="CSV trace (mặc định theo endpoint)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, help="Số request (mặc định: 1 lượt toàn bộ trace)")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20, help="Số URL mỗi request /check_batch")
+    parser.add_argument("--source-domain", default="", help="source_domain gửi kèm /check")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench_results/<endpoint>-<thời gian>.json)")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+    if args.endpoint != "/check_batch":
+        args.batch_size = 1
+
+    if not args.url:
+        # app đọc file model theo đường dẫn tương đối -> chạy từ thư mục của nó
+        args.app_dir = os.path.abspath(args.app_dir or os.path.join(HERE, os.path.dirname(ENDPOINTS[args.endpoint][0])))
+        os.chdir(args.app_dir)
+    result = asyncio.run(bench(args))
+
+    lat = result["latency_ms"]
+    print(f"✅ {result['endpoint']} [{result['mode']}] c={result['concurrency']}: {result['requests']} request, "
+          f"{result['errors']} lỗi, {result['rps']} req/s | p50 {lat['p50']:.2f} ms, p95 {lat['p95']:.2f} ms, "
+          f"p99 {lat['p99']:.2f} ms | CPU {result['cpu_ms_per_request']} ms/request")
+
+    out = args.out or os.path.join(HERE, "bench_results",
+                                   f"{args.endpoint.strip('/')}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=1)
+    print(f"-> Đã ghi {out}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
+import os
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are written to PNG files instead of blocking on a window
 import seaborn as sns
 import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import classification_report, confusion_matrix
 import joblib
+from joblib import Parallel, delayed
 import time
-import numpy as np
+from corpus import load_ad_data
+
+# Number of CPU cores for training and cross-validation (-1 = all cores)
+N_JOBS = int(os.environ.get("N_JOBS", -1))
+# Fold results are cached on disk: same data + same params -> reruns skip the 5 fits
+memory = joblib.Memory(os.environ.get("CV_CACHE_DIR", os.path.join("cache", "cv")), verbose=0)
+# Figures from each run go here (git-ignored), so the tracked dataset1_*.png baselines are never overwritten
+FIGURE_DIR = os.environ.get("FIGURE_DIR", "figures")
 
 
 # --- 1. FUNCTION: LOAD AND CLEAN DATA ---
@@ -15,42 +29,36 @@ def load_and_clean_data(filepath="ad.data"):
     start_time = time.time()
 
     try:
-        # low_memory=False prevents warnings due to mixed types (numbers and '?')
-        df = pd.read_csv(filepath, header=None, low_memory=False)
+        # First run converts ad.data into cache/corpus (dense block + CSR), later runs only mmap it
+        dense, binary, labels, has_missing, meta = load_ad_data(filepath)
     except FileNotFoundError:
         print(f"ERROR: File '{filepath}' not found. Please download it first.")
         return None
 
-    # Rename the last column (1558) to 'label'
-    df.rename(columns={1558: "label"}, inplace=True)
-
-    # Handle missing values ("?")
-    # Replace "?" with NaN and then drop those rows
-    # Using regex replacement is faster than iterating with a for-loop
-    df = df.replace(to_replace='[?]', value=np.nan, regex=True)
-
-    initial_len = len(df)
-    df.dropna(inplace=True)
-    final_len = len(df)
+    # Drop rows containing "?" (same rows the dense pipeline removed with dropna)
+    keep = ~np.asarray(has_missing, dtype=bool)
+    initial_len, final_len = len(keep), int(keep.sum())
 
-    # Convert feature columns to numeric (float)
-    # Exclude the label column (last one)
-    feature_cols = df.columns[:-1]
-    df[feature_cols] = df[feature_cols].apply(pd.to_numeric)
+    # 1558 features in the original column order: height/width/aratio/local stay dense,
+    # the 1554 url*/origurl*/alt*/caption* columns are ~99% zeros and stay sparse.
+    # float32 is the dtype the trees use, so no dtype cast. fit() still builds its own CSC copy of the rows it
+    # trains on (tree splits scan columns); CSR is kept here for cheap row slicing in the CV folds and predict().
+    X = sparse.hstack([sparse.csr_matrix(np.asarray(dense)[keep]), binary[keep]], format="csr", dtype=np.float32)
+    y = np.asarray(labels)[keep].astype(int)
 
+    dense_mb = X.shape[0] * X.shape[1] * 8 / 1e6
+    sparse_mb = (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1e6
     print(f"   -> Removed {initial_len - final_len} rows containing errors/missing values.")
+    print(f"   -> Matrix {X.shape}, {X.nnz} non-zeros: {sparse_mb:.2f} MB sparse vs {dense_mb:.2f} MB dense.")
     print(f"   -> Processing time: {time.time() - start_time:.2f} seconds.")
-    return df
+    return X, y
 
 
 # --- 2. FUNCTION: PREPARE DATA ---
-def prepare_data(df):
+def prepare_data(data):
     print("\n[2/6] Splitting Train/Test sets...")
 
-    df["label"] = df["label"].apply(lambda x: 1 if str(x).strip() == "ad." else 0)
-
-    X = df.drop("label", axis=1).values
-    y = df["label"].values
+    X, y = data
 
     # ✅ Giữ đúng như sách: default 75/25, không set random_state
     X_train, X_test, y_train, y_test = train_test_split(X, y)
@@ -62,22 +70,46 @@ def prepare_data(df):
 def train_model(X_train, y_train):
     print("\n[3/6] Training Random Forest Classifier...")
 
-    # ✅ Giữ đúng như sách: không set n_estimators, không set random_state
-    clf = RandomForestClassifier()
+    # ✅ Giữ đúng như sách: không set n_estimators, không set random_state (chỉ thêm n_jobs)
+    clf = RandomForestClassifier(n_jobs=N_JOBS)
     clf.fit(X_train, y_train)
     return clf
 
 # --- 4. FUNCTION: EVALUATE MODEL (CROSS-VALIDATION) ---
-def evaluate_model(clf, X_train, y_train, X_test, y_test):
+def _fit_fold(params, X, y, train_idx, test_idx):
+    fold_clf = RandomForestClassifier(**params).fit(X[train_idx], y[train_idx])
+    return fold_clf.predict(X[test_idx])
+
+
+@memory.cache(ignore=["n_jobs"])
+def cross_validate_oof(params, X, y, n_splits=5, n_jobs=N_JOBS):
+    # Same folds as cross_val_score(cv=5); every row is predicted once by a model that never saw it
+    folds = list(StratifiedKFold(n_splits).split(X, y))
+    preds = Parallel(n_jobs=n_jobs)(delayed(_fit_fold)(params, X, y, train_idx, test_idx)
+                                    for train_idx, test_idx in folds)
+    y_oof = np.empty_like(y)
+    scores = []
+    for (_, test_idx), pred in zip(folds, preds):
+        y_oof[test_idx] = pred
+        scores.append(np.mean(pred == y[test_idx]))
+    return np.array(scores), y_oof
+
+
+def evaluate_model(clf, X, y, X_test, y_test):
     print("\n[4/6] Evaluating model performance...")
 
     # 1. Score on Test Set
     score = clf.score(X_test, y_test)
     print(f"   -> Test Set Accuracy: {score * 100:.2f}%")
 
-    # 2. Cross-Validation (5-Fold)
+    # 2. Cross-Validation (5-Fold) on all cleaned rows: unlike the random train/test split they are
+    # the same on every run, so the cached fold results stay valid.
+    # Folds run in parallel; each fold's forest uses 1 core so workers don't oversubscribe the CPU.
     print("   -> Running 5-Fold Cross-Validation...")
-    cv_scores = cross_val_score(clf, X_train, y_train, cv=5)
+    start_time = time.time()
+    params = clone(clf).set_params(n_jobs=1).get_params()
+    cv_scores, y_oof = cross_validate_oof(params, X, y, n_splits=5, n_jobs=N_JOBS)
+    print(f"   -> Cross-validation time: {time.time() - start_time:.2f} seconds.")
 
     # 3. Create a DataFrame for the Cross-Validation Report
     table_data = []
@@ -112,23 +144,24 @@ def evaluate_model(clf, X_train, y_train, X_test, y_test):
     df_cv_report.to_csv(output_filename, index=False)
     print(f"   -> Report exported to: '{output_filename}'")
 
-    return cv_scores, mean_score, std_score
+    return cv_scores, mean_score, std_score, y_oof
 
 
 # --- 5. FUNCTION: GENERATE DETAILED REPORT ---
-def detailed_report(clf, X_test, y_test):
+def detailed_report(y, y_oof):
     print("\n[5/6] Generating detailed classification report...")
-    y_pred = clf.predict(X_test)
-
-    print("\n--- Classification Report ---")
-    print(classification_report(y_test, y_pred, target_names=["Non-Ad", "Ad"]))
 
-    return y_pred
+    # Out-of-fold predictions from step 4: no extra predict pass
+    print("\n--- Classification Report (5-fold out-of-fold) ---")
+    print(classification_report(y, y_oof, target_names=["Non-Ad", "Ad"], zero_division=0))
 
 
 # --- 6. FUNCTION: VISUALIZE RESULTS ---
-def visualize_results(clf, y_test, y_pred, cv_scores, cv_mean):
+def visualize_results(clf, y, y_oof, cv_scores, cv_mean):
     print("\n[6/6] Visualizing results...")
+    os.makedirs(FIGURE_DIR, exist_ok=True)
+    cm_path = os.path.join(FIGURE_DIR, "dataset1_confusion_matrix.png")
+    importance_path = os.path.join(FIGURE_DIR, "dataset1_feature_importance.png")
 
     # Setup the figure with 2 subplots (Bar Chart + Confusion Matrix)
     plt.figure(figsize=(14, 6))
@@ -155,16 +188,17 @@ def visualize_results(clf, y_test, y_pred, cv_scores, cv_mean):
 
     # --- CHART 2: Confusion Matrix ---
     plt.subplot(1, 2, 2)
-    cm = confusion_matrix(y_test, y_pred)
+    cm = confusion_matrix(y, y_oof)
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
                 xticklabels=["Non-Ad (Predicted)", "Ad (Predicted)"],
                 yticklabels=["Non-Ad (Actual)", "Ad (Actual)"])
-    plt.title('Confusion Matrix')
+    plt.title('Confusion Matrix (out-of-fold)')
     plt.ylabel('Actual Label')
     plt.xlabel('Predicted Label')
 
     plt.tight_layout()
-    plt.show()
+    plt.savefig(cm_path, dpi=300, bbox_inches='tight')
+    plt.close()
 
     # --- CHART 3: Feature Importance (Separate Figure) ---
     plt.figure(figsize=(10, 6))
@@ -178,29 +212,32 @@ def visualize_results(clf, y_test, y_pred, cv_scores, cv_mean):
     plt.xlabel("Feature Index")
     plt.ylabel("Importance Score")
     plt.tight_layout()
-    plt.show()
+    plt.savefig(importance_path, dpi=300, bbox_inches='tight')
+    plt.close()
+    print(f"   -> Figures saved: '{cm_path}', '{importance_path}'")
 
 
 # --- MAIN FUNCTION ---
 def main():
     # 1. Load Data
-    df = load_and_clean_data("ad.data")
-    if df is None: return
+    data = load_and_clean_data("ad.data")
+    if data is None: return
 
     # 2. Prepare Data
-    X_train, X_test, y_train, y_test = prepare_data(df)
+    X_train, X_test, y_train, y_test = prepare_data(data)
 
     # 3. Train Model
     clf = train_model(X_train, y_train)
 
     # 4. Evaluate (Cross Validation & Export Table)
-    cv_scores, cv_mean, cv_std = evaluate_model(clf, X_train, y_train, X_test, y_test)
+    X, y = data
+    cv_scores, cv_mean, cv_std, y_oof = evaluate_model(clf, X, y, X_test, y_test)
 
     # 5. Detailed Report
-    y_pred = detailed_report(clf, X_test, y_test)
+    detailed_report(y, y_oof)
 
     # 6. Visualize
-    visualize_results(clf, y_test, y_pred, cv_scores, cv_mean)
+    visualize_results(clf, y, y_oof, cv_scores, cv_mean)
 
     # 7. Save Model
     print("\nSaving model...")
@@ -0,0 +1,189 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+
+# ==============================================================================
+# METRICS DẠNG PROMETHEUS (GET /metrics) + LOG LẤY MẪU, GHI Ở LUỒNG NỀN
+# Không phụ thuộc prometheus_client: counter/histogram tối giản, xuất đúng text format 0.0.4.
+# ==============================================================================
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Giây: đủ mịn cho từng bước vài µs (urlparse, entropy) tới cả request vài trăm ms
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Bộ đếm tăng dần, tách theo nhãn."""
+
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()  # có thể được gọi từ thread pool suy luận
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_label_str(self.labels, key)} {value}" for key, value in items]
+        return lines
+
+
+class Histogram:
+    """Histogram theo bucket cố định (mặc định là giây), tách theo nhãn."""
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # nhãn -> [đếm theo bucket..., +Inf], tổng
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self, **labels):
+        # (số lần quan sát theo từng bucket, ô cuối là +Inf; tổng giá trị) của 1 bộ nhãn, không cộng dồn
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            return (list(state[0]), state[1]) if state else ([0] * (len(self.buckets) + 1), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        names = self.labels + ("le",)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist, labels):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+
+
+class Gauge:
+    """Giá trị tức thời đọc lúc scrape (kích thước cache, số lần nạp model...)."""
+
+    def __init__(self, name, doc, fn):
+        self.name, self.doc, self.fn = name, doc, fn
+
+    def render(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn()}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        # Import lại module (vd. TestClient + reload) -> dùng lại metric cũ thay vì khai báo trùng tên
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def gauge(self, name, doc, fn):
+        # Gauge đọc qua callback: khai báo lại thì trỏ sang callback mới
+        self._metrics[name] = Gauge(name, doc, fn)
+        return self._metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Dùng chung cho cả 2 server
+REQUESTS = REGISTRY.counter("adblock_requests_total", "Số request theo endpoint", ["endpoint"])
+VERDICTS = REGISTRY.counter("adblock_verdicts_total", "Số kết luận theo loại (ad = chặn)", ["endpoint", "verdict"])
+HEURISTIC_HITS = REGISTRY.counter("adblock_heuristic_hits_total", "Kết luận bằng luật, không qua model", ["rule"])
+CACHE_HITS = REGISTRY.counter("adblock_cache_hits_total", "Kết quả lấy từ verdict cache", ["endpoint"])
+ERRORS = REGISTRY.counter("adblock_errors_total", "Số lỗi theo endpoint", ["endpoint"])
+REQUEST_SECONDS = REGISTRY.histogram("adblock_request_seconds", "Thời gian xử lý cả request", ["endpoint"])
+STAGE_SECONDS = REGISTRY.histogram("adblock_stage_seconds", "Thời gian từng bước xử lý", ["stage"])
+
+
+def stage(name):
+    # with stage("features"): ... -> ghi vào adblock_stage_seconds{stage="features"}
+    return STAGE_SECONDS.time(stage=name)
+
+
+# --- LOG: lấy mẫu + ghi qua hàng đợi (luồng nền ghi stdout, hot path chỉ put vào queue) ---
+LOG_SAMPLE = float(os.environ.get("LOG_SAMPLE", 0.01))
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return _listener.queue
+
+
+class SampledLogger:
+    """Chỉ ghi khoảng `rate` phần số dòng log ở hot path; chuỗi chỉ được format khi dòng đó được ghi."""
+
+    def __init__(self, name, rate=LOG_SAMPLE):
+        self.rate = rate
+        self.logger = logging.getLogger(name)
+        if not self.logger.handlers:
+            self.logger.addHandler(logging.handlers.QueueHandler(_start_listener()))
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+
+    def info(self, msg, *args):
+        if self.rate >= 1 or random.random() < self.rate:
+            self.logger.info(msg, *args)
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from features import check_bundle
+from feature_store import file_digest
+from feature_vector import FeatureVectorizer, predict_proba
+from flat_forest import FlatForest, compile_forest, flat_paths, load_bundle
+from metrics import REGISTRY, stage
+
+# Chu kỳ kiểm tra file model (giây); 0 = tắt watcher, chỉ reload qua POST /admin/reload (cần ADMIN_TOKEN)
+DEFAULT_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 2))
+
+# Chạy forest trong thread pool riêng thay vì ngay trong async def -> event loop vẫn nhận request khác.
+# NumPy/sklearn/onnxruntime nhả GIL khi tính nên nhiều luồng chạy song song được thật.
+# Mặc định chia đều số core cho các worker uvicorn (WEB_CONCURRENCY, serve.py tự đặt) -> tổng số luồng = số core
+INFER_THREADS = int(os.environ.get("INFER_THREADS",
+                                   max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get("WEB_CONCURRENCY", 1))))))
+_infer_pool = ThreadPoolExecutor(max_workers=INFER_THREADS, thread_name_prefix="infer")
+
+# Model nhanh (fast_tier.py) nằm cạnh model chính: chấm trước, chỉ đẩy xác suất trong dải không chắc lên forest đầy đủ.
+# FAST_TIER=0 để tắt cascade.
+FAST_TIER = os.environ.get("FAST_TIER", "1") != "0"
+FAST_SUFFIX = ".fast.joblib"
+CASCADE_ROWS = REGISTRY.counter("adblock_cascade_rows_total",
+                                "Số dòng theo tầng kết luận (fast = model nhanh, full = đẩy lên forest đầy đủ)", ["tier"])
+
+
+def fast_tier_path(model_path):
+    return os.path.splitext(model_path)[0] + FAST_SUFFIX
+
+
+class ActiveModel:
+    """Ảnh chụp model đang phục vụ; request lấy 1 lần rồi dùng đến hết, không bị đổi giữa chừng."""
+
+    def __init__(self, bundle, features, version, loaded_at):
+        self.model = bundle['model']
+        self.features = features
+        self.vectorizer = FeatureVectorizer(features)
+        self.schema = bundle.get('feature_schema')
+        self.version = version
+        self.loaded_at = loaded_at
+        self.fast = None  # FlatForest của model nhanh
+        self.band = None  # (low, high): xác suất nằm giữa 2 mốc này mới đẩy lên forest đầy đủ
+        self.fast_info = None
+
+    def attach_fast(self, bundle):
+        self.fast = FlatForest(compile_forest(bundle['model']))
+        self.band = (bundle['cascade']['low'], bundle['cascade']['high'])
+        self.fast_info = {**bundle.get('fast_tier', {}), **bundle['cascade']}
+
+    def predict_proba(self, X):
+        return predict_proba(self.model, X)
+
+    def score(self, rows):
+        # Ma trận mới cho mỗi lần gọi (không dùng buffer chung của vectorizer.row) -> an toàn khi nhiều luồng chạy
+        with stage("vectorize"):
+            X = self.vectorizer.matrix(rows)
+        if self.fast is None:
+            with stage("predict"):
+                return self.predict_proba(X)[:, 1]
+        with stage("predict_fast"):
+            probs = self.fast.predict_proba(X)[:, 1]
+        low, high = self.band
+        uncertain = np.flatnonzero((probs > low) & (probs < high))
+        if len(uncertain):
+            with stage("predict"):
+                probs[uncertain] = self.predict_proba(X[uncertain])[:, 1]
+        CASCADE_ROWS.inc(len(probs) - len(uncertain), tier="fast")
+        CASCADE_ROWS.inc(len(uncertain), tier="full")
+        return probs
+
+    async def score_async(self, rows):
+        return await asyncio.get_running_loop().run_in_executor(_infer_pool, self.score, rows)
+
+
+class ModelRegistry:
+    """Nạp + kiểm tra bundle mới ở luồng nền rồi đổi model đang chạy trong 1 phép gán (không restart uvicorn)."""
+
+    def __init__(self, path, schema_id, loader=load_bundle, smoke_rows=(), watch_paths=None):
+        self.path = path
+        self.schema_id = schema_id
+        self.loader = loader
+        self.smoke_rows = list(smoke_rows)
+        # load_bundle ưu tiên bản biên dịch (.flat/, .npz) cạnh file joblib -> theo dõi cả chúng
+        self.watch_paths = watch_paths or [path] + [stamp for _, stamp, _ in flat_paths(path)]
+        self.fast_path = fast_tier_path(path) if FAST_TIER else None
+        if self.fast_path:
+            self.watch_paths = self.watch_paths + [self.fast_path]
+        self.active = None
+        self.reloads = 0
+        self.last_error = None
+        self.fast_error = None
+        self._on_swap = []
+        self._reload_lock = threading.Lock()  # mỗi lúc chỉ 1 lần nạp
+        self._signature = None
+        self._watcher = None
+
+    def on_swap(self, callback):
+        # vd. xóa verdict cache: kết quả của model cũ không còn đúng
+        self._on_swap.append(callback)
+
+    def _file_signature(self):
+        return tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) if os.path.exists(p) else None
+                     for p in self.watch_paths)
+
+    def _version(self):
+        h = hashlib.sha256()
+        for p in self.watch_paths:
+            if os.path.exists(p):
+                with open(p, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        h.update(block)
+        return h.hexdigest()[:12]
+
+    @staticmethod
+    def _smoke_check(model, X):
+        # Chạy thử 1 batch nhỏ: lỗi, sai shape hay xác suất ngoài [0, 1] thì không được lên phục vụ
+        probs = np.asarray(model.predict_proba(X))
+        if probs.shape != (len(X), 2) or not np.all(np.isfinite(probs)) or probs.min() < 0 or probs.max() > 1:
+            raise ValueError(f"Smoke test thất bại: predict_proba trả về shape {probs.shape}")
+
+    def _smoke_test(self, candidate):
+        self._smoke_check(candidate, candidate.vectorizer.matrix(self.smoke_rows or [{}]))
+
+    def _attach_fast_tier(self, candidate):
+        # Model nhanh chỉ là tầng phụ: cũ, lệch cột hay lỗi thì ghi fast_error rồi chạy riêng forest đầy đủ,
+        # không bao giờ chặn model chính lên phục vụ
+        self.fast_error = None
+        if not self.fast_path or not os.path.exists(self.fast_path):
+            return
+        try:
+            import joblib
+            bundle = joblib.load(self.fast_path)
+            # Kiểm tra bản model chính trước cột đặc trưng: retrain đổi cột thì file .fast cũ vẫn nằm cạnh
+            # cho tới khi chạy lại fast_tier.py -> báo "cũ" chứ không phải "lệch cột"
+            teacher = os.path.splitext(self.path)[0] + ".joblib"
+            expected = bundle.get('fast_tier', {}).get('teacher_sha256')
+            if os.path.exists(teacher) and expected and file_digest(teacher) != expected:
+                raise ValueError(f"được tạo từ bản {os.path.basename(teacher)} cũ, hãy chạy lại fast_tier.py")
+            if check_bundle(bundle, self.schema_id) != candidate.features:
+                raise ValueError("dùng cột đặc trưng khác model chính, hãy chạy lại fast_tier.py")
+            candidate.attach_fast(bundle)
+            self._smoke_check(candidate.fast, candidate.vectorizer.matrix(self.smoke_rows or [{}]))
+        except Exception as e:
+            candidate.fast = candidate.band = candidate.fast_info = None
+            self.fast_error = f"{self.fast_path}: {type(e).__name__}: {e}"
+            print(f"⚠️ Bỏ qua model nhanh, chỉ dùng forest đầy đủ: {self.fast_error}")
+
+    def reload(self):
+        with self._reload_lock:
+            signature = self._file_signature()
+            try:
+                bundle = self.loader(self.path)
+                features = check_bundle(bundle, self.schema_id)
+                candidate = ActiveModel(bundle, features, self._version(),
+                                        datetime.now().isoformat(timespec="seconds"))
+                self._smoke_test(candidate)
+                self._attach_fast_tier(candidate)
+            except Exception as e:
+                # Giữ nguyên model đang chạy, ghi lại lỗi để /model hiển thị
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._signature = signature
+                raise
+            self.active = candidate  # đổi nguyên tử: request mới thấy model mới, request cũ dùng nốt model cũ
+            self._signature = signature
+            self.last_error = None
+            self.reloads += 1
+        for callback in self._on_swap:
+            callback()
+        return self.info()
+
+    def start_watcher(self, interval=DEFAULT_WATCH_INTERVAL):
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        pending = None
+        while True:
+            time.sleep(interval)
+            signature = self._file_signature()
+            if signature == self._signature:
+                pending = None
+                continue
+            # Chờ file đứng yên qua 2 lần kiểm tra (tránh nạp file đang ghi dở)
+            if signature != pending:
+                pending = signature
+                continue
+            pending = None
+            try:
+                self.reload()
+                print(f"-> Đã nạp model mới {self.active.version} từ {self.path}")
+            except Exception as e:
+                print(f"-> Model mới bị từ chối, giữ model cũ: {e}")
+
+    def info(self):
+        active = self.active
+        return {
+            "path": self.path,
+            "schema": self.schema_id,
+            "version": active.version if active else None,
+            "loaded_at": active.loaded_at if active else None,
+            "features": active.features if active else None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "fast_tier": active.fast_info if active else None,
+            "fast_tier_error": self.fast_error,
+        }
@@ -0,0 +1,31 @@
+import json
+import numpy as np
+import onnxruntime as rt
+
+
+class OnnxPredictor:
+    """Chạy model ONNX (xuất bằng 2026/export_onnx.py) qua onnxruntime, cùng giao diện predict_proba như sklearn."""
+
+    def __init__(self, onnx_path, intra_op_threads=1):
+        opts = rt.SessionOptions()
+        # Request đơn lẻ: 1 luồng cho mỗi lần chạy nhanh hơn là chia nhỏ cây cho nhiều luồng
+        opts.intra_op_num_threads = intra_op_threads
+        self.session = rt.InferenceSession(onnx_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.feature_names = json.loads(meta["features"]) if "features" in meta else None
+        self.feature_schema = meta.get("feature_schema")
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return self.session.run(["probabilities"], {self.input_name: X})[0]
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return self.session.run(["label"], {self.input_name: X})[0]
+
+
+def load_onnx_bundle(onnx_path):
+    predictor = OnnxPredictor(onnx_path)
+    return {"model": predictor, "features": predictor.feature_names, "feature_names": predictor.feature_names,
+            "feature_schema": predictor.feature_schema}
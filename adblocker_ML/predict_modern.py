@@ -1,46 +1,9 @@
 import joblib
 import pandas as pd
-import math
-import re
-from urllib.parse import urlparse
-from collections import Counter
+from features import SCHEMA_FINAL, check_bundle, extract_features_final
 
 
-# --- 1. HÀM TRÍCH XUẤT ĐẶC TRƯNG CHUẨN (PHẢI GIỐNG HỆT FILE TRAIN) ---
-def calculate_entropy(text):
-    if not text or not isinstance(text, str): return 0
-    counter = Counter(text)
-    length = len(text)
-    return -sum((count / length) * math.log2(count / length) for count in counter.values())
-
-
-def extract_features_final(url, target_url):
-    # Ưu tiên Target URL vì chứa domain cá cược, nếu không có thì dùng URL ảnh
-    url_str = str(target_url).lower() if pd.notna(target_url) and str(target_url) != "" else str(url).lower()
-    parsed = urlparse(url_str)
-
-    # CỨU TINH 1: Đặc trưng tĩnh (CSS, JS, Font thường là SẠCH)
-    is_static_asset = 1 if any(url_str.endswith(ext) for ext in ['.css', '.js', '.woff', '.ttf']) else 0
-
-    # CỨU TINH 2: Whitelist nội bộ (Nếu thuộc domain rophim.la thì ưu tiên SẠCH)
-    is_internal = 1 if "rophim.la" in parsed.netloc or not parsed.netloc else 0
-
-    # Keyword: Sử dụng Regex để tránh bắt nhầm 'uploads' hay 'assets'
-    keywords = r'\b(ad|banner|bet|click|track|pop|luxe|fun|tx88|789club)\b'
-    has_ad_keyword = 1 if re.search(keywords, url_str) else 0
-
-    return {
-        "is_internal": is_internal,
-        "is_static_asset": is_static_asset,
-        "url_length": len(url_str),
-        "num_params": len(parsed.query.split('&')) if parsed.query else 0,
-        "path_depth": len([x for x in parsed.path.split('/') if x]),
-        "entropy": calculate_entropy(url_str),
-        "has_ad_keyword": has_ad_keyword
-    }
-
-
-# --- 2. QUY TRÌNH KIỂM THỬ 10 CASES ---
+# --- 1. QUY TRÌNH KIỂM THỬ 10 CASES ---
 def test_ai():
     test_cases = [
         {"url": "img.gif", "target": "https://tx88.fun/?a=123", "label": 1},
@@ -60,7 +23,8 @@ def test_ai():
         # Nhớ đổi tên file khớp với file bạn đã lưu khi Train
         model_pkg = joblib.load('model_hybrid_2026.joblib')
         clf = model_pkg['model']
-        feature_names = model_pkg['features']
+        # Model train bằng bộ đặc trưng khác (vd. latest_trainer.py ghi cùng tên file) thì báo lỗi luôn
+        feature_names = check_bundle(model_pkg, SCHEMA_FINAL)
     except Exception as e:
         print(f"LỖI: {e}")
         return
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# CÂN BẰNG LỚP KHÔNG NHÂN BẢN DÒNG
+# - balance_weights(): sample_weight thay cho nhân bản dòng (x50) -> tập train giữ nguyên kích thước
+# - synth_frame(): sinh mẫu giả theo spec, mỗi cột đúng 1 lần gọi Generator có seed (thay list dict từng dòng)
+# ==============================================================================
+
+
+def balance_weights(y, boost=None):
+    # Trọng số mỗi dòng = n / (số lớp * n_lớp) như class_weight='balanced' -> tổng trọng số các lớp bằng nhau.
+    # boost={lớp: hệ số} để ưu tiên thêm 1 lớp (vd. {1: 2.0} = quảng cáo nặng gấp đôi sau khi đã cân bằng)
+    y = np.asarray(y)
+    classes, inverse = np.unique(y, return_inverse=True)
+    per_class = len(y) / (len(classes) * np.bincount(inverse))
+    for label, factor in (boost or {}).items():
+        per_class[classes == label] *= factor
+    return per_class[inverse]
+
+
+# Mỗi cột trong spec là 1 trong các dạng:
+#   hằng số                          -> cả cột bằng giá trị đó
+#   ("integers", lo, hi)             -> số nguyên trong [lo, hi) (như np.random.randint)
+#   ("uniform", lo, hi)              -> số thực trong [lo, hi)
+#   ("choice", giá_trị, xác_suất)    -> chọn theo xác suất
+def synth_frame(spec, n, seed=42):
+    rng = np.random.default_rng(seed)
+    cols = {}
+    for name, rule in spec.items():
+        if not isinstance(rule, tuple):
+            cols[name] = np.full(n, rule)
+            continue
+        kind, *args = rule
+        if kind == "integers":
+            cols[name] = rng.integers(args[0], args[1], size=n)
+        elif kind == "uniform":
+            cols[name] = rng.uniform(args[0], args[1], size=n)
+        elif kind == "choice":
+            cols[name] = rng.choice(args[0], size=n, p=args[1] if len(args) > 1 else None)
+        else:
+            raise ValueError(f"Không hỗ trợ luật sinh '{kind}' cho cột '{name}'")
+    return pd.DataFrame(cols)
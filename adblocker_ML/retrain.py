@@ -0,0 +1,179 @@
+import argparse
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from features import SCHEMA_FINAL, SCHEMA_UNIFIED, SCHEMA_V26, bundle_features
+from features_vec import final_frame, unified_frame, v26_frame
+from corpus import read_table
+from feature_store import lineage_entry
+from rebalance import balance_weights
+
+# ==============================================================================
+# HỌC THÊM (warm_start) TỪ CÁC DÒNG CRAWL MỚI, KHÔNG TRAIN LẠI TỪ ĐẦU
+# Giữ nguyên các cây cũ, thêm vài cây mới train trên: dòng mới + một phần dữ liệu cũ (replay, chống quên).
+# lineage trong bundle cho biết mỗi CSV đã dùng tới dòng nào -> lần sau chỉ lấy phần crawler nối thêm.
+# ==============================================================================
+# schema của bundle -> trainer gốc (base_frame/crawl_frame phải tính đặc trưng đúng như trainer đó)
+TRAINERS = {SCHEMA_V26: "trainer_v8", SCHEMA_UNIFIED: "latest_trainer", SCHEMA_FINAL: "new_trainer"}
+# File có nhãn gốc của các trainer; các file còn lại trong lineage là file crawl (luôn là ADS)
+BASE_DATASET = "dataset_hybrid_2026.csv"
+
+
+def base_frame(schema_id, raw):
+    # Đặc trưng cho dòng của dataset_hybrid_2026.csv, đúng như trainer gốc
+    if schema_id == SCHEMA_V26:
+        return v26_frame(raw['url'], 0)  # trainer_v8 chỉ lấy mẫu sạch từ file này
+    if schema_id == SCHEMA_UNIFIED:
+        return pd.get_dummies(unified_frame(raw['url'], raw['is_ad'].to_numpy()), columns=['request_type'],
+                              prefix='req')
+    if schema_id == SCHEMA_FINAL:
+        return final_frame(raw['url']).assign(is_ad=raw['is_ad'].to_numpy())
+    raise ValueError(f"Chưa hỗ trợ học thêm cho bộ đặc trưng '{schema_id}'")
+
+
+def crawl_frame(schema_id, raw):
+    # Đặc trưng cho dòng mới của bet_ads_raw*.csv, đúng như trainer gốc xử lý file crawl (luôn là ADS)
+    if schema_id == SCHEMA_V26:
+        return v26_frame(raw['target_url'], 1)
+    if schema_id == SCHEMA_UNIFIED:
+        return pd.get_dummies(unified_frame(raw['target_url'], 1), columns=['request_type'], prefix='req')
+    if schema_id == SCHEMA_FINAL:
+        return final_frame(raw['url'], raw['target_url']).assign(is_ad=1)
+    raise ValueError(f"Chưa hỗ trợ học thêm cho bộ đặc trưng '{schema_id}'")
+
+
+def consumed_rows(lineage, file_name):
+    # Lần gần nhất file này xuất hiện trong lineage
+    rows = 0
+    for entry in lineage:
+        for src in entry["sources"]:
+            if src["file"] == file_name:
+                rows = src["rows"]
+    return rows
+
+
+def base_rows(lineage):
+    # trainer_v8 chỉ học 1 mẫu dòng sạch của BASE_DATASET: vị trí các dòng đó ghi trong lineage
+    for entry in reversed(lineage):
+        if "base_rows" in entry:
+            return entry["base_rows"]
+    return None
+
+
+def replay_frame(schema_id, lineage, n, seed=42):
+    # Chỉ lấy trong các dòng model đã học (n dòng đầu mỗi file theo lineage): dòng crawler mới nối thêm
+    # không bị trộn vào như "dữ liệu cũ" (tính 2 lần), và chỉ tính đặc trưng cho đúng các dòng được chọn
+    learned = []
+    for file_name in dict.fromkeys(src["file"] for entry in lineage for src in entry["sources"]):
+        rows = consumed_rows(lineage, file_name)
+        if not rows or not os.path.exists(file_name):
+            continue
+        raw = read_table(file_name).iloc[:rows]
+        if file_name == BASE_DATASET and schema_id == SCHEMA_V26:
+            sampled = base_rows(lineage)
+            if sampled is None:
+                print(f"⚠️ lineage không ghi base_rows (bundle cũ) -> không replay {file_name}")
+                continue
+            raw = raw.iloc[sampled]
+        learned.append((file_name, raw))
+    total = sum(len(raw) for _, raw in learned)
+    picks = np.sort(np.random.default_rng(seed).choice(total, size=min(n, total), replace=False))
+    frames = []
+    offset = 0
+    for file_name, raw in learned:
+        local = picks[(picks >= offset) & (picks < offset + len(raw))] - offset
+        offset += len(raw)
+        if len(local):
+            build = base_frame if file_name == BASE_DATASET else crawl_frame
+            frames.append(build(schema_id, raw.iloc[local]))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['is_ad'])
+
+
+def retrain(bundle_path, new_csvs, trees=30, replay=5000, new_weight=1.0, max_trees=None, seed=42, out=None):
+    bundle = joblib.load(bundle_path)
+    schema_id = bundle.get('feature_schema')
+    if schema_id not in TRAINERS:
+        raise ValueError(f"Bundle không có feature_schema hợp lệ ({schema_id}), hãy train đầy đủ 1 lần trước")
+    features = bundle_features(bundle)
+    lineage = bundle.get('lineage', [])
+
+    # 1. Chỉ lấy các dòng chưa từng dùng
+    frames = []
+    for path in new_csvs:
+        raw = read_table(path)
+        start = consumed_rows(lineage, os.path.basename(path))
+        if len(raw) < start:
+            print(f"⚠️ {path} ngắn hơn lần trước ({len(raw)} < {start} dòng), coi như toàn bộ là dòng mới")
+            start = 0
+        print(f"-> {path}: {len(raw) - start} dòng mới (bỏ qua {start} dòng đã học)")
+        if len(raw) > start:
+            frames.append(crawl_frame(schema_id, raw.iloc[start:]))
+    if not frames:
+        print("-> Không có dòng mới, giữ nguyên model.")
+        return None
+    new_df = pd.concat(frames, ignore_index=True).drop_duplicates()
+    X_new = new_df.reindex(columns=features, fill_value=0)
+    y_new = new_df['is_ad'].to_numpy()
+
+    # 2. Replay: mẫu ngẫu nhiên trong các dòng đã học (CSV đọc qua corpus colstore, không parse lại)
+    old_df = replay_frame(schema_id, lineage, replay, seed)
+    X_old = old_df.reindex(columns=features, fill_value=0)
+    y_old = old_df['is_ad'].to_numpy()
+
+    X = pd.concat([X_old, X_new], ignore_index=True)
+    y = np.concatenate([y_old, y_new])
+    if len(np.unique(y)) < 2:
+        raise ValueError("Dữ liệu học thêm chỉ có 1 lớp, hãy tăng --replay")
+    # new_weight nhân thêm cho dòng mới (thay cho nhân bản dòng)
+    sample_weight = np.concatenate([np.ones(len(X_old)), np.full(len(X_new), new_weight)])
+    clf = bundle['model']
+    # Cây mới phải học cùng mục tiêu với cây cũ: trainer_v8 cân bằng lớp bằng sample_weight (balance_weights),
+    # trainer có class_weight='balanced' thì sklearn tự cân bằng lại lúc fit
+    if clf.get_params().get('class_weight') is None:
+        sample_weight *= balance_weights(y)
+
+    # 3. warm_start: giữ các cây đã có, chỉ fit thêm `trees` cây
+    t0 = time.perf_counter()
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + trees)
+    clf.fit(X, y, sample_weight=sample_weight)
+    clf.set_params(warm_start=False)
+    fit_seconds = time.perf_counter() - t0
+
+    # Cửa sổ trượt: bỏ các cây cũ nhất khi vượt max_trees để model không phình mãi
+    if max_trees and len(clf.estimators_) > max_trees:
+        clf.estimators_ = clf.estimators_[-max_trees:]
+        clf.set_params(n_estimators=max_trees)
+
+    bundle['lineage'] = lineage + [lineage_entry("warm_start", new_csvs, trees, new_rows=len(X_new),
+                                                 replay_rows=len(X_old), new_weight=new_weight,
+                                                 total_trees=len(clf.estimators_),
+                                                 fit_seconds=round(fit_seconds, 2))]
+
+    # Ghi ra file tạm rồi đổi tên: server đang đọc file cũ không bao giờ thấy file ghi dở
+    out = out or bundle_path
+    joblib.dump(bundle, out + ".tmp")
+    os.replace(out + ".tmp", out)
+    print(f"✅ +{trees} cây trong {fit_seconds:.2f}s ({len(X_new)} dòng mới + {len(X_old)} dòng replay), "
+          f"tổng {len(clf.estimators_)} cây -> {out}")
+    return bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Học thêm cây mới từ dòng crawl mới (warm_start), ghi lineage")
+    # Bắt buộc: bundle phải do trainer đã ghi feature_schema + lineage tạo ra (model_hybrid_2026_v11.joblib có sẵn
+    # trong repo là bản cũ, không có) -> chạy lại trainer_v8.py / latest_trainer.py / new_trainer.py trước
+    parser.add_argument("--bundle", required=True, help="Bundle joblib do trainer_v8/latest_trainer/new_trainer ghi")
+    parser.add_argument("--new", nargs="+", default=["bet_ads_raw_3.csv"], help="CSV crawl có dòng mới nối thêm")
+    parser.add_argument("--trees", type=int, default=30, help="Số cây thêm vào")
+    parser.add_argument("--replay", type=int, default=5000, help="Số dòng dữ liệu cũ trộn vào để chống quên")
+    parser.add_argument("--new-weight", type=float, default=1.0, help="sample_weight cho dòng mới")
+    parser.add_argument("--max-trees", type=int, help="Giữ tối đa N cây mới nhất")
+    parser.add_argument("--out", help="Mặc định ghi đè --bundle")
+    args = parser.parse_args()
+    retrain(args.bundle, args.new, args.trees, args.replay, args.new_weight, args.max_trees, out=args.out)
+
+
+if __name__ == "__main__":
+    main()
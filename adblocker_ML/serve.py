@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import uvicorn
+from flat_forest import refresh_flat_dir
+
+# ==============================================================================
+# CHẠY SERVER VỚI NHIỀU WORKER MÀ MODEL KHÔNG NHÂN N LẦN RAM
+# Tiến trình cha biên dịch bundle joblib thành thư mục .flat/ (1 lần), các worker nạp bằng mmap chỉ đọc:
+# mọi worker dùng chung 1 bản trong page cache của OS thay vì mỗi worker unpickle 1 forest riêng.
+# ==============================================================================
+
+
+def prepare_shared_model(joblib_path):
+    # Hot reload sau này cũng đi qua refresh_flat_dir (flat_forest.load_bundle) nên vẫn dùng chung mmap
+    flat_dir = refresh_flat_dir(joblib_path)
+    print(f"-> Model dùng chung (mmap): {flat_dir}")
+    return flat_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy server FastAPI với N worker dùng chung model mmap")
+    parser.add_argument("app", help="vd. server:app hoặc server_29022026:app")
+    parser.add_argument("--model", help="Bundle joblib mà app nạp (biên dịch sẵn sang .flat/ trước khi fork)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.model:
+        if os.path.exists(args.model):
+            prepare_shared_model(args.model)
+        else:
+            print(f"⚠️ Không thấy {args.model}, mỗi worker sẽ tự nạp model")
+
+    # Số luồng suy luận mỗi worker = số core / số worker (model_registry.INFER_THREADS), không phải N x số core
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    # Worker import app từ thư mục hiện tại; module dùng chung (flat_forest, features...) nằm cạnh file này
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")]))
+    print(f"-> {args.app} với {args.workers} worker tại {args.host}:{args.port}")
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=args.workers, app_dir=os.getcwd())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,48 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import joblib
-import pandas as pd
+from typing import List
 import uvicorn
-import math
-from collections import Counter
-from urllib.parse import urlparse
-import tldextract
+from features import SCHEMA_SERVE, extract_url_features
+from verdict_cache import VerdictCache, normalize_url, normalize_host
+from model_registry import ModelRegistry
+from batcher import MicroBatcher
+from metrics import (CACHE_HITS, CONTENT_TYPE, ERRORS, HEURISTIC_HITS, REGISTRY, REQUEST_SECONDS, REQUESTS,
+                     VERDICTS, stage)
+from matcher import KeywordMatcher, load_list
+from domains import same_site, memo_stats
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
-# Load model Random Forest đã train
+verdict_cache = VerdictCache()
+
+# Load model Random Forest đã train (ưu tiên bản .npz đã biên dịch bằng flat_forest.py nếu có).
+# Model phải train đúng bộ đặc trưng của /check, nếu không thì từ chối thay vì điền 0 cho cột thiếu.
+# File model đổi (hoặc POST /admin/reload) -> nạp + chạy thử ở luồng nền rồi mới đổi, không cần restart.
+# Có model_final_2026.fast.joblib (python fast_tier.py model_final_2026.joblib --csv ...) -> chấm cascade:
+# model nhanh trước, chỉ xác suất gần ngưỡng 0.45 mới chạy forest đầy đủ (FAST_TIER=0 để tắt).
+SMOKE_URLS = ["https://rophim.la/assets/css/main.css", "https://cdn.hadronid.net/hadron.js?url=x&a=1"]
+registry = ModelRegistry("model_final_2026.joblib", SCHEMA_SERVE,
+                         smoke_rows=[extract_url_features(u) for u in SMOKE_URLS])
+# Khóa cache có version model nên kết quả của model cũ (kể cả request đang chạy dở) không bao giờ bị trả lại;
+# clear chỉ để giải phóng chỗ
+registry.on_swap(verdict_cache.clear)
 try:
-    data = joblib.load("model_final_2026.joblib")
-    model = data['model']
-    trained_features = data['feature_names']
+    registry.reload()
     print("-> AI Model Loaded.")
-except:
+except FileNotFoundError:
     print("-> Model file not found!")
+except ValueError as e:
+    print(f"-> Model bị từ chối: {e}")
+registry.start_watcher()
+
+# Không đặt ADMIN_TOKEN thì tắt hẳn /admin/reload (CORS mở cho mọi origin); watcher vẫn tự nạp khi file đổi
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Từ khóa cá cược ở lists/bet_keywords.txt, dò 1 lượt/URL dù danh sách dài bao nhiêu
+BET_KEYWORDS = KeywordMatcher(load_list("bet_keywords.txt"))
 
 
 class AdRequest(BaseModel):
@@ -30,52 +53,179 @@ class AdRequest(BaseModel):
     source_domain: str = ""
 
 
-def calculate_entropy(text):
-    if not text: return 0
-    counter = Counter(text)
-    length = len(text)
-    return -sum((count / length) * math.log2(count / length) for count in counter.values())
+def is_first_party(url_to_check, source_domain):
+    # eTLD+1 nhớ theo host: host nguồn giống nhau cho cả trang nên gần như không tốn gì
+    return same_site(url_to_check, source_domain)
+
+
+# Mỗi /check chỉ 1 URL: gom các request đến gần nhau rồi chạy forest 1 lần (BATCH_DELAY_MS, BATCH_MAX)
+batcher = MicroBatcher()
+
+
+def cache_key(version, url_to_check, source_domain):
+    # Kết quả phụ thuộc cả trang nguồn (first-party), nên khóa gồm URL + host nguồn.
+    # url_to_check phải là URL đã normalize_url để khóa quyết định hoàn toàn kết quả.
+    # version: model đã chấm -> verdict của model cũ không trùng khóa với model mới
+    return version, url_to_check, normalize_host(source_domain)
+
+
+def model_version(active):
+    return active.version if active else None
 
 
 @app.post("/check")
 async def check(data: AdRequest):
+    REQUESTS.inc(endpoint="/check")
+    with REQUEST_SECONDS.time(endpoint="/check"):
+        try:
+            with stage("normalize"):
+                url_to_check = normalize_url(data.target_url if data.target_url else data.url)
+
+            # 0. URL đã gặp gần đây -> trả luôn, bỏ qua pandas/sklearn
+            # Ảnh chụp model 1 lần: khóa cache và kết quả cùng 1 version dù model đổi giữa chừng
+            active = registry.active
+            key = cache_key(model_version(active), url_to_check, data.source_domain)
+            cached = verdict_cache.get(key)
+            if cached is not None:
+                CACHE_HITS.inc(endpoint="/check")
+                return cached
+
+            # 1. Heuristics cho cá cược (Bet)
+            with stage("heuristic"):
+                is_bet = BET_KEYWORDS.search(url_to_check.lower())
+            if is_bet:
+                HEURISTIC_HITS.inc(rule="bet_keyword")
+                VERDICTS.inc(endpoint="/check", verdict="ad")
+                verdict = {"is_ad": True, "confidence": "100%", "reason": "Bet Keyword"}
+                verdict_cache.put(key, verdict)
+                return verdict
+
+            # 2. Đặc trưng cho AI
+            with stage("features"):
+                feats = extract_url_features(url_to_check)
+
+            # 3. Dự đoán: gom chung batch với các request khác, forest chạy trong thread pool
+            with stage("inference"):
+                prob = await batcher.submit(feats, active)
+
+            # 4. Kiểm tra nguồn gốc (First-party vs Third-party)
+            with stage("first_party"):
+                first_party = is_first_party(url_to_check, key[2])
+
+            # Chặn nếu AI nghi ngờ > 45% cho bên thứ 3
+            verdict = {
+                "is_ad": bool(prob > 0.45 and not first_party),
+                "confidence": f"{prob:.2%}"
+            }
+            VERDICTS.inc(endpoint="/check", verdict="ad" if verdict["is_ad"] else "clean")
+            verdict_cache.put(key, verdict)
+            return verdict
+        except Exception as e:
+            ERRORS.inc(endpoint="/check")
+            return {"is_ad": False, "error": str(e)}
+
+
+@app.post("/check_batch")
+async def check_batch(items: List[AdRequest]):
+    REQUESTS.inc(endpoint="/check_batch")
+    with REQUEST_SECONDS.time(endpoint="/check_batch"):
+        return await score_batch(items)
+
+
+async def score_batch(items):
+    # Cả trang gửi 1 lần: trích đặc trưng cho tất cả URL vào 1 ma trận rồi gọi predict_proba đúng 1 lần
+    results = [None] * len(items)
+    pending = []  # (vị trí trong batch, url cần kiểm tra, khóa cache)
+    rows = []
+    # Cả batch chấm bằng đúng 1 model (ảnh chụp lúc bắt đầu), khóa cache theo version của model đó
+    active = registry.active
+    version = model_version(active)
+
+    for i, data in enumerate(items):
+        try:
+            url_to_check = normalize_url(data.target_url if data.target_url else data.url)
+            key = cache_key(version, url_to_check, data.source_domain)
+            cached = verdict_cache.get(key)
+            if cached is not None:
+                CACHE_HITS.inc(endpoint="/check_batch")
+                results[i] = cached
+                continue
+            if BET_KEYWORDS.search(url_to_check.lower()):
+                HEURISTIC_HITS.inc(rule="bet_keyword")
+                VERDICTS.inc(endpoint="/check_batch", verdict="ad")
+                results[i] = {"is_ad": True, "confidence": "100%", "reason": "Bet Keyword"}
+                verdict_cache.put(key, results[i])
+                continue
+            with stage("features"):
+                rows.append(extract_url_features(url_to_check))
+            pending.append((i, url_to_check, key))
+        except Exception as e:
+            ERRORS.inc(endpoint="/check_batch")
+            results[i] = {"is_ad": False, "error": str(e)}
+
+    if not pending:
+        return results
+
     try:
-        url_to_check = data.target_url if data.target_url else data.url
-        parsed = urlparse(url_to_check)
-
-        # 1. Heuristics cho cá cược (Bet)
-        target_lower = url_to_check.lower()
-        bet_keywords = ['bet', 'casino', 'nha-cai', 'shbet', '789bet', 'viva88', 'khuyen-mai']
-        if any(kw in target_lower for kw in bet_keywords):
-            return {"is_ad": True, "confidence": "100%", "reason": "Bet Keyword"}
-
-        # 2. Đặc trưng cho AI
-        feats = {
-            "path_depth": int(parsed.path.count('/')),
-            "url_length": int(len(url_to_check)),
-            "num_digits": int(sum(c.isdigit() for c in url_to_check)),
-            "entropy": float(calculate_entropy(url_to_check)),
-            "num_params": int(len(parsed.query.split('&')) if parsed.query else 0),
-        }
-
-        # 3. Dự đoán (Fix lỗi NumPy)
-        df = pd.DataFrame([feats]).reindex(columns=trained_features, fill_value=0)
-        prob = float(model.predict_proba(df)[0][1])
-        is_ad_ai = bool(model.predict(df)[0])
-
-        # 4. Kiểm tra nguồn gốc (First-party vs Third-party)
-        res_domain = tldextract.extract(url_to_check).domain
-        src_domain = tldextract.extract(data.source_domain).domain
-        is_first_party = bool(res_domain == src_domain)
-
-        # Chặn nếu AI nghi ngờ > 45% cho bên thứ 3
-        return {
-            "is_ad": bool(prob > 0.45 and not is_first_party),
-            "confidence": f"{prob:.2%}"
-        }
+        if active is None:
+            raise RuntimeError("Model chưa được nạp")
+        with stage("inference"):
+            probs = await active.score_async(rows)
     except Exception as e:
-        return {"is_ad": False, "error": str(e)}
+        ERRORS.inc(len(pending), endpoint="/check_batch")
+        for i, _, _ in pending:
+            results[i] = {"is_ad": False, "error": str(e)}
+        return results
+
+    for (i, url_to_check, key), prob in zip(pending, probs):
+        try:
+            with stage("first_party"):
+                first_party = is_first_party(url_to_check, key[2])
+            results[i] = {
+                "is_ad": bool(prob > 0.45 and not first_party),
+                "confidence": f"{float(prob):.2%}"
+            }
+            VERDICTS.inc(endpoint="/check_batch", verdict="ad" if results[i]["is_ad"] else "clean")
+            verdict_cache.put(key, results[i])
+        except Exception as e:
+            ERRORS.inc(endpoint="/check_batch")
+            results[i] = {"is_ad": False, "error": str(e)}
+    return results
+
+
+@app.get("/model")
+async def model_info():
+    return registry.info()
+
+
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: str = Header(default="")):
+    # Hàm thường (không async): FastAPI chạy trong threadpool nên vẫn phục vụ request khác trong lúc nạp
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="/admin/reload bị tắt: đặt ADMIN_TOKEN để bật")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Sai admin token")
+    try:
+        return registry.reload()
+    except Exception:
+        raise HTTPException(status_code=409, detail=registry.info())
+
+
+# Gauge đọc lúc Prometheus scrape
+REGISTRY.gauge("adblock_verdict_cache_size", "Số mục trong verdict cache", lambda: verdict_cache.stats()["size"])
+REGISTRY.gauge("adblock_model_reloads", "Số lần nạp model thành công", lambda: registry.reloads)
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/stats")
+async def stats():
+    return {"cache": verdict_cache.stats(), "domains": memo_stats(), "batching": batcher.stats()}
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Nhiều worker: python serve.py server:app --model model_final_2026.joblib --workers 4
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,62 +1,57 @@
 import pandas as pd
 import joblib
-import re
 import os
-from urllib.parse import urlparse
 from sklearn.ensemble import RandomForestClassifier
+from features import SCHEMA_V26
+from features_vec import v26_frame
+from corpus import read_table
+from rebalance import balance_weights
+from feature_store import cached_features, lineage_entry
 
+SOURCES = ["dataset_hybrid_2026.csv", "bet_ads_raw.csv", "bet_ads_raw_2.csv", "bet_ads_raw_3.csv"]
+CLEAN_SAMPLE = 2000
 
-def extract_features_v26(url, is_ad_label=0):
-    u = str(url).lower()
-    p = urlparse(u)
-    domain = p.netloc
 
-    # 1. NHẬN DIỆN "NGƯỜI LẠ TỐT" (Whitelist uy tín toàn cầu)
-    trusted_domains = ["wikimedia", "wikipedia", "cdnjs", "google", "gstatic", "facebook", "twitter"]
-    is_trusted = 1 if any(x in domain for x in trusted_domains) else 0
+def clean_rows(df_old, n=CLEAN_SAMPLE, seed=42):
+    # Vị trí các dòng sạch được lấy mẫu; ghi vào lineage (base_rows) để retrain.py replay đúng các dòng đã học
+    clean = df_old[df_old['is_ad'] == 0]
+    return clean.sample(n=min(n, len(df_old)), random_state=seed).index.to_numpy()
 
-    # 2. TỪ KHÓA NHẠY CẢM (Mở rộng để bắt tracker)
-    keywords = r'ad|banner|bet|click|track|luxe|fun|analytics|collect|promo|789club|tx88'
-    has_keyword = 1 if re.search(keywords, u) else 0
 
-    # 3. ĐẶC TRƯNG NỘI BỘ
-    is_internal = 1 if "rophim.la" in domain or not domain else 0
-
-    return {
-        "is_internal": is_internal,
-        "is_trusted": is_trusted,
-        "has_keyword": has_keyword,
-        "url_len": len(u),
-        "num_params": len(p.query.split('&')) if p.query else 0,
-        "is_ad": is_ad_label
-    }
-
-
-def main():
-    rows = []
+def build_frame():
+    frames = []
     # Nạp 2000 mẫu sạch (Tăng độ rộng để AI không bị "cận thị")
     if os.path.exists("dataset_hybrid_2026.csv"):
-        df_old = pd.read_csv("dataset_hybrid_2026.csv")
-        clean = df_old[df_old['is_ad'] == 0].sample(n=min(2000, len(df_old)), random_state=42)
-        for url in clean['url']:
-            rows.append(extract_features_v26(url, 0))
+        df_old = read_table("dataset_hybrid_2026.csv")
+        clean = df_old.iloc[clean_rows(df_old)]
+        frames.append(v26_frame(clean['url'], 0))
 
-    # Nạp tập Ads và nhân bản (Oversampling)
+    # Nạp tập Ads (không nhân bản: bản sao sẽ bị drop_duplicates bỏ đi; cân bằng bằng sample_weight lúc fit)
     for f in ["bet_ads_raw.csv", "bet_ads_raw_2.csv", "bet_ads_raw_3.csv"]:
         if os.path.exists(f):
-            df_raw = pd.read_csv(f)
-            for _, r in df_raw.iterrows():
-                feat = extract_features_v26(r['target_url'], 1)
-                rows.extend([feat] * 50)  # Nhân bản mạnh để cân bằng với 2000 mẫu sạch
+            df_raw = read_table(f)
+            frames.append(v26_frame(df_raw['target_url'], 1))
 
-    df = pd.DataFrame(rows).drop_duplicates()
-    X = df.drop(columns=['is_ad'])
-    y = df['is_ad']
+    return pd.concat(frames, ignore_index=True).drop_duplicates()
 
-    clf = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
-    clf.fit(X, y)
 
-    joblib.dump({"model": clf, "features": X.columns.tolist()}, 'model_hybrid_2026_v11.joblib')
+def load_training_data():
+    # Cùng CSV + cùng schema -> nạp lại X/y từ cache (mmap), không đọc CSV
+    return cached_features("v26", SOURCES, SCHEMA_V26, build_frame)
+
+
+def main():
+    X, y = load_training_data()
+
+    clf = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
+    # Ít mẫu Ads so với 2000 mẫu sạch -> trọng số theo lớp thay cho nhân bản dòng
+    clf.fit(X, y, sample_weight=balance_weights(y))
+
+    # lineage: CSV nào, bao nhiêu dòng đã dùng -> retrain.py chỉ học thêm phần dòng mới
+    base_rows = clean_rows(read_table(SOURCES[0])).tolist() if os.path.exists(SOURCES[0]) else []
+    lineage = [lineage_entry("full", SOURCES, clf.n_estimators, base_rows=base_rows)]
+    joblib.dump({"model": clf, "features": X.columns.tolist(), "feature_schema": SCHEMA_V26, "lineage": lineage},
+                'model_hybrid_2026_v11.joblib')
     print("🚀 Đã hoàn thiện Model V26: Cân bằng giữa Độ chính xác và Khả năng tổng quát!")
 
 
@@ -0,0 +1,79 @@
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlsplit, urlunsplit
+
+# Cấu hình qua biến môi trường để chỉnh khi chạy uvicorn mà không phải sửa code
+DEFAULT_MAX_SIZE = int(os.environ.get("VERDICT_CACHE_SIZE", 50000))
+DEFAULT_TTL = float(os.environ.get("VERDICT_CACHE_TTL", 600))
+
+
+def normalize_url(url):
+    # Scheme/host không phân biệt hoa thường (trình duyệt cũng tự hạ về chữ thường).
+    # Giữ nguyên path/query/fragment vì chúng nằm trong đặc trưng url_length/entropy.
+    url = str(url).strip()
+    try:
+        p = urlsplit(url)
+    except ValueError:
+        return url
+    return urlunsplit((p.scheme.lower(), p.netloc.lower(), p.path, p.query, p.fragment))
+
+
+def normalize_host(source):
+    # source_domain có thể là URL đầy đủ ("https://dantri.com.vn/") hoặc chỉ hostname
+    source = str(source).strip().lower()
+    if "//" in source:
+        try:
+            return urlsplit(source).hostname or source
+        except ValueError:
+            return source
+    return source.split("/", 1)[0]
+
+
+class VerdictCache:
+    """Cache LRU có TTL cho kết quả phân loại, dùng chung giữa các endpoint."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (thời điểm hết hạn, verdict)
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, verdict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, verdict)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }